@@ -1,27 +1,11 @@
 from flask import Flask, request, jsonify, session
-try:
-    import pandas as pd
-    PANDAS_AVAILABLE = True
-except ImportError:
-    PANDAS_AVAILABLE = False
-    pd = None
-try:
-    import numpy as np
-    NUMPY_AVAILABLE = True
-except ImportError:
-    NUMPY_AVAILABLE = False
-    np = None
-try:
-    import joblib
-    JOBLIB_AVAILABLE = True
-except ImportError:
-    JOBLIB_AVAILABLE = False
-    joblib = None
-import requests
 import json
+import hashlib
 import sqlite3
 from datetime import datetime, timedelta
 import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
 
 # Try to import optional dependencies
 try:
@@ -37,20 +21,30 @@ try:
 except ImportError:
     SQLALCHEMY_AVAILABLE = False
 
-try:
-    from sklearn.ensemble import RandomForestRegressor
-    from sklearn.model_selection import train_test_split
-    SKLEARN_AVAILABLE = True
-except ImportError:
-    SKLEARN_AVAILABLE = False
-
 # Import our custom modules
+from http_client import http_client
 from notifications import notification_service
-from offline_cache import offline_cache
+from offline_cache import normalize_region, offline_cache
+from offline_maintenance import offline_maintenance
+from sync_worker import sync_worker
+from model_registry import MODEL_PATH, model_registry, model_family
+from prediction_cache import prediction_cache
+from weather_cache import weather_cache
+from weather_prefetch import weather_prefetcher
+from training import training_job
+from inference import (
+    FEATURE_FIELDS, REQUIRED_FIELDS, extract_features, generate_recommendations, calculate_risk_level,
+    build_feature_block, generate_recommendations_batch, calculate_risk_levels, invalid_text_fields
+)
 
 app = Flask(__name__)
 app.config['SECRET_KEY'] = 'your-secret-key-change-in-production'
 
+# Offline cache and notification service are created on first use from this config
+app.config['OFFLINE_CACHE_PATH'] = os.environ.get('OFFLINE_CACHE_PATH', 'offline_cache.db')
+offline_cache.init_app(app)
+notification_service.init_app(app)
+
 # Initialize optional components
 if CORS_AVAILABLE:
     CORS(app)
@@ -65,10 +59,28 @@ else:
 # OpenWeather API configuration
 OPENWEATHER_API_KEY = os.environ.get('OPENWEATHER_API_KEY', "your-openweather-api-key")  # Replace with actual key
 OPENWEATHER_BASE_URL = "http://api.openweathermap.org/data/2.5/weather"
+OPENWEATHER_GROUP_URL = "http://api.openweathermap.org/data/2.5/group"
+
+# Regions with a known OpenWeather city ID (or given as one) are fetched up to 20 per group call
+OPENWEATHER_CITY_IDS = {
+    normalize_region(region): int(city_id)
+    for region, city_id in json.loads(os.environ.get('OPENWEATHER_CITY_IDS', '{}')).items()
+}
+OPENWEATHER_GROUP_SIZE = 20
+
+# Cap on concurrent OpenWeather calls from this process, across requests and the prefetcher
+OPENWEATHER_MAX_CONCURRENCY = int(os.environ.get('OPENWEATHER_MAX_CONCURRENCY', 8))
+openweather_slots = threading.BoundedSemaphore(OPENWEATHER_MAX_CONCURRENCY)
+weather_lookup_pool = ThreadPoolExecutor(max_workers=OPENWEATHER_MAX_CONCURRENCY, thread_name_prefix='weather-lookup')
+
+# Upper bound on regions accepted by GET /api/weather in one request
+MAX_WEATHER_REGIONS = int(os.environ.get('MAX_WEATHER_REGIONS', 100))
 
-# Weather cache to reduce API calls and provide stability
-weather_cache = {}
-WEATHER_CACHE_DURATION = 3600  # 1 hour cache duration
+# Upper bound on rows accepted by /api/predict/batch in one request
+MAX_BATCH_SIZE = int(os.environ.get('MAX_BATCH_SIZE', 5000))
+
+# Offline predictions read, inserted and marked synced per step of /api/offline/sync
+OFFLINE_SYNC_PAGE_SIZE = int(os.environ.get('OFFLINE_SYNC_PAGE_SIZE', 500))
 
 # Database Models (only if SQLAlchemy is available)
 if SQLALCHEMY_AVAILABLE and db:
@@ -101,6 +113,12 @@ if SQLALCHEMY_AVAILABLE and db:
         recommendations = db.Column(db.Text)
         created_at = db.Column(db.DateTime, default=datetime.utcnow)
 
+    class SyncedPrediction(db.Model):
+        """Idempotency keys of offline predictions already copied into FarmData; each key embeds its user"""
+        idempotency_key = db.Column(db.String(64), primary_key=True)
+        user_id = db.Column(db.Integer, nullable=False)
+        synced_at = db.Column(db.DateTime, default=datetime.utcnow)
+
     # Initialize database
     with app.app_context():
         db.create_all()
@@ -110,125 +128,53 @@ else:
         pass
     class FarmData:
         pass
-
-# Train Random Forest Model
-def train_model():
-    print("Training model...")
-    
-    if not (SKLEARN_AVAILABLE and PANDAS_AVAILABLE and NUMPY_AVAILABLE and JOBLIB_AVAILABLE):
-        print("ML stack not fully available, using simple linear model")
-        return create_simple_model()
-    
-    # Enhanced dataset with more features
-    data = {
-        'rainfall': [200, 250, 180, 300, 150, 400, 220, 270, 190, 280, 160, 350],
-        'temperature': [28, 30, 32, 29, 35, 26, 31, 33, 27, 29, 34, 28],
-        'soil_ph': [6.5, 7.0, 6.8, 7.2, 6.0, 7.5, 6.7, 7.1, 6.3, 6.9, 6.1, 7.3],
-        'nitrogen': [80, 90, 70, 100, 60, 110, 85, 95, 75, 88, 65, 105],
-        'phosphorus': [40, 45, 35, 50, 30, 55, 42, 48, 38, 44, 32, 52],
-        'potassium': [60, 70, 55, 80, 50, 85, 65, 75, 58, 68, 52, 82],
-        'sowing_offset': [0, 5, -3, 2, 10, -5, 3, 1, -2, 4, 8, -1],
-        'yield': [2.5, 3.0, 2.2, 3.5, 1.8, 4.0, 2.8, 3.2, 2.4, 3.1, 1.9, 3.7]
-    }
-    
-    df = pd.DataFrame(data)
-    X = df[['rainfall', 'temperature', 'soil_ph', 'nitrogen', 'phosphorus', 'potassium', 'sowing_offset']]
-    y = df['yield']
-    
-    X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=0.2, random_state=42)
-    
-    model = RandomForestRegressor(n_estimators=100, random_state=42)
-    model.fit(X_train, y_train)
-    
-    # Save model and metadata
-    joblib.dump(model, 'crop_yield_model.pkl')
-    
-    model_meta = {
-        'features': ['rainfall', 'temperature', 'soil_ph', 'nitrogen', 'phosphorus', 'potassium', 'sowing_offset'],
-        'model_type': 'RandomForestRegressor',
-        'trained_at': datetime.now().isoformat(),
-        'accuracy': model.score(X_test, y_test)
-    }
-    
-    with open('model_meta.json', 'w') as f:
-        json.dump(model_meta, f)
-    
-    print(f"Model trained successfully! Accuracy: {model_meta['accuracy']:.3f}")
-    return model
-
-def create_simple_model():
-    """Create a simple prediction model when sklearn is not available"""
-    print("Creating simple prediction model...")
-    
-    # Simple coefficients for linear prediction
-    model_data = {
-        'type': 'simple_linear',
-        'coefficients': {
-            'rainfall': 0.01,
-            'temperature': 0.05,
-            'soil_ph': 0.3,
-            'nitrogen': 0.02,
-            'phosphorus': 0.03,
-            'potassium': 0.015,
-            'sowing_offset': -0.05
-        },
-        'intercept': 1.0
-    }
-    
-    with open('simple_model.json', 'w') as f:
-        json.dump(model_data, f)
-    
-    print("Simple model created successfully!")
-    return model_data
-
-def simple_predict(features, model_data):
-    """Make prediction using simple linear model"""
-    prediction = model_data['intercept']
-    feature_names = ['rainfall', 'temperature', 'soil_ph', 'nitrogen', 'phosphorus', 'potassium', 'sowing_offset']
-    
-    for i, feature_name in enumerate(feature_names):
-        prediction += features[i] * model_data['coefficients'][feature_name]
-    
-    return max(0.5, prediction)  # Ensure minimum yield
-
-# Initialize model
-if not os.path.exists('crop_yield_model.pkl'):
-    train_model()
+    class SyncedPrediction:
+        pass
 
 def get_weather_data(region):
     """Fetch weather data with caching and improved fallback"""
-    import time
-    
-    # Check cache first
-    current_time = time.time()
-    cache_key = region.lower()
-    
-    if cache_key in weather_cache:
-        cached_data, cache_time = weather_cache[cache_key]
-        if current_time - cache_time < WEATHER_CACHE_DURATION:
-            print(f"Using cached weather data for {region}")
-            return cached_data
-    
-    # Try to fetch from API
     try:
-        if OPENWEATHER_API_KEY and OPENWEATHER_API_KEY != "your-openweather-api-key":
-            url = f"{OPENWEATHER_BASE_URL}?q={region}&appid={OPENWEATHER_API_KEY}&units=metric"
-            response = requests.get(url, timeout=10)
+        return weather_cache.get_or_fetch(region, lambda: fetch_weather_data(region))
+    except Exception as e:
+        print(f"Weather cache error: {e}")
+        return get_regional_fallback_weather(region)
+
+def weather_api_key():
+    """API key set through /api/weather/config by any worker, else OPENWEATHER_API_KEY"""
+    return weather_cache.get_setting('openweather_api_key') or OPENWEATHER_API_KEY
+
+def openweather_city_id(region):
+    """OpenWeather city ID for a region: the region itself if numeric, else from OPENWEATHER_CITY_IDS"""
+    key = normalize_region(region)
+    if key.isdigit():
+        return int(key)
+    return OPENWEATHER_CITY_IDS.get(key)
+
+def parse_openweather(data, region):
+    """Weather dict served by the API from one OpenWeather current-weather record"""
+    return {
+        'temperature': round(data['main']['temp'], 1),
+        'humidity': data['main']['humidity'],
+        'rainfall': data.get('rain', {}).get('1h', 0) * 24,  # Convert to daily
+        'weather_desc': data['weather'][0]['description'],
+        'source': 'api',
+        'region': region,
+        'timestamp': datetime.now().isoformat()
+    }
+
+def fetch_weather_data(region):
+    """Call OpenWeather for a region, falling back to regional estimates"""
+    try:
+        api_key = weather_api_key()
+        if api_key and api_key != "your-openweather-api-key":
+            city_id = openweather_city_id(region)
+            params = {'id': city_id} if city_id else {'q': region}
+            params.update({'appid': api_key, 'units': 'metric'})
+            with openweather_slots:
+                response = http_client.get(OPENWEATHER_BASE_URL, params=params)
             
             if response.status_code == 200:
-                data = response.json()
-                weather_data = {
-                    'temperature': round(data['main']['temp'], 1),
-                    'humidity': data['main']['humidity'],
-                    'rainfall': data.get('rain', {}).get('1h', 0) * 24,  # Convert to daily
-                    'weather_desc': data['weather'][0]['description'],
-                    'source': 'api',
-                    'region': region,
-                    'timestamp': datetime.now().isoformat()
-                }
-                
-                # Cache the data
-                weather_cache[cache_key] = (weather_data, current_time)
+                weather_data = parse_openweather(response.json(), region)
                 print(f"Fetched fresh weather data for {region}")
                 return weather_data
             else:
@@ -236,13 +182,87 @@ def get_weather_data(region):
     except Exception as e:
         print(f"Weather API exception: {e}")
     
-    # Enhanced fallback with regional variations
-    fallback_data = get_regional_fallback_weather(region)
+    # Enhanced fallback with regional variations; cached for a shorter time than API data
+    return get_regional_fallback_weather(region)
+
+def fetch_weather_group(city_regions):
+    """Fetch {city_id: region} through OpenWeather's group endpoint; returns {region: weather} for the IDs found"""
+    results = {}
+    api_key = weather_api_key()
+    if not api_key or api_key == "your-openweather-api-key":
+        return results
     
-    # Cache fallback data for shorter duration
-    weather_cache[cache_key] = (fallback_data, current_time - WEATHER_CACHE_DURATION + 300)  # 5 min cache for fallback
+    city_ids = list(city_regions)
+    for start in range(0, len(city_ids), OPENWEATHER_GROUP_SIZE):
+        chunk = city_ids[start:start + OPENWEATHER_GROUP_SIZE]
+        try:
+            params = {'id': ','.join(str(city_id) for city_id in chunk), 'appid': api_key, 'units': 'metric'}
+            with openweather_slots:
+                response = http_client.get(OPENWEATHER_GROUP_URL, params=params)
+            if response.status_code != 200:
+                print(f"Weather group API error: {response.status_code}")
+                continue
+            for record in response.json().get('list', []):
+                region = city_regions.get(record.get('id'))
+                if region is not None:
+                    results[region] = parse_openweather(record, region)
+        except Exception as e:
+            print(f"Weather group API exception: {e}")
+    return results
+
+def get_weather_many(regions):
+    """Weather for many regions: both cache tiers first, then one group call per 20 city IDs and concurrent single fetches"""
+    results = {}
+    misses = {}
+    for region in regions:
+        key = normalize_region(region)
+        if key in misses or region in results:
+            continue
+        cached = weather_cache.lookup(region, lambda region=region: fetch_weather_data(region))
+        if cached is not None:
+            results[region] = cached
+        else:
+            misses[key] = region
+    hits = len(results)
+    
+    city_regions = {}
+    for region in misses.values():
+        city_id = openweather_city_id(region)
+        if city_id:
+            city_regions.setdefault(city_id, region)
+    grouped = fetch_weather_group(city_regions) if city_regions else {}
+    
+    def fetch_miss(region):
+        # Through the cache so concurrent single lookups of the region share this fetch
+        fetch = (lambda: grouped[region]) if region in grouped else (lambda: fetch_weather_data(region))
+        try:
+            return weather_cache.fetch_miss(region, fetch)
+        except Exception as e:
+            print(f"Weather cache error: {e}")
+            return get_regional_fallback_weather(region)
+    
+    pending = list(misses.values())
+    for region, weather in zip(pending, weather_lookup_pool.map(fetch_miss, pending)):
+        results[region] = weather
     
-    return fallback_data
+    # Repeated spellings of a region share its entry
+    for region in regions:
+        if region not in results:
+            results[region] = results[misses[normalize_region(region)]]
+    
+    return results, {'cache_hits': hits, 'fetched': len(pending), 'grouped': len(grouped)}
+
+def active_user_regions():
+    """Distinct regions of registered users; the weather prefetcher keeps these cached"""
+    if not SQLALCHEMY_AVAILABLE or not db:
+        return []
+    with app.app_context():
+        rows = db.session.query(User.region).filter(User.region.isnot(None)).distinct().all()
+        return [region for (region,) in rows]
+
+# The prefetcher refreshes active regions in the background; started with the server below
+weather_prefetcher.configure(fetch=fetch_weather_data, regions=active_user_regions)
+weather_prefetcher.init_app(app)
 
 def get_regional_fallback_weather(region):
     """Provide realistic fallback weather data based on region"""
@@ -290,38 +310,6 @@ def get_regional_fallback_weather(region):
         'timestamp': datetime.now().isoformat()
     }
 
-def calculate_risk_level(yield_prediction, recommendations):
-    """Calculate risk level based on yield and recommendations"""
-    if yield_prediction < 2.0 or len(recommendations) >= 3:
-        return 'Red'
-    elif yield_prediction < 2.8 or len(recommendations) >= 2:
-        return 'Yellow'
-    else:
-        return 'Green'
-
-def generate_recommendations(data, prediction):
-    """Generate actionable recommendations"""
-    recs = []
-    
-    if data['temperature'] > 32:
-        recs.append("High temperature detected. Increase irrigation frequency and consider shade nets.")
-    if data['rainfall'] < 180:
-        recs.append("Low rainfall. Implement drip irrigation or supplemental watering.")
-    if data['soil_ph'] < 6.0:
-        recs.append("Soil is acidic. Apply lime to increase pH for better nutrient uptake.")
-    if data['soil_ph'] > 7.5:
-        recs.append("Soil is alkaline. Apply sulfur or organic matter to reduce pH.")
-    if data['nitrogen'] < 70:
-        recs.append("Nitrogen deficiency. Apply nitrogen-rich fertilizers or compost.")
-    if data['phosphorus'] < 35:
-        recs.append("Low phosphorus levels. Apply phosphate fertilizers before flowering.")
-    if data['potassium'] < 55:
-        recs.append("Potassium deficiency. Apply potash fertilizers for better fruit quality.")
-    if prediction < 2.5:
-        recs.append("Low yield predicted. Consider crop rotation or soil testing.")
-    
-    return recs
-
 # API Routes
 @app.route('/')
 def home():
@@ -332,7 +320,8 @@ def home():
             "/api/register": "POST - User registration",
             "/api/login": "POST - User login",
             "/api/predict": "POST - Predict crop yield",
-            "/api/weather": "GET - Get weather data",
+            "/api/predict/batch": "POST - Predict crop yield for many plots (JSON array or NDJSON)",
+            "/api/weather": "GET - Get weather data (?regions=a,b for many regions)",
             "/api/dashboard": "GET - Dashboard data",
             "/api/reports": "GET - Historical reports"
         }
@@ -415,6 +404,24 @@ def login():
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+@app.route('/api/weather')
+def get_weather_bulk():
+    """Get weather data for many regions: ?regions=Punjab,Goa or repeated regions= parameters"""
+    try:
+        regions = []
+        for value in request.args.getlist('regions'):
+            regions.extend(region.strip() for region in value.split(',') if region.strip())
+        if not regions:
+            return jsonify({'error': 'regions is required'}), 400
+        if len(regions) > MAX_WEATHER_REGIONS:
+            return jsonify({'error': f'At most {MAX_WEATHER_REGIONS} regions per request'}), 400
+        
+        weather, counts = get_weather_many(regions)
+        return jsonify({'weather': weather, **counts, 'timestamp': datetime.now().isoformat()})
+        
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
 @app.route('/api/weather/<region>')
 def get_weather(region):
     """Get weather data for a region with caching"""
@@ -423,11 +430,18 @@ def get_weather(region):
 
 @app.route('/api/weather/cache/clear', methods=['POST'])
 def clear_weather_cache():
-    """Clear weather cache for fresh data"""
-    global weather_cache
+    """Clear weather cache for fresh data in every worker"""
     weather_cache.clear()
     return jsonify({'message': 'Weather cache cleared successfully'})
 
+@app.route('/api/weather/cache/stats')
+def get_weather_cache_stats():
+    """Hit/miss, coalescing and refresh counters of the weather cache"""
+    return jsonify({
+        'weather_cache': weather_cache.stats(),
+        'timestamp': datetime.now().isoformat()
+    })
+
 @app.route('/api/weather/config', methods=['POST'])
 def update_weather_config():
     """Update weather API configuration"""
@@ -438,7 +452,8 @@ def update_weather_config():
         if api_key:
             global OPENWEATHER_API_KEY
             OPENWEATHER_API_KEY = api_key
-            # Clear cache to force fresh API calls
+            # Share the key with the other workers and clear every cache tier to force fresh API calls
+            weather_cache.set_setting('openweather_api_key', api_key)
             weather_cache.clear()
             return jsonify({'message': 'Weather API key updated successfully'})
         else:
@@ -453,49 +468,32 @@ def predict_yield():
         data = request.get_json()
         
         # Validate required fields
-        required_fields = ['crop_type', 'region', 'rainfall', 'temperature', 'soil_ph', 
-                          'nitrogen', 'phosphorus', 'potassium', 'sowing_date_offset']
-        
-        missing_fields = [field for field in required_fields if field not in data]
+        missing_fields = [field for field in REQUIRED_FIELDS if field not in data]
         if missing_fields:
             return jsonify({
                 'error': f'Missing required fields: {missing_fields}',
-                'required': required_fields
+                'required': REQUIRED_FIELDS
             }), 400
+        invalid_fields = invalid_text_fields(data)
+        if invalid_fields:
+            return jsonify({'error': f'Fields must be strings: {invalid_fields}'}), 400
         
         # Prepare features for prediction
-        features = [
-            float(data['rainfall']),
-            float(data['temperature']),
-            float(data['soil_ph']),
-            float(data['nitrogen']),
-            float(data['phosphorus']),
-            float(data['potassium']),
-            int(data['sowing_date_offset'])
-        ]
-        
-        # Make prediction
-        print(f"DEBUG: Features count: {len(features)}")
-        print(f"DEBUG: Model file exists: {os.path.exists('crop_yield_model.pkl')}")
-        print(f"DEBUG: Simple model exists: {os.path.exists('simple_model.json')}")
-        print(f"DEBUG: SKLEARN_AVAILABLE: {SKLEARN_AVAILABLE}")
-        print(f"DEBUG: JOBLIB_AVAILABLE: {JOBLIB_AVAILABLE}")
-        
-        if os.path.exists('crop_yield_model.pkl') and SKLEARN_AVAILABLE and JOBLIB_AVAILABLE:
-            model = joblib.load('crop_yield_model.pkl')
-            print(f"DEBUG: Model type: {type(model)}")
-            print(f"DEBUG: Model n_features_in_: {getattr(model, 'n_features_in_', 'Not available')}")
-            prediction = model.predict([features])[0]
-        elif os.path.exists('simple_model.json'):
-            with open('simple_model.json', 'r') as f:
-                model_data = json.load(f)
-            prediction = simple_predict(features, model_data)
-        else:
-            # Fallback prediction
-            prediction = 2.0 + (features[0] * 0.005) + (features[1] * 0.02) + (features[2] * 0.2)
-        
-        # Generate recommendations
-        recommendations = generate_recommendations(data, prediction)
+        features = extract_features(data)
+        
+        # Repeated inputs skip inference; only the model output is cached, since the
+        # cache key is quantized and the rules below must see the exact request
+        # Per-crop/region shard, falling back to the global model
+        model = model_family.get_model(data['crop_type'], data['region'])
+        slot = model.path or model.kind
+        prediction = prediction_cache.get(features, model.version, slot)
+        if prediction is None:
+            # Make prediction with the resident model
+            prediction = model.predict_one(features)
+            prediction_cache.put(features, model.version, prediction, slot)
+        
+        # Generate recommendations from the parsed features, as the batch endpoint does
+        recommendations = generate_recommendations(dict(zip(FEATURE_FIELDS, features)), prediction)
         
         # Calculate risk level
         risk_level = calculate_risk_level(prediction, recommendations)
@@ -535,6 +533,107 @@ def predict_yield():
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+@app.route('/api/predict/batch', methods=['POST'])
+def predict_yield_batch():
+    """Predict crop yield for many plots with a single model call"""
+    try:
+        parse_errors = {}
+        if request.mimetype == 'application/x-ndjson':
+            rows = []
+            for line in request.get_data(as_text=True).splitlines():
+                if not line.strip():
+                    continue
+                try:
+                    rows.append(json.loads(line))
+                except json.JSONDecodeError as e:
+                    parse_errors[len(rows)] = f'Invalid JSON line: {e}'
+                    rows.append(None)
+        else:
+            data = request.get_json()
+            rows = data.get('rows') if isinstance(data, dict) else data
+        
+        if not isinstance(rows, list) or not rows:
+            return jsonify({'error': 'Expected a non-empty array of rows', 'required': REQUIRED_FIELDS}), 400
+        if len(rows) > MAX_BATCH_SIZE:
+            return jsonify({'error': f'Batch too large, maximum is {MAX_BATCH_SIZE} rows'}), 413
+        
+        matrix, valid_indices, errors = build_feature_block(rows)
+        errors.update(parse_errors)
+        
+        # One model call per shard, rules and risk scoring over whole columns
+        predictions, model_versions = model_family.predict_many(
+            matrix,
+            [rows[index]['crop_type'] for index in valid_indices],
+            [rows[index]['region'] for index in valid_indices]
+        )
+        recommendations = generate_recommendations_batch(matrix, predictions)
+        risk_levels = calculate_risk_levels(predictions, recommendations)
+        
+        results = [None] * len(rows)
+        for index, message in errors.items():
+            results[index] = {'index': index, 'error': message}
+        for position, index in enumerate(valid_indices):
+            results[index] = {
+                'index': index,
+                'predicted_yield': round(predictions[position], 2),
+                'risk_level': risk_levels[position],
+                'recommendations': recommendations[position],
+                'model_version': model_versions[position]
+            }
+        
+        # Save to database if available and user is logged in; persisted tells replaying clients the outcome
+        persisted = False
+        if not (SQLALCHEMY_AVAILABLE and db):
+            persist_error = 'Database not available'
+        elif 'user_id' not in session:
+            persist_error = 'Not logged in'
+        else:
+            persist_error = None
+        if persist_error is None and valid_indices:
+            try:
+                db.session.add_all([FarmData(
+                    user_id=session['user_id'],
+                    crop_type=rows[index]['crop_type'],
+                    region=rows[index]['region'],
+                    rainfall=rows[index]['rainfall'],
+                    temperature=rows[index]['temperature'],
+                    soil_ph=rows[index]['soil_ph'],
+                    nitrogen=rows[index]['nitrogen'],
+                    phosphorus=rows[index]['phosphorus'],
+                    potassium=rows[index]['potassium'],
+                    sowing_date_offset=rows[index]['sowing_date_offset'],
+                    predicted_yield=predictions[position],
+                    risk_level=risk_levels[position],
+                    recommendations=json.dumps(recommendations[position])
+                ) for position, index in enumerate(valid_indices)])
+                db.session.commit()
+                persisted = True
+            except Exception as e:
+                db.session.rollback()  # Continue without database save
+                persist_error = str(e)
+        
+        return jsonify({
+            'results': results,
+            'total': len(rows),
+            'succeeded': len(valid_indices),
+            'failed': len(errors),
+            'persisted': persisted,
+            'persist_error': persist_error,
+            'unit': 'tons/hectare',
+            'timestamp': datetime.now().isoformat()
+        })
+        
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/predict/cache/stats')
+def get_prediction_cache_stats():
+    """Hit/miss/eviction counters of the prediction memoization cache"""
+    return jsonify({
+        'prediction_cache': prediction_cache.stats(),
+        'timestamp': datetime.now().isoformat()
+    })
+
 @app.route('/api/dashboard/<int:user_id>')
 def get_dashboard(user_id):
     """Get dashboard data for a user"""
@@ -625,11 +724,38 @@ def get_at_risk_farmers():
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+@app.route('/api/admin/model/train', methods=['POST'])
+def start_model_training():
+    """Retrain the yield model in the background (admin only)"""
+    options = request.get_json(silent=True) or {}
+    source = options.get('source', 'seed')
+    if source not in ('seed', 'history', 'shards'):
+        return jsonify({'error': "source must be 'seed', 'history' or 'shards'"}), 400
+    
+    kwargs = {'source': source}
+    if source == 'history':
+        kwargs['incremental'] = bool(options.get('incremental', False))
+    
+    if not training_job.start(**kwargs):
+        return jsonify({'error': 'Training already running', 'status': training_job.info()}), 409
+    return jsonify({'message': 'Training started', 'status': training_job.info()}), 202
+
+@app.route('/api/admin/model/status')
+def get_model_training_status():
+    """Last training run and the model currently served"""
+    return jsonify({
+        'training': training_job.info(),
+        'serving': model_registry.get_model().info(),
+        'shards': model_family.stats(),
+        'timestamp': datetime.now().isoformat()
+    })
+
 @app.route('/api/health')
 def health_check():
     return jsonify({
         'status': 'healthy',
-        'model_loaded': os.path.exists('crop_yield_model.pkl') or os.path.exists('simple_model.json'),
+        'model_loaded': model_registry.get_model().kind != 'fallback',
+        'model': model_registry.get_model().info(),
         'database_connected': True,
         'timestamp': datetime.now().isoformat()
     })
@@ -688,59 +814,103 @@ def send_notification():
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+def offline_idempotency_key(user_id, entry):
+    """Idempotency key of an offline prediction, scoped to the user.
+
+    The client-supplied key, or the entry's content when there is none, is
+    hashed together with user_id, so two users sending the same key never
+    collide in SyncedPrediction.
+    """
+    key = entry['data'].get('idempotency_key')
+    if key:
+        payload = json.dumps([int(user_id), 'key', str(key)])
+    else:
+        payload = json.dumps([int(user_id), str(entry['created_at']), entry['data']], sort_keys=True)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
 @app.route('/api/offline/sync', methods=['POST'])
 def sync_offline_data():
-    """Sync offline data with server"""
+    """Sync offline data with server.
+    
+    Pages through all unsynced predictions of the user; each page is bulk
+    inserted with its idempotency keys in one transaction and then marked
+    synced in the offline cache. A retry after a failure between those two
+    steps finds the keys already present and only marks the rows synced.
+    """
     try:
+        if not SQLALCHEMY_AVAILABLE or not db:
+            return jsonify({'error': 'Database not available. Offline sync is currently disabled.'}), 503
+        
         data = request.get_json()
         user_id = data.get('user_id')
         sync_type = data.get('type', 'all')
         
         if not user_id:
             return jsonify({'error': 'User ID required'}), 400
+        try:
+            user_id = int(user_id)
+        except (TypeError, ValueError):
+            return jsonify({'error': 'User ID must be an integer'}), 400
         
         results = {
             'predictions_synced': 0,
+            'duplicates_skipped': 0,
             'weather_synced': 0,
             'user_data_synced': 0,
+            'pages': 0,
             'errors': []
         }
         
         # Sync offline predictions
         if sync_type in ['all', 'predictions']:
-            offline_predictions = offline_cache.get_cached_predictions(user_id)
-            for pred in offline_predictions:
+            for page in offline_cache.iter_unsynced_predictions(user_id, page_size=OFFLINE_SYNC_PAGE_SIZE):
+                keyed = {}
+                for entry in page:
+                    keyed.setdefault(offline_idempotency_key(user_id, entry), []).append(entry)
+                
+                existing = {row.idempotency_key for row in db.session.query(SyncedPrediction.idempotency_key)
+                            .filter(SyncedPrediction.idempotency_key.in_(list(keyed)))}
+                farm_rows = []
+                for key, entries in keyed.items():
+                    if key in existing:
+                        continue
+                    pred = entries[0]['data']
+                    input_data = pred.get('input_data', {})
+                    farm_rows.append({
+                        'user_id': user_id,
+                        'crop_type': input_data.get('crop_type'),
+                        'region': input_data.get('region'),
+                        'rainfall': input_data.get('rainfall'),
+                        'temperature': input_data.get('temperature'),
+                        'soil_ph': input_data.get('soil_ph'),
+                        'nitrogen': input_data.get('nitrogen'),
+                        'phosphorus': input_data.get('phosphorus'),
+                        'potassium': input_data.get('potassium'),
+                        'sowing_date_offset': input_data.get('sowing_date_offset'),
+                        'predicted_yield': pred.get('predicted_yield'),
+                        'risk_level': pred.get('risk_level'),
+                        'recommendations': json.dumps(pred.get('recommendations', [])),
+                        'created_at': datetime.utcnow()
+                    })
+                new_keys = [{'idempotency_key': key, 'user_id': user_id, 'synced_at': datetime.utcnow()}
+                            for key in keyed if key not in existing]
+                
                 try:
-                    # Save to main database
-                    farm_data = FarmData(
-                        user_id=user_id,
-                        crop_type=pred.get('input_data', {}).get('crop_type'),
-                        region=pred.get('input_data', {}).get('region'),
-                        rainfall=pred.get('input_data', {}).get('rainfall'),
-                        temperature=pred.get('input_data', {}).get('temperature'),
-                        soil_ph=pred.get('input_data', {}).get('soil_ph'),
-                        nitrogen=pred.get('input_data', {}).get('nitrogen'),
-                        phosphorus=pred.get('input_data', {}).get('phosphorus'),
-                        potassium=pred.get('input_data', {}).get('potassium'),
-                        sowing_date_offset=pred.get('input_data', {}).get('sowing_date_offset'),
-                        predicted_yield=pred.get('predicted_yield'),
-                        risk_level=pred.get('risk_level'),
-                        recommendations=json.dumps(pred.get('recommendations', []))
-                    )
-                    db.session.add(farm_data)
-                    results['predictions_synced'] += 1
+                    db.session.bulk_insert_mappings(FarmData, farm_rows)
+                    db.session.bulk_insert_mappings(SyncedPrediction, new_keys)
+                    db.session.commit()
                 except Exception as e:
+                    db.session.rollback()
                     results['errors'].append(f'Prediction sync error: {str(e)}')
-        
-        # Commit all changes
-        try:
-            db.session.commit()
-        except Exception as e:
-            db.session.rollback()
-            results['errors'].append(f'Database commit error: {str(e)}')
+                    break
+                
+                offline_cache.mark_synced_many('predictions', [entry['id'] for entry in page])
+                results['predictions_synced'] += len(farm_rows)
+                results['duplicates_skipped'] += len(page) - len(farm_rows)
+                results['pages'] += 1
         
         return jsonify({
-            'success': True,
+            'success': not results['errors'],
             'results': results,
             'timestamp': datetime.now().isoformat()
         })
@@ -766,6 +936,40 @@ def get_offline_status(user_id):
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+@app.route('/api/admin/offline/maintenance', methods=['GET', 'POST'])
+def offline_cache_maintenance():
+    """Show the maintenance worker state, or run a purge/vacuum pass now (admin only)"""
+    if request.method == 'POST':
+        options = request.get_json(silent=True) or {}
+        report = offline_maintenance.run_once(full_vacuum=bool(options.get('full_vacuum', False)))
+        return jsonify({'report': report, 'maintenance': offline_maintenance.info()})
+    return jsonify({'maintenance': offline_maintenance.info(), 'storage': offline_cache.storage_info()})
+
+@app.route('/api/admin/weather/prefetch', methods=['GET', 'POST'])
+def weather_prefetch_status():
+    """Show the weather prefetcher state, or refresh the active regions now (admin only)"""
+    if request.method == 'POST':
+        report = weather_prefetcher.run_once()
+        return jsonify({'report': report, 'prefetcher': weather_prefetcher.info()})
+    return jsonify({'prefetcher': weather_prefetcher.info(), 'weather_cache': weather_cache.stats()})
+
+@app.route('/api/admin/offline/sync-queue')
+def get_sync_queue_status():
+    """Sync worker drain rate, queue lag and recent dead letters (admin only)"""
+    return jsonify({
+        'worker': sync_worker.info(),
+        'dead_letters': offline_cache.get_dead_letters(limit=int(request.args.get('limit', 20))),
+        'timestamp': datetime.now().isoformat()
+    })
+
+@app.route('/api/admin/http/metrics')
+def get_http_metrics():
+    """Per-host latency and connection pool use of outbound HTTP calls (admin only)"""
+    return jsonify({
+        'http': http_client.metrics(),
+        'timestamp': datetime.now().isoformat()
+    })
+
 @app.route('/api/admin/bulk-notify', methods=['POST'])
 def send_bulk_notifications():
     """Send bulk notifications to multiple users (admin only)"""
@@ -801,9 +1005,12 @@ def send_bulk_notifications():
         return jsonify({'error': str(e)}), 500
 
 if __name__ == '__main__':
-    # Train model if it doesn't exist
-    if not os.path.exists('crop_yield_model.pkl'):
-        train_model()
+    # Train in the background if no model exists yet; serving starts on the fallback
+    if not os.path.exists(MODEL_PATH):
+        training_job.start()
+    offline_maintenance.start()
+    sync_worker.start()
+    weather_prefetcher.start()
     
     print("🌾 AI-Based Crop Yield Prediction & Advisory Platform")
     print("Backend API starting...")
@@ -0,0 +1,141 @@
+import asyncio
+import queue
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from functools import partial
+from typing import Callable, List, Optional, Tuple
+
+from offline_cache import OfflineCache
+
+# OfflineCache methods routed through the single writer thread
+WRITE_METHODS = {
+    'store_prediction', 'store_weather_data', 'store_user_data', 'add_to_sync_queue',
+    'store_predictions_many', 'store_weather_data_many', 'store_user_data_many', 'add_to_sync_queue_many',
+    'mark_synced', 'mark_synced_many', 'mark_sync_failed', 'lease_sync_batch', 'complete_sync',
+    'fail_sync', 'recount_cache_stats', 'clear_all_data', 'store_weather_entry', 'invalidate_weather',
+    'set_setting'
+}
+
+# OfflineCache methods run concurrently on the reader pool
+READ_METHODS = {
+    'get_cached_predictions', 'get_cached_weather', 'get_cached_user_data', 'get_weather_history',
+    'get_sync_queue', 'get_cache_stats', 'get_dead_letters', 'sync_queue_metrics', 'storage_info',
+    'schema_version', 'explain_query_plans', 'get_weather_entry', 'weather_generation', 'get_setting'
+}
+
+_STOP = object()
+
+
+class AsyncOfflineCache:
+    """Awaitable facade over OfflineCache for asyncio code.
+
+    Writes are queued to one writer thread, which commits whatever has
+    accumulated (up to max_batch calls) in a single transaction; each call
+    runs in its own savepoint so one failure does not undo the others.
+    Reads run on a small thread pool. Every OfflineCache read/write method is
+    available under the same name as a coroutine:
+
+        cache = AsyncOfflineCache(offline_cache)
+        await cache.store_prediction(user_id, prediction)
+        stats = await cache.get_cache_stats()
+    """
+
+    def __init__(self, cache: OfflineCache, readers: int = 4, max_batch: int = 256):
+        self.cache = cache
+        self.max_batch = max_batch
+        self._writes: 'queue.Queue' = queue.Queue()
+        self._readers = ThreadPoolExecutor(max_workers=readers, thread_name_prefix='offline-cache-reader')
+        self._writer = threading.Thread(target=self._write_loop, name='offline-cache-writer', daemon=True)
+        self._writer.start()
+        self.transactions = 0
+        self.writes = 0
+
+    def __getattr__(self, name: str) -> Callable:
+        if name in WRITE_METHODS:
+            method = getattr(self.cache, name)
+
+            async def write(*args, **kwargs):
+                return await asyncio.wrap_future(self.submit_write(method, *args, **kwargs))
+            write.__name__ = name
+            return write
+
+        if name in READ_METHODS:
+            method = getattr(self.cache, name)
+
+            async def read(*args, **kwargs):
+                loop = asyncio.get_running_loop()
+                return await loop.run_in_executor(self._readers, partial(method, *args, **kwargs))
+            read.__name__ = name
+            return read
+
+        raise AttributeError(f"'{type(self).__name__}' has no attribute '{name}'")
+
+    def submit_write(self, method: Callable, *args, **kwargs) -> Future:
+        """Queue a write for the writer thread; usable from plain threads as well"""
+        future = Future()
+        self._writes.put((method, args, kwargs, future))
+        return future
+
+    def _next_batch(self) -> Tuple[List[tuple], bool]:
+        first = self._writes.get()
+        if first is _STOP:
+            return [], True
+        batch = [first]
+        while len(batch) < self.max_batch:
+            try:
+                item = self._writes.get_nowait()
+            except queue.Empty:
+                break
+            if item is _STOP:
+                return batch, True
+            batch.append(item)
+        return batch, False
+
+    def _write_loop(self):
+        while True:
+            batch, stopping = self._next_batch()
+            if batch:
+                self._run_batch(batch)
+            if stopping:
+                return
+
+    def _run_batch(self, batch: List[tuple]):
+        results = []
+        try:
+            with self.cache.pool.connection(immediate=True):
+                for method, args, kwargs, future in batch:
+                    if not future.set_running_or_notify_cancel():
+                        continue
+                    try:
+                        results.append((future, method(*args, **kwargs), None))
+                    except Exception as e:
+                        results.append((future, None, e))
+        except Exception as e:
+            # The transaction failed to start or commit: nothing in the batch was written
+            for _, _, _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        self.transactions += 1
+        self.writes += len(results)
+        # Resolve only after commit so awaiting callers can read their own writes
+        for future, result, error in results:
+            if error is not None:
+                future.set_exception(error)
+            else:
+                future.set_result(result)
+
+    def close(self, timeout: Optional[float] = 5.0):
+        """Flush queued writes and stop the writer and reader threads"""
+        self._writes.put(_STOP)
+        self._writer.join(timeout)
+        self._readers.shutdown(wait=True)
+
+    def stats(self) -> dict:
+        return {
+            'queued_writes': self._writes.qsize(),
+            'transactions': self.transactions,
+            'writes': self.writes,
+            'writes_per_transaction': round(self.writes / self.transactions, 2) if self.transactions else 0.0
+        }
@@ -0,0 +1,228 @@
+#!/usr/bin/env python3
+"""
+Micro-benchmark for OfflineCache under concurrent threads.
+
+Compares the old connect-per-operation pattern against the pooled WAL
+connections, running the same mix of writes and reads from N threads.
+
+    python bench_offline_cache.py --threads 8 --ops 500
+    python bench_offline_cache.py --check-plans    # fail if a hot query scans or sorts
+    python bench_offline_cache.py --bulk 10000     # row-at-a-time vs batched inserts
+    python bench_offline_cache.py --codecs 10000   # payload size on disk and encode/decode time
+"""
+
+import argparse
+import json
+import os
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime
+
+from offline_cache import OfflineCache, WriteBehindBuffer
+from payload_codec import PayloadCodec, decode_payload
+
+PREDICTION = {
+    'predicted_yield': 2.88,
+    'risk_level': 'Green',
+    'recommendations': ['Low rainfall. Implement drip irrigation or supplemental watering.'],
+    'input_data': {'crop_type': 'rice', 'region': 'Punjab', 'rainfall': 250, 'temperature': 30,
+                   'soil_ph': 6.8, 'nitrogen': 85, 'phosphorus': 42, 'potassium': 65, 'sowing_date_offset': 2}
+}
+
+
+def unpooled_ops(db_path: str, user_id: int, ops: int):
+    """The pre-pool access pattern: open, run one statement, commit, close"""
+    for i in range(ops):
+        conn = sqlite3.connect(db_path)
+        cursor = conn.cursor()
+        if i % 2 == 0:
+            cursor.execute('''
+                INSERT INTO offline_predictions (user_id, data, created_at)
+                VALUES (?, ?, ?)
+            ''', (user_id, json.dumps(PREDICTION), datetime.now()))
+            conn.commit()
+        else:
+            cursor.execute('''
+                SELECT data, created_at FROM offline_predictions
+                WHERE user_id = ? AND synced = FALSE
+                ORDER BY created_at DESC
+                LIMIT ?
+            ''', (user_id, 10))
+            cursor.fetchall()
+        conn.close()
+
+
+def pooled_ops(cache: OfflineCache, user_id: int, ops: int):
+    for i in range(ops):
+        if i % 2 == 0:
+            cache.store_prediction(user_id, PREDICTION)
+        else:
+            cache.get_cached_predictions(user_id)
+
+
+def run_threads(target, args_for_thread, threads: int) -> float:
+    workers = [threading.Thread(target=target, args=args_for_thread(t)) for t in range(threads)]
+    started = time.perf_counter()
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    return time.perf_counter() - started
+
+
+def plan_problems(plans) -> list:
+    """Hot queries whose plan falls back to a full table scan or a temp B-tree sort.
+
+    The sync queue statements run on every worker poll, so any SCAN there,
+    even one walking an index, counts as a problem.
+    """
+    problems = []
+    for name, details in plans.items():
+        for detail in details:
+            full_scan = detail.startswith('SCAN') and ('USING' not in detail or name.startswith('sync_'))
+            if full_scan or 'TEMP B-TREE' in detail:
+                problems.append(f"{name}: {detail}")
+    return problems
+
+
+def check_plans() -> int:
+    with tempfile.TemporaryDirectory() as tmp:
+        cache = OfflineCache(os.path.join(tmp, 'plans.db'))
+        plans = cache.explain_query_plans()
+        print(f"Schema version {cache.schema_version()}")
+        cache.pool.close_all()
+
+    for name, details in plans.items():
+        print(f"  {name:20s} {' / '.join(details)}")
+    problems = plan_problems(plans)
+    for problem in problems:
+        print(f"Unindexed plan: {problem}")
+    return 1 if problems else 0
+
+
+def bench_bulk(rows: int):
+    """Time the same number of prediction inserts through each write path"""
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        cache = OfflineCache(os.path.join(tmp, 'single.db'))
+        started = time.perf_counter()
+        for i in range(rows):
+            cache.store_prediction(i % 50, PREDICTION)
+        results['store_prediction'] = time.perf_counter() - started
+        cache.pool.close_all()
+
+        cache = OfflineCache(os.path.join(tmp, 'many.db'))
+        started = time.perf_counter()
+        cache.store_predictions_many((i % 50, PREDICTION) for i in range(rows))
+        results['store_predictions_many'] = time.perf_counter() - started
+        cache.pool.close_all()
+
+        cache = OfflineCache(os.path.join(tmp, 'buffered.db'))
+        buffer = WriteBehindBuffer(cache, max_items=1000, max_delay=1.0)
+        started = time.perf_counter()
+        for i in range(rows):
+            buffer.store_prediction(i % 50, PREDICTION)
+        buffer.flush()
+        results['WriteBehindBuffer'] = time.perf_counter() - started
+        assert cache.get_cache_stats()['total_predictions'] == rows
+        cache.pool.close_all()
+
+    baseline = results['store_prediction']
+    print(f"{rows} prediction inserts")
+    for name, seconds in results.items():
+        print(f"  {name:24s} {seconds * 1000:10,.1f} ms  ({baseline / seconds:.0f}x)")
+
+
+def bench_codecs(rows: int):
+    """Bytes on disk and per-row encode/decode cost of each payload codec"""
+    specs = ['json', 'json+zlib', 'msgpack', 'msgpack+zlib']
+    # Realistic spread of payloads: one to three recommendations, varying inputs
+    payloads = []
+    for i in range(rows):
+        payload = json.loads(json.dumps(PREDICTION))
+        payload['predicted_yield'] = round(2.0 + (i % 97) / 50, 2)
+        payload['recommendations'] = PREDICTION['recommendations'] * (1 + i % 3)
+        payload['input_data']['rainfall'] = 150 + i % 200
+        payloads.append(payload)
+
+    # Legacy rows: plain json.dumps text, as stored before codecs existed
+    legacy = [json.dumps(payload) for payload in payloads]
+    started = time.perf_counter()
+    for text in legacy:
+        json.loads(text)
+    legacy_decode = time.perf_counter() - started
+
+    print(f"{rows} prediction payloads")
+    print(f"  {'codec':14s} {'bytes/row':>9s} {'db KiB':>8s} {'encode us':>9s} {'decode us':>9s}")
+    with tempfile.TemporaryDirectory() as tmp:
+        cache = OfflineCache(os.path.join(tmp, 'legacy.db'), codecs={'offline_predictions': 'json'})
+        with cache.pool.connection() as conn:
+            conn.executemany('INSERT INTO offline_predictions (user_id, data) VALUES (1, ?)', [(t,) for t in legacy])
+        size = cache.storage_info()['size_bytes']
+        cache.pool.close_all()
+        print(f"  {'legacy text':14s} {sum(map(len, legacy)) / rows:9.0f} {size / 1024:8.0f} {'-':>9s} "
+              f"{legacy_decode / rows * 1e6:9.1f}")
+
+        for spec in specs:
+            codec = PayloadCodec.from_spec(spec)
+            if codec.spec != spec:
+                print(f"  {spec:14s} unavailable (pip install msgpack)")
+                continue
+            started = time.perf_counter()
+            blobs = [codec.encode(payload) for payload in payloads]
+            encode = time.perf_counter() - started
+            started = time.perf_counter()
+            for blob in blobs:
+                decode_payload(blob)
+            decode = time.perf_counter() - started
+
+            cache = OfflineCache(os.path.join(tmp, f'{spec}.db'), codecs={'offline_predictions': spec})
+            cache.store_predictions_many((1, payload) for payload in payloads)
+            size = cache.storage_info()['size_bytes']
+            cache.pool.close_all()
+            print(f"  {spec:14s} {sum(map(len, blobs)) / rows:9.0f} {size / 1024:8.0f} "
+                  f"{encode / rows * 1e6:9.1f} {decode / rows * 1e6:9.1f}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='OfflineCache ops/sec before and after connection pooling')
+    parser.add_argument('--threads', type=int, default=8)
+    parser.add_argument('--ops', type=int, default=500, help='Operations per thread (half writes, half reads)')
+    parser.add_argument('--check-plans', action='store_true',
+                        help='Only verify that every hot query is served by an index')
+    parser.add_argument('--bulk', type=int, metavar='ROWS',
+                        help='Only compare single-row, bulk and write-behind inserts for ROWS rows')
+    parser.add_argument('--codecs', type=int, metavar='ROWS',
+                        help='Only compare payload codecs on ROWS prediction payloads')
+    args = parser.parse_args(argv)
+    if args.codecs:
+        return bench_codecs(args.codecs)
+    if args.check_plans:
+        return check_plans()
+    if args.bulk:
+        return bench_bulk(args.bulk)
+    total_ops = args.threads * args.ops
+
+    with tempfile.TemporaryDirectory() as tmp:
+        # Baseline: fresh rollback-journal database, one connection per operation
+        baseline_path = os.path.join(tmp, 'baseline.db')
+        OfflineCache(baseline_path).pool.close_all()
+        conn = sqlite3.connect(baseline_path)
+        conn.execute('PRAGMA journal_mode=DELETE')
+        conn.close()
+        baseline = run_threads(unpooled_ops, lambda t: (baseline_path, t, args.ops), args.threads)
+
+        cache = OfflineCache(os.path.join(tmp, 'pooled.db'), max_connections=args.threads)
+        pooled = run_threads(pooled_ops, lambda t: (cache, t, args.ops), args.threads)
+        cache.pool.close_all()
+
+    print(f"{args.threads} threads x {args.ops} ops")
+    print(f"  connect per op : {total_ops / baseline:10,.0f} ops/sec")
+    print(f"  pooled (WAL)   : {total_ops / pooled:10,.0f} ops/sec  ({baseline / pooled:.1f}x)")
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+"""
+Cold-start import budget for the API.
+
+Imports app.py in fresh interpreters under `python -X importtime`, reports the
+slowest modules and fails when the import takes longer than the budget or
+pulls in a module that serving must not load at startup (the training stack).
+Run from backend/; CI runs it before building the backend image.
+
+    python bench_startup.py                    # best of 3 against the default budget
+    python bench_startup.py --budget 1.5 --runs 5 --top 30
+"""
+
+import argparse
+import os
+import subprocess
+import sys
+from typing import Dict, List, Tuple
+
+# Default cold-start budget for `import app`, in seconds
+DEFAULT_BUDGET_SECONDS = 2.5
+
+# Only needed for training or for loading a pickled sklearn model
+FORBIDDEN_AT_STARTUP = ('sklearn', 'pandas', 'scipy', 'joblib')
+
+
+def measure_import(module: str = 'app') -> Tuple[float, Dict[str, Tuple[int, int]]]:
+    """Import module in a fresh interpreter; (total seconds, {module: (self us, cumulative us)})"""
+    env = dict(os.environ, PYTHONDONTWRITEBYTECODE='1')
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+        cwd=os.path.dirname(os.path.abspath(__file__)), env=env, capture_output=True, text=True
+    )
+    if result.returncode != 0:
+        raise RuntimeError(f'import {module} failed:\n{result.stderr[-2000:]}')
+
+    timings = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|', 2)
+        timings[name.strip()] = (int(self_us), int(cumulative_us))
+
+    if module not in timings:
+        raise RuntimeError(f'No importtime entry for {module}')
+    return timings[module][1] / 1e6, timings
+
+
+def forbidden_imports(timings: Dict[str, Tuple[int, int]]) -> List[str]:
+    return sorted(name for name in timings if name.split('.')[0] in FORBIDDEN_AT_STARTUP)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Fail if importing app.py regresses beyond the startup budget')
+    parser.add_argument('--module', default='app')
+    parser.add_argument('--budget', type=float, default=float(os.environ.get('STARTUP_BUDGET_SECONDS',
+                                                                             DEFAULT_BUDGET_SECONDS)))
+    parser.add_argument('--runs', type=int, default=3, help='Fresh interpreters; the fastest run is checked')
+    parser.add_argument('--top', type=int, default=15, help='Slowest modules to list')
+    args = parser.parse_args(argv)
+
+    runs = [measure_import(args.module) for _ in range(max(1, args.runs))]
+    total, timings = min(runs, key=lambda run: run[0])
+
+    print(f"import {args.module}: best {total:.3f}s of {len(runs)} run(s) "
+          f"({', '.join(f'{run[0]:.3f}s' for run in runs)}), budget {args.budget:.3f}s")
+    print(f"{'self ms':>9} {'cumul ms':>9}  module")
+    for name, (self_us, cumulative_us) in sorted(timings.items(), key=lambda item: -item[1][0])[:args.top]:
+        print(f"{self_us / 1000:9.1f} {cumulative_us / 1000:9.1f}  {name}")
+
+    failed = False
+    heavy = forbidden_imports(timings)
+    if heavy:
+        print(f"FAIL: imported at startup: {', '.join(heavy[:10])}{' ...' if len(heavy) > 10 else ''}")
+        failed = True
+    if total > args.budget:
+        print(f"FAIL: import {args.module} took {total:.3f}s, over the {args.budget:.3f}s budget")
+        failed = True
+    if not failed:
+        print('OK')
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,194 @@
+#!/usr/bin/env python3
+"""
+Bulk yield scoring for offline district-level runs.
+
+Streams a CSV (or Parquet when pyarrow is installed) in fixed-size chunks
+through the resident model and appends predicted yield, risk level and
+recommendations to every row. Output is written chunk by chunk so memory
+stays flat regardless of input size.
+
+    python bulk_score.py plots.csv scored.csv --chunk-size 50000
+"""
+
+import argparse
+import csv
+import itertools
+import sys
+import time
+from typing import Dict, Iterator, List, Optional
+
+from inference import (
+    REQUIRED_FIELDS, build_feature_block, generate_recommendations_batch, calculate_risk_levels
+)
+from model_registry import (
+    ModelFamily, ModelRegistry, MODEL_PATH, MODEL_SHARD_DIR, SIMPLE_MODEL_PATH, forest_path_for
+)
+
+OUTPUT_FIELDS = ['predicted_yield', 'risk_level', 'recommendations', 'error']
+
+# Arrow types of the scored columns; fixed, since any chunk may be all errors or have none
+OUTPUT_TYPES = {'predicted_yield': 'float64', 'risk_level': 'string', 'recommendations': 'string', 'error': 'string'}
+
+
+def _is_parquet(path: str) -> bool:
+    return path.lower().endswith(('.parquet', '.pq'))
+
+
+def _normalize(row: Dict) -> Dict:
+    """Accept the training column name for the sowing offset as well"""
+    if 'sowing_date_offset' not in row and 'sowing_offset' in row:
+        row['sowing_date_offset'] = row['sowing_offset']
+    return row
+
+
+def read_chunks(path: str, chunk_size: int) -> Iterator[List[Dict]]:
+    """Yield lists of at most chunk_size rows from a CSV or Parquet file"""
+    if _is_parquet(path):
+        try:
+            import pyarrow.parquet as pq
+        except ImportError:
+            raise SystemExit("Reading Parquet requires pyarrow (pip install pyarrow)")
+        parquet_file = pq.ParquetFile(path)
+        for batch in parquet_file.iter_batches(batch_size=chunk_size):
+            yield [_normalize(row) for row in batch.to_pylist()]
+        return
+
+    with open(path, newline='', encoding='utf-8') as f:
+        reader = csv.DictReader(f)
+        while True:
+            chunk = [_normalize(row) for row in itertools.islice(reader, chunk_size)]
+            if not chunk:
+                break
+            yield chunk
+
+
+class ChunkWriter:
+    """Incremental CSV/Parquet writer; input columns come from the first chunk, scored columns are fixed"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.fieldnames = None
+        self.schema = None
+        self._file = None
+        self._csv = None
+        self._parquet = None
+
+    def write(self, rows: List[Dict]):
+        if not rows:
+            return
+        if self.fieldnames is None:
+            self.fieldnames = [name for name in rows[0] if name not in OUTPUT_FIELDS] + OUTPUT_FIELDS
+
+        if _is_parquet(self.path):
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+            records = [{name: row.get(name) for name in self.fieldnames} for row in rows]
+            if self.schema is None:
+                self.schema = self._parquet_schema(records)
+                self._parquet = pq.ParquetWriter(self.path, self.schema)
+            self._parquet.write_table(pa.Table.from_pylist(records, schema=self.schema))
+            return
+
+        if self._csv is None:
+            self._file = open(self.path, 'w', newline='', encoding='utf-8')
+            self._csv = csv.DictWriter(self._file, fieldnames=self.fieldnames, extrasaction='ignore')
+            self._csv.writeheader()
+        self._csv.writerows(rows)
+        self._file.flush()
+
+    def _parquet_schema(self, records: List[Dict]):
+        """Input column types inferred from the first chunk (all-null columns as string) plus OUTPUT_TYPES"""
+        import pyarrow as pa
+        inputs = [name for name in self.fieldnames if name not in OUTPUT_TYPES]
+        inferred = pa.Table.from_pylist([{name: record[name] for name in inputs} for record in records]).schema
+        fields = [pa.field(field.name, pa.string() if pa.types.is_null(field.type) else field.type)
+                  for field in inferred]
+        fields += [pa.field(name, pa.type_for_alias(OUTPUT_TYPES[name])) for name in OUTPUT_FIELDS]
+        return pa.schema(fields)
+
+    def close(self):
+        if self._parquet is not None:
+            self._parquet.close()
+        if self._file is not None:
+            self._file.close()
+
+
+def score_chunk(family: ModelFamily, rows: List[Dict]) -> List[Dict]:
+    """Predict, recommend and risk-score one chunk in place"""
+    matrix, valid_indices, errors = build_feature_block(rows)
+    predictions, _ = family.predict_many(
+        matrix,
+        [rows[index]['crop_type'] for index in valid_indices],
+        [rows[index]['region'] for index in valid_indices]
+    )
+    recommendations = generate_recommendations_batch(matrix, predictions)
+    risk_levels = calculate_risk_levels(predictions, recommendations)
+
+    for index, message in errors.items():
+        rows[index].update({'predicted_yield': None, 'risk_level': None, 'recommendations': None, 'error': message})
+    for position, index in enumerate(valid_indices):
+        rows[index].update({
+            'predicted_yield': round(predictions[position], 4),
+            'risk_level': risk_levels[position],
+            'recommendations': ' | '.join(recommendations[position]),
+            'error': None
+        })
+    return rows
+
+
+def run(input_path: str, output_path: str, chunk_size: int, model_path: str, simple_model_path: str,
+        shard_dir: str = MODEL_SHARD_DIR, forest_path: Optional[str] = None) -> Dict:
+    # The compiled forest must come from the same model, not whatever sits in the working directory
+    registry = ModelRegistry(model_path=model_path, simple_model_path=simple_model_path,
+                             forest_path=forest_path or forest_path_for(model_path))
+    family = ModelFamily(registry, shard_dir=shard_dir, check_interval=3600)
+    model = registry.get_model()
+    print(f"Scoring {input_path} with {model.version} (shards from {shard_dir}) in chunks of {chunk_size}")
+
+    writer = ChunkWriter(output_path)
+    total_rows = 0
+    failed_rows = 0
+    started = time.perf_counter()
+    try:
+        for chunk in read_chunks(input_path, chunk_size):
+            scored = score_chunk(family, chunk)
+            writer.write(scored)
+            total_rows += len(scored)
+            failed_rows += sum(1 for row in scored if row['error'])
+            elapsed = time.perf_counter() - started
+            print(f"  {total_rows} rows scored ({total_rows / elapsed:,.0f} rows/sec)", file=sys.stderr)
+    finally:
+        writer.close()
+
+    elapsed = time.perf_counter() - started
+    summary = {
+        'rows': total_rows,
+        'failed_rows': failed_rows,
+        'seconds': round(elapsed, 3),
+        'rows_per_sec': round(total_rows / elapsed, 1) if elapsed > 0 else 0.0,
+        'model_version': model.version
+    }
+    print(f"Scored {total_rows} rows ({failed_rows} failed) in {elapsed:.2f}s "
+          f"-> {summary['rows_per_sec']:,.0f} rows/sec, written to {output_path}")
+    return summary
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Bulk crop yield scoring for CSV/Parquet files')
+    parser.add_argument('input', help='Input CSV or Parquet file with the fields: ' + ', '.join(REQUIRED_FIELDS))
+    parser.add_argument('output', help='Output CSV or Parquet file')
+    parser.add_argument('--chunk-size', type=int, default=10000, help='Rows per chunk (default: 10000)')
+    parser.add_argument('--model', default=MODEL_PATH, help='Path to the pickled model')
+    parser.add_argument('--forest', help='Compiled forest (.npz) of --model (default: alongside --model)')
+    parser.add_argument('--simple-model', default=SIMPLE_MODEL_PATH, help='Path to the simple linear model')
+    parser.add_argument('--shard-dir', default=MODEL_SHARD_DIR, help='Directory of per-crop/region shard models')
+    args = parser.parse_args(argv)
+
+    if args.chunk_size <= 0:
+        parser.error('--chunk-size must be positive')
+
+    run(args.input, args.output, args.chunk_size, args.model, args.simple_model, args.shard_dir, args.forest)
+
+
+if __name__ == '__main__':
+    main()
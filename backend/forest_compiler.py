@@ -0,0 +1,169 @@
+#!/usr/bin/env python3
+"""
+Flat, array-backed evaluator for the RandomForestRegressor yield model.
+
+All trees of a fitted forest are concatenated into contiguous NumPy arrays
+(feature index, threshold, left/right child, leaf value). Prediction walks
+every tree for a whole batch at once with vectorized gathers, so serving
+needs only NumPy and skips sklearn's per-call validation and joblib dispatch.
+
+    python forest_compiler.py export --model crop_yield_model.pkl --output crop_yield_forest.npz
+    python forest_compiler.py verify --model crop_yield_model.pkl
+"""
+
+import argparse
+import io
+import os
+import sys
+from typing import Any
+
+import numpy as np
+
+from model_registry import FOREST_PATH, MODEL_PATH
+
+# sklearn marks leaves with children_left == TREE_LEAF
+TREE_LEAF = -1
+
+
+class CompiledForest:
+    """Averaging ensemble of regression trees stored as flat arrays"""
+
+    def __init__(self, feature, threshold, left, right, value, roots, max_depth: int, n_features: int):
+        self.feature = np.ascontiguousarray(feature, dtype=np.int32)
+        self.threshold = np.ascontiguousarray(threshold, dtype=np.float64)
+        self.left = np.ascontiguousarray(left, dtype=np.int32)
+        self.right = np.ascontiguousarray(right, dtype=np.int32)
+        self.value = np.ascontiguousarray(value, dtype=np.float64)
+        self.roots = np.ascontiguousarray(roots, dtype=np.int32)
+        self.max_depth = int(max_depth)
+        self.n_features_in_ = int(n_features)
+
+    @property
+    def n_trees(self) -> int:
+        return len(self.roots)
+
+    @property
+    def nbytes(self) -> int:
+        return sum(a.nbytes for a in (self.feature, self.threshold, self.left, self.right, self.value, self.roots))
+
+    def predict(self, X) -> np.ndarray:
+        """Predict a batch, matching RandomForestRegressor.predict"""
+        # sklearn evaluates splits on float32 inputs
+        X = np.asarray(X, dtype=np.float32)
+        if X.ndim == 1:
+            X = X.reshape(1, -1)
+        if X.shape[1] != self.n_features_in_:
+            raise ValueError(f'Expected {self.n_features_in_} features, got {X.shape[1]}')
+
+        n_rows = X.shape[0]
+        if n_rows == 0:
+            return np.empty(0, dtype=np.float64)
+
+        # One cursor per (tree, row); leaves point at themselves so extra steps are no-ops
+        nodes = np.repeat(self.roots[:, None], n_rows, axis=1)
+        row_index = np.broadcast_to(np.arange(n_rows), nodes.shape)
+        for _ in range(self.max_depth):
+            go_left = X[row_index, self.feature[nodes]] <= self.threshold[nodes]
+            nodes = np.where(go_left, self.left[nodes], self.right[nodes])
+
+        return self.value[nodes].mean(axis=0)
+
+    def save(self, path: str = FOREST_PATH):
+        """Write the arrays atomically as an uncompressed .npz"""
+        tmp_path = f'{path}.tmp'
+        with open(tmp_path, 'wb') as f:
+            np.savez(
+                f, feature=self.feature, threshold=self.threshold, left=self.left, right=self.right,
+                value=self.value, roots=self.roots,
+                meta=np.array([self.max_depth, self.n_features_in_], dtype=np.int64)
+            )
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, source: Any) -> 'CompiledForest':
+        """Load from a path, file object or raw bytes"""
+        if isinstance(source, (bytes, bytearray)):
+            source = io.BytesIO(source)
+        with np.load(source) as arrays:
+            max_depth, n_features = arrays['meta'].tolist()
+            return cls(arrays['feature'], arrays['threshold'], arrays['left'], arrays['right'],
+                       arrays['value'], arrays['roots'], max_depth, n_features)
+
+
+def compile_forest(model) -> CompiledForest:
+    """Flatten a fitted RandomForestRegressor into a CompiledForest"""
+    features, thresholds, lefts, rights, values, roots = [], [], [], [], [], []
+    offset = 0
+    max_depth = 0
+
+    for estimator in model.estimators_:
+        tree = estimator.tree_
+        n_nodes = tree.node_count
+        node_ids = np.arange(n_nodes, dtype=np.int64)
+        is_leaf = tree.children_left == TREE_LEAF
+
+        features.append(np.where(is_leaf, 0, tree.feature))
+        thresholds.append(np.where(is_leaf, 0.0, tree.threshold))
+        lefts.append(np.where(is_leaf, node_ids, tree.children_left) + offset)
+        rights.append(np.where(is_leaf, node_ids, tree.children_right) + offset)
+        values.append(tree.value[:, 0, 0])
+        roots.append(offset)
+
+        max_depth = max(max_depth, tree.max_depth)
+        offset += n_nodes
+
+    return CompiledForest(
+        np.concatenate(features), np.concatenate(thresholds), np.concatenate(lefts),
+        np.concatenate(rights), np.concatenate(values), np.array(roots), max_depth, model.n_features_in_
+    )
+
+
+def export_forest(model, path: str = FOREST_PATH) -> CompiledForest:
+    """Compile a fitted forest and write it next to the pickled model"""
+    compiled = compile_forest(model)
+    compiled.save(path)
+    return compiled
+
+
+def check_parity(model, compiled: CompiledForest, n_samples: int = 2000, seed: int = 42) -> float:
+    """Return the max absolute difference against sklearn on random in-range inputs"""
+    rng = np.random.default_rng(seed)
+    low = np.array([50, 15, 4.5, 20, 10, 20, -15], dtype=np.float64)
+    high = np.array([450, 40, 8.5, 140, 70, 110, 15], dtype=np.float64)
+    X = rng.uniform(low, high, size=(n_samples, len(low)))
+    X[:, -1] = np.round(X[:, -1])
+
+    expected = model.predict(X)
+    actual = compiled.predict(X)
+    return float(np.max(np.abs(expected - actual)))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Compile the RandomForest yield model into flat arrays')
+    parser.add_argument('command', choices=['export', 'verify'])
+    parser.add_argument('--model', default=MODEL_PATH, help='Pickled RandomForestRegressor')
+    parser.add_argument('--output', default=FOREST_PATH, help='Compiled forest (.npz)')
+    parser.add_argument('--samples', type=int, default=2000, help='Rows used by verify')
+    args = parser.parse_args(argv)
+
+    import joblib
+    model = joblib.load(args.model)
+    compiled = compile_forest(model)
+
+    if args.command == 'export':
+        compiled.save(args.output)
+        print(f"Compiled {compiled.n_trees} trees ({len(compiled.value)} nodes, depth {compiled.max_depth}, "
+              f"{compiled.nbytes / 1024:.1f} KiB) to {args.output}")
+        return 0
+
+    max_error = check_parity(model, compiled, n_samples=args.samples)
+    print(f"Max |sklearn - compiled| over {args.samples} rows: {max_error:.3e}")
+    if max_error > 1e-9:
+        print("Parity check FAILED")
+        return 1
+    print("Parity check passed")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
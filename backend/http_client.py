@@ -0,0 +1,147 @@
+import os
+import threading
+import time
+from collections import deque
+from typing import Any, Dict, Optional, Tuple, Union
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+# Latency samples kept per host for the percentiles in metrics()
+LATENCY_SAMPLES = 512
+
+
+class HttpClient:
+    """Shared requests.Session for outbound calls: pooled keep-alive connections, retries and split timeouts.
+
+    Idempotent requests are retried on connection errors and 502/503/504 with
+    exponential backoff; POSTs are only retried when the connection could not
+    be made, so an SMS is never sent twice. timeout may be a (connect, read)
+    tuple or a number, which replaces only the read timeout:
+
+        response = http_client.get(url, params=params)
+        response = http_client.post(url, json=payload, timeout=30)
+    """
+
+    def __init__(self, pool_connections: int = 10, pool_maxsize: int = 20, retries: int = 2,
+                 backoff_factor: float = 0.5, connect_timeout: float = 3.05, read_timeout: float = 10,
+                 status_forcelist: Tuple[int, ...] = (502, 503, 504)):
+        self.pool_connections = pool_connections
+        self.pool_maxsize = pool_maxsize
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.retry = Retry(
+            total=retries,
+            connect=retries,
+            read=retries,
+            status=retries,
+            backoff_factor=backoff_factor,
+            status_forcelist=status_forcelist,
+            raise_on_status=False
+        )
+        # Pools are per host; pool_connections hosts are kept, each with up to pool_maxsize idle sockets
+        self.adapter = HTTPAdapter(pool_connections=pool_connections, pool_maxsize=pool_maxsize,
+                                   max_retries=self.retry)
+        self.session = requests.Session()
+        self.session.mount('http://', self.adapter)
+        self.session.mount('https://', self.adapter)
+        self._hosts: Dict[str, Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+
+    def request(self, method: str, url: str, timeout: Union[None, float, Tuple[float, float]] = None,
+                **kwargs) -> requests.Response:
+        if timeout is None:
+            timeout = (self.connect_timeout, self.read_timeout)
+        elif not isinstance(timeout, tuple):
+            timeout = (self.connect_timeout, timeout)
+
+        host = urlsplit(url).netloc
+        started = time.perf_counter()
+        try:
+            response = self.session.request(method, url, timeout=timeout, **kwargs)
+        except requests.RequestException:
+            self._record(host, time.perf_counter() - started, None)
+            raise
+        self._record(host, time.perf_counter() - started, response.status_code)
+        return response
+
+    def get(self, url: str, **kwargs) -> requests.Response:
+        return self.request('GET', url, **kwargs)
+
+    def post(self, url: str, **kwargs) -> requests.Response:
+        return self.request('POST', url, **kwargs)
+
+    def _record(self, host: str, seconds: float, status: Optional[int]):
+        with self._lock:
+            stats = self._hosts.get(host)
+            if stats is None:
+                stats = self._hosts[host] = {
+                    'requests': 0, 'errors': 0, 'statuses': {}, 'total_seconds': 0.0, 'max_seconds': 0.0,
+                    'samples': deque(maxlen=LATENCY_SAMPLES)
+                }
+            stats['requests'] += 1
+            stats['total_seconds'] += seconds
+            stats['max_seconds'] = max(stats['max_seconds'], seconds)
+            stats['samples'].append(seconds)
+            if status is None:
+                stats['errors'] += 1
+            else:
+                status_class = f'{status // 100}xx'
+                stats['statuses'][status_class] = stats['statuses'].get(status_class, 0) + 1
+
+    def _pool_metrics(self) -> Dict[str, Dict[str, Any]]:
+        """Connections per host pool: sockets opened vs requests sent, and how many are checked out now"""
+        pools = {}
+        container = self.adapter.poolmanager.pools
+        for key in list(container.keys()):
+            pool = container.get(key)
+            if pool is None:
+                continue
+            host = pool.host if pool.port in (None, 80, 443) else f'{pool.host}:{pool.port}'
+            in_use = max(0, pool.pool.maxsize - pool.pool.qsize()) if pool.pool is not None else 0
+            pools[host] = {
+                'maxsize': pool.pool.maxsize if pool.pool is not None else self.pool_maxsize,
+                'in_use': in_use,
+                'utilization': round(in_use / self.pool_maxsize, 3),
+                'connections_opened': pool.num_connections,
+                'requests': pool.num_requests,
+                'connection_reuse': round(1 - pool.num_connections / pool.num_requests, 3) if pool.num_requests else 0.0
+            }
+        return pools
+
+    def metrics(self) -> Dict[str, Any]:
+        with self._lock:
+            hosts = {}
+            for host, stats in self._hosts.items():
+                samples = sorted(stats['samples'])
+                hosts[host] = {
+                    'requests': stats['requests'],
+                    'errors': stats['errors'],
+                    'statuses': dict(stats['statuses']),
+                    'avg_ms': round(stats['total_seconds'] / stats['requests'] * 1000, 2),
+                    'p50_ms': round(samples[len(samples) // 2] * 1000, 2),
+                    'p95_ms': round(samples[min(len(samples) - 1, int(len(samples) * 0.95))] * 1000, 2),
+                    'max_ms': round(stats['max_seconds'] * 1000, 2)
+                }
+        return {
+            'config': {
+                'pool_connections': self.pool_connections,
+                'pool_maxsize': self.pool_maxsize,
+                'retries': self.retry.total,
+                'connect_timeout': self.connect_timeout,
+                'read_timeout': self.read_timeout
+            },
+            'hosts': hosts,
+            'pools': self._pool_metrics()
+        }
+
+
+# Global HTTP client shared by weather, notifications and the sync worker
+http_client = HttpClient(
+    pool_maxsize=int(os.environ.get('HTTP_POOL_MAXSIZE', 20)),
+    retries=int(os.environ.get('HTTP_RETRIES', 2)),
+    connect_timeout=float(os.environ.get('HTTP_CONNECT_TIMEOUT', 3.05)),
+    read_timeout=float(os.environ.get('HTTP_READ_TIMEOUT', 10))
+)
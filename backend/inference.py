@@ -0,0 +1,140 @@
+from typing import Any, Dict, List, Sequence, Tuple
+
+try:
+    import numpy as np
+    NUMPY_AVAILABLE = True
+except ImportError:
+    NUMPY_AVAILABLE = False
+    np = None
+
+# Request fields accepted by /api/predict and /api/predict/batch
+REQUIRED_FIELDS = ['crop_type', 'region', 'rainfall', 'temperature', 'soil_ph',
+                   'nitrogen', 'phosphorus', 'potassium', 'sowing_date_offset']
+
+# Request fields that select the model shard and must be strings
+TEXT_FIELDS = ['crop_type', 'region']
+
+# Request fields in the column order the model was trained on (see train_model)
+FEATURE_FIELDS = ['rainfall', 'temperature', 'soil_ph', 'nitrogen', 'phosphorus', 'potassium', 'sowing_date_offset']
+
+# (column, comparison, threshold, message) for every recommendation rule
+RECOMMENDATION_RULES = [
+    ('temperature', '>', 32, "High temperature detected. Increase irrigation frequency and consider shade nets."),
+    ('rainfall', '<', 180, "Low rainfall. Implement drip irrigation or supplemental watering."),
+    ('soil_ph', '<', 6.0, "Soil is acidic. Apply lime to increase pH for better nutrient uptake."),
+    ('soil_ph', '>', 7.5, "Soil is alkaline. Apply sulfur or organic matter to reduce pH."),
+    ('nitrogen', '<', 70, "Nitrogen deficiency. Apply nitrogen-rich fertilizers or compost."),
+    ('phosphorus', '<', 35, "Low phosphorus levels. Apply phosphate fertilizers before flowering."),
+    ('potassium', '<', 55, "Potassium deficiency. Apply potash fertilizers for better fruit quality."),
+    ('prediction', '<', 2.5, "Low yield predicted. Consider crop rotation or soil testing."),
+]
+
+
+def extract_features(data: Dict) -> List[float]:
+    """Convert one request payload into the model feature vector"""
+    return [
+        float(data['rainfall']),
+        float(data['temperature']),
+        float(data['soil_ph']),
+        float(data['nitrogen']),
+        float(data['phosphorus']),
+        float(data['potassium']),
+        int(data['sowing_date_offset'])
+    ]
+
+
+def invalid_text_fields(data: Dict) -> List[str]:
+    """TEXT_FIELDS present in a payload with a non-string value"""
+    return [field for field in TEXT_FIELDS if field in data and not isinstance(data[field], str)]
+
+
+def calculate_risk_level(yield_prediction, recommendations):
+    """Calculate risk level based on yield and recommendations"""
+    if yield_prediction < 2.0 or len(recommendations) >= 3:
+        return 'Red'
+    elif yield_prediction < 2.8 or len(recommendations) >= 2:
+        return 'Yellow'
+    else:
+        return 'Green'
+
+
+def generate_recommendations(data, prediction):
+    """Generate actionable recommendations"""
+    recs = []
+
+    for column, comparison, threshold, message in RECOMMENDATION_RULES:
+        value = prediction if column == 'prediction' else data[column]
+        if (value > threshold) if comparison == '>' else (value < threshold):
+            recs.append(message)
+
+    return recs
+
+
+def build_feature_block(rows: Sequence[Any]) -> Tuple[Any, List[int], Dict[int, str]]:
+    """Validate a batch of payloads as one block.
+
+    Returns the feature matrix for the valid rows, the original index of each
+    matrix row, and an error message for every rejected row.
+    """
+    features = []
+    valid_indices = []
+    errors = {}
+
+    for index, row in enumerate(rows):
+        if not isinstance(row, dict):
+            errors[index] = 'Row must be a JSON object'
+            continue
+        missing_fields = [field for field in REQUIRED_FIELDS if field not in row]
+        if missing_fields:
+            errors[index] = f'Missing required fields: {missing_fields}'
+            continue
+        invalid_fields = invalid_text_fields(row)
+        if invalid_fields:
+            errors[index] = f'Fields must be strings: {invalid_fields}'
+            continue
+        try:
+            features.append(extract_features(row))
+        except (TypeError, ValueError) as e:
+            errors[index] = f'Invalid numeric value: {e}'
+            continue
+        valid_indices.append(index)
+
+    if NUMPY_AVAILABLE:
+        matrix = np.asarray(features, dtype=np.float64).reshape(len(features), len(FEATURE_FIELDS))
+    else:
+        matrix = features
+    return matrix, valid_indices, errors
+
+
+def generate_recommendations_batch(matrix, predictions) -> List[List[str]]:
+    """Evaluate every recommendation rule over whole columns at once"""
+    if not NUMPY_AVAILABLE:
+        return [
+            generate_recommendations(dict(zip(FEATURE_FIELDS, row)), prediction)
+            for row, prediction in zip(matrix, predictions)
+        ]
+
+    matrix = np.asarray(matrix, dtype=np.float64)
+    predictions = np.asarray(predictions, dtype=np.float64)
+    masks = np.empty((len(RECOMMENDATION_RULES), len(predictions)), dtype=bool)
+    for i, (column, comparison, threshold, _) in enumerate(RECOMMENDATION_RULES):
+        values = predictions if column == 'prediction' else matrix[:, FEATURE_FIELDS.index(column)]
+        masks[i] = values > threshold if comparison == '>' else values < threshold
+
+    messages = [rule[3] for rule in RECOMMENDATION_RULES]
+    return [[messages[i] for i in np.flatnonzero(masks[:, row])] for row in range(len(predictions))]
+
+
+def calculate_risk_levels(predictions, recommendations: List[List[str]]) -> List[str]:
+    """Vectorized calculate_risk_level over a batch of predictions"""
+    if not NUMPY_AVAILABLE:
+        return [calculate_risk_level(p, recs) for p, recs in zip(predictions, recommendations)]
+
+    predictions = np.asarray(predictions, dtype=np.float64)
+    counts = np.fromiter((len(recs) for recs in recommendations), dtype=np.int64, count=len(recommendations))
+    levels = np.select(
+        [(predictions < 2.0) | (counts >= 3), (predictions < 2.8) | (counts >= 2)],
+        ['Red', 'Yellow'],
+        default='Green'
+    )
+    return levels.tolist()
@@ -0,0 +1,66 @@
+import threading
+from typing import Any, Callable, Dict, Optional
+
+
+class LazySingleton:
+    """Module-level stand-in for a shared service that is built on first use.
+
+    Attribute access is forwarded to the instance, which is created with
+    factory(**options) the first time it is needed, so importing the module
+    that defines it has no side effects. Options come from the keyword
+    defaults, then configure(), then init_app(app) which maps Flask config
+    keys onto factory arguments:
+
+        offline_cache = LazySingleton(OfflineCache, name='offline_cache',
+                                      config_keys={'OFFLINE_CACHE_PATH': 'db_path'})
+        offline_cache.init_app(app)
+        offline_cache.get_cache_stats()   # OfflineCache is created here
+    """
+
+    def __init__(self, factory: Callable[..., Any], name: str,
+                 config_keys: Optional[Dict[str, str]] = None, **defaults):
+        self._factory = factory
+        self._name = name
+        self._config_keys = config_keys or {}
+        self._options = defaults
+        self._instance = None
+        self._lock = threading.Lock()
+
+    def configure(self, **options):
+        """Override factory arguments; only allowed before the instance exists"""
+        if not options:
+            return
+        with self._lock:
+            if self._instance is not None:
+                raise RuntimeError(f'{self._name} is already initialized')
+            self._options.update(options)
+
+    def init_app(self, app):
+        """Take factory arguments from app.config and register as a Flask extension"""
+        self.configure(**{
+            argument: app.config[key] for key, argument in self._config_keys.items() if key in app.config
+        })
+        app.extensions[self._name] = self
+
+    def get(self) -> Any:
+        instance = self._instance
+        if instance is None:
+            with self._lock:
+                if self._instance is None:
+                    self._instance = self._factory(**self._options)
+                instance = self._instance
+        return instance
+
+    @property
+    def initialized(self) -> bool:
+        return self._instance is not None
+
+    def __getattr__(self, name: str) -> Any:
+        # Only reached for attributes not defined on the proxy itself
+        if name.startswith('_'):
+            raise AttributeError(name)
+        return getattr(self.get(), name)
+
+    def __repr__(self) -> str:
+        state = 'initialized' if self.initialized else 'not initialized'
+        return f'<LazySingleton {self._name} ({state})>'
@@ -0,0 +1,377 @@
+import hashlib
+import io
+import json
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Sequence
+
+try:
+    import numpy as np
+    NUMPY_AVAILABLE = True
+except ImportError:
+    NUMPY_AVAILABLE = False
+    np = None
+
+MODEL_PATH = 'crop_yield_model.pkl'
+SIMPLE_MODEL_PATH = 'simple_model.json'
+FOREST_PATH = 'crop_yield_forest.npz'
+
+FEATURE_NAMES = ['rainfall', 'temperature', 'soil_ph', 'nitrogen', 'phosphorus', 'potassium', 'sowing_offset']
+
+
+def forest_path_for(model_path: str) -> str:
+    """Compiled forest published next to a pickled model: FOREST_PATH for the served model, else <stem>.npz"""
+    if model_path == MODEL_PATH:
+        return FOREST_PATH
+    return f'{os.path.splitext(model_path)[0]}.npz'
+
+
+def simple_predict(features, model_data):
+    """Make prediction using simple linear model"""
+    prediction = model_data['intercept']
+    
+    for i, feature_name in enumerate(FEATURE_NAMES):
+        prediction += features[i] * model_data['coefficients'][feature_name]
+    
+    return max(0.5, prediction)  # Ensure minimum yield
+
+
+class LoadedModel:
+    """A model held in memory together with the file signature it was loaded from"""
+
+    def __init__(self, kind: str, estimator: Any, path: Optional[str], signature: Optional[tuple],
+                 digest: Optional[str], load_seconds: float, size_bytes: int = 0):
+        self.kind = kind  # 'compiled_forest', 'sklearn', 'simple_linear' or 'fallback'
+        self.estimator = estimator
+        self.path = path
+        self.signature = signature
+        self.digest = digest
+        self.load_seconds = load_seconds
+        self.size_bytes = size_bytes
+        self.loaded_at = time.time()
+
+    @property
+    def version(self) -> str:
+        """Short content hash identifying the model currently served"""
+        return f"{self.kind}:{self.digest[:12]}" if self.digest else self.kind
+
+    def predict_one(self, features: Sequence[float]) -> float:
+        """Predict the yield for a single feature vector"""
+        return self.predict_many([features])[0]
+
+    def predict_many(self, rows: Sequence[Sequence[float]]) -> List[float]:
+        """Predict the yield for a block of feature vectors with one model call"""
+        if not len(rows):
+            return []
+
+        if self.kind in ('compiled_forest', 'sklearn'):
+            return [float(value) for value in self.estimator.predict(rows)]
+
+        if self.kind == 'simple_linear':
+            if NUMPY_AVAILABLE:
+                coefficients = np.array([self.estimator['coefficients'][name] for name in FEATURE_NAMES])
+                block = np.asarray(rows, dtype=np.float64)
+                return np.maximum(0.5, block @ coefficients + self.estimator['intercept']).tolist()
+            return [simple_predict(row, self.estimator) for row in rows]
+
+        # Fallback prediction when no model file is available
+        return [2.0 + (row[0] * 0.005) + (row[1] * 0.02) + (row[2] * 0.2) for row in rows]
+
+    def info(self) -> Dict[str, Any]:
+        """Describe the loaded model for health and debug endpoints"""
+        return {
+            'kind': self.kind,
+            'version': self.version,
+            'path': self.path,
+            'load_seconds': round(self.load_seconds, 4),
+            'memory_bytes': self.size_bytes,
+            'loaded_at': self.loaded_at
+        }
+
+
+class ModelRegistry:
+    """Keeps the yield model resident in memory and reloads it only when the file changes"""
+
+    def __init__(self, model_path: Optional[str] = MODEL_PATH, simple_model_path: Optional[str] = SIMPLE_MODEL_PATH,
+                 forest_path: Optional[str] = FOREST_PATH, check_interval: float = 1.0):
+        self.model_path = model_path
+        self.simple_model_path = simple_model_path
+        self.forest_path = forest_path
+        self.check_interval = check_interval
+        self._lock = threading.Lock()
+        self._model: Optional[LoadedModel] = None
+        self._last_check = 0.0
+        self._failed: Dict[str, tuple] = {}
+        self.reload_count = 0
+
+    def get_model(self) -> LoadedModel:
+        """Return the resident model, reloading it if the file on disk was replaced"""
+        model = self._model
+        now = time.monotonic()
+        if model is not None and now - self._last_check < self.check_interval:
+            return model
+
+        with self._lock:
+            if self._model is not None and now - self._last_check < self.check_interval:
+                return self._model
+            self._last_check = now
+
+            for path, signature in self._sources():
+                if self._failed.get(path) == signature:
+                    continue
+                if self._model is not None and self._model.path == path and self._model.signature == signature:
+                    break
+                loaded = self._load(path, signature, self._model)
+                if loaded is not None:
+                    self._model = loaded
+                    break
+                self._failed[path] = signature
+
+            if self._model is None:
+                self._model = LoadedModel('fallback', None, None, None, None, 0.0)
+            return self._model
+
+    @property
+    def version(self) -> str:
+        return self.get_model().version
+
+    def invalidate(self):
+        """Force the next access to re-check the model files"""
+        with self._lock:
+            self._last_check = 0.0
+
+    def _sources(self) -> List[tuple]:
+        """Model files in order of preference with their (mtime, size) signatures"""
+        found = {}
+        for path in (self.forest_path, self.model_path, self.simple_model_path):
+            if path is None:
+                continue
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            found[path] = (stat.st_mtime_ns, stat.st_size)
+
+        # A compiled forest older than the pickle it was exported from is stale
+        if self.forest_path in found and self.model_path in found \
+                and found[self.forest_path][0] < found[self.model_path][0]:
+            del found[self.forest_path]
+        return list(found.items())
+
+    def _load(self, path: str, signature: tuple, previous: Optional[LoadedModel]) -> Optional[LoadedModel]:
+        started = time.perf_counter()
+        try:
+            with open(path, 'rb') as f:
+                payload = f.read()
+        except OSError as e:
+            print(f"Error reading model file {path}: {e}")
+            return None
+
+        digest = hashlib.sha256(payload).hexdigest()
+        if previous is not None and previous.path == path and previous.digest == digest:
+            # Touched but not changed, keep the resident estimator
+            previous.signature = signature
+            return previous
+
+        try:
+            if path == self.forest_path:
+                from forest_compiler import CompiledForest
+                estimator = CompiledForest.load(payload)
+                kind = 'compiled_forest'
+                size_bytes = estimator.nbytes
+            elif path == self.model_path:
+                import joblib
+                estimator = joblib.load(io.BytesIO(payload))
+                kind = 'sklearn'
+                # The pickle size is a close proxy for the in-memory tree arrays
+                size_bytes = len(payload)
+            else:
+                estimator = json.loads(payload.decode('utf-8'))
+                kind = 'simple_linear'
+                size_bytes = len(payload)
+        except Exception as e:
+            print(f"Error loading model from {path}: {e}")
+            return None
+
+        self.reload_count += 1
+        loaded = LoadedModel(kind, estimator, path, signature, digest, time.perf_counter() - started, size_bytes)
+        print(f"Loaded {kind} model from {path} ({loaded.version}) in {loaded.load_seconds * 1000:.1f} ms")
+        return loaded
+
+
+# States grouped into agro-climatic clusters that share a shard model
+REGION_CLUSTERS = {
+    'north': ['punjab', 'haryana', 'delhi', 'uttar pradesh', 'himachal pradesh', 'uttarakhand', 'jammu'],
+    'east': ['bihar', 'west bengal', 'odisha', 'jharkhand', 'assam'],
+    'south': ['tamil nadu', 'karnataka', 'kerala', 'andhra pradesh', 'telangana'],
+    'west': ['maharashtra', 'gujarat', 'rajasthan', 'goa'],
+    'central': ['madhya pradesh', 'chhattisgarh']
+}
+
+MODEL_SHARD_DIR = os.environ.get('MODEL_SHARD_DIR', 'models')
+
+# Wildcard used for "any region" shards and for regions outside REGION_CLUSTERS
+ANY_CLUSTER = 'all'
+
+
+def region_cluster(region: Optional[str]) -> str:
+    """Map a free-text region to its cluster name"""
+    region_lower = str(region or '').lower()
+    for cluster, states in REGION_CLUSTERS.items():
+        for state in states:
+            if state in region_lower:
+                return cluster
+    return ANY_CLUSTER
+
+
+def shard_key(crop_type: Optional[str], region: Optional[str]) -> tuple:
+    """(crop, cluster); the crop is reduced to [a-z0-9_] without '__', so it is safe as a file name"""
+    crop = re.sub(r'[^a-z0-9]+', '_', str(crop_type or '').lower()).strip('_')
+    return (crop, region_cluster(region))
+
+
+def shard_file_stem(key: tuple) -> str:
+    return f"{key[0]}__{key[1]}"
+
+
+class ModelFamily:
+    """Per (crop_type, region-cluster) models with a fallback chain to the global model.
+
+    Shards live in MODEL_SHARD_DIR as <crop>__<cluster>.npz / .pkl, are loaded
+    lazily on first use and evicted least-recently-used once the shard count or
+    the total memory budget is exceeded. The global registry is never evicted.
+    """
+
+    def __init__(self, global_registry: ModelRegistry, shard_dir: str = MODEL_SHARD_DIR,
+                 max_shards: int = 32, max_bytes: int = 256 * 1024 * 1024, check_interval: float = 5.0):
+        self.global_registry = global_registry
+        self.shard_dir = shard_dir
+        self.max_shards = max_shards
+        self.max_bytes = max_bytes
+        self.check_interval = check_interval
+        self._lock = threading.Lock()
+        self._shards: 'OrderedDict[tuple, ModelRegistry]' = OrderedDict()
+        self._hits: Dict[tuple, int] = {}
+        self._available: set = set()
+        self._last_scan = 0.0
+        self.evictions = 0
+
+    def _available_shards(self) -> set:
+        """Shard keys present on disk, rescanned at most every check_interval"""
+        now = time.monotonic()
+        if now - self._last_scan >= self.check_interval:
+            available = set()
+            try:
+                for name in os.listdir(self.shard_dir):
+                    stem, ext = os.path.splitext(name)
+                    if ext in ('.npz', '.pkl') and '__' in stem:
+                        available.add(tuple(stem.split('__', 1)))
+            except OSError:
+                pass
+            self._available = available
+            self._last_scan = now
+        return self._available
+
+    def resolve(self, crop_type: Optional[str], region: Optional[str]) -> Optional[tuple]:
+        """First shard in the chain (crop, cluster) -> (crop, all) that exists, else None"""
+        crop, cluster = shard_key(crop_type, region)
+        available = self._available_shards()
+        for key in ((crop, cluster), (crop, ANY_CLUSTER)):
+            if key in available:
+                return key
+        return None
+
+    def get_model(self, crop_type: Optional[str] = None, region: Optional[str] = None) -> LoadedModel:
+        key = self.resolve(crop_type, region)
+        if key is None:
+            return self.global_registry.get_model()
+
+        with self._lock:
+            registry = self._shards.get(key)
+            if registry is None:
+                stem = os.path.join(self.shard_dir, shard_file_stem(key))
+                registry = ModelRegistry(model_path=f'{stem}.pkl', simple_model_path=None,
+                                         forest_path=f'{stem}.npz', check_interval=self.check_interval)
+                self._shards[key] = registry
+            self._shards.move_to_end(key)
+            self._hits[key] = self._hits.get(key, 0) + 1
+
+        model = registry.get_model()
+        if model.kind == 'fallback':
+            return self.global_registry.get_model()
+        self._evict()
+        return model
+
+    def predict_many(self, rows, crop_types: Sequence[str], regions: Sequence[str]):
+        """Route every row to its shard and call each model once on its group.
+
+        Returns the predictions and the version of the model used for each row.
+        """
+        groups: Dict[int, List[int]] = {}
+        models: Dict[int, LoadedModel] = {}
+        resolved: Dict[tuple, LoadedModel] = {}
+        for position, pair in enumerate(zip(crop_types, regions)):
+            model = resolved.get(pair)
+            if model is None:
+                model = resolved[pair] = self.get_model(*pair)
+            models[id(model)] = model
+            groups.setdefault(id(model), []).append(position)
+
+        predictions: List[float] = [0.0] * len(crop_types)
+        versions: List[str] = [''] * len(crop_types)
+        for model_id, positions in groups.items():
+            model = models[model_id]
+            if NUMPY_AVAILABLE:
+                block = np.asarray(rows)[positions]
+            else:
+                block = [rows[position] for position in positions]
+            for position, prediction in zip(positions, model.predict_many(block)):
+                predictions[position] = prediction
+                versions[position] = model.version
+        return predictions, versions
+
+    def _evict(self):
+        with self._lock:
+            while len(self._shards) > 1 and (
+                len(self._shards) > self.max_shards or self._memory_bytes() > self.max_bytes
+            ):
+                key, _ = self._shards.popitem(last=False)
+                self._hits.pop(key, None)
+                self.evictions += 1
+
+    def _memory_bytes(self) -> int:
+        return sum(r._model.size_bytes for r in self._shards.values() if r._model is not None)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            shards = []
+            for key, registry in self._shards.items():
+                model = registry._model
+                if model is None:
+                    continue
+                info = model.info()
+                info.update({'shard': shard_file_stem(key), 'hits': self._hits.get(key, 0)})
+                shards.append(info)
+            return {
+                'global': self.global_registry.get_model().info(),
+                'resident_shards': shards,
+                'available_shards': sorted(shard_file_stem(key) for key in self._available_shards()),
+                'memory_bytes': self._memory_bytes(),
+                'max_bytes': self.max_bytes,
+                'max_shards': self.max_shards,
+                'evictions': self.evictions
+            }
+
+
+# Global model registry instance
+model_registry = ModelRegistry()
+
+# Per-crop/per-region shards falling back to model_registry
+model_family = ModelFamily(
+    model_registry,
+    max_shards=int(os.environ.get('MODEL_SHARD_MAX', 32)),
+    max_bytes=int(os.environ.get('MODEL_SHARD_MAX_BYTES', 256 * 1024 * 1024))
+)
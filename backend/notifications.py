@@ -1,40 +1,51 @@
 import os
-import requests
 import json
 from datetime import datetime
 from typing import Dict, List, Optional
 
+from http_client import HttpClient, http_client
+from lazy_singleton import LazySingleton
+
+# Message templates per notification type and language
+NOTIFICATION_TEMPLATES = {
+    'high_risk': {
+        'en': '🚨 HIGH RISK ALERT: Your {crop} crop in {region} shows {risk_level} risk. Predicted yield: {predicted_yield} tons/ha. Check recommendations immediately.',
+        'hi': '🚨 उच्च जोखिम चेतावनी: आपकी {crop} फसल {region} में {risk_level} जोखिम दिखा रही है। अनुमानित उपज: {predicted_yield} टन/हेक्टेयर। तुरंत सिफारिशें देखें।',
+        'ta': '🚨 உயர் ஆபத்து எச்சரிக்கை: உங்கள் {crop} பயிர் {region} இல் {risk_level} ஆபத்து காட்டுகிறது. கணிக்கப்பட்ட விளைச்சல்: {predicted_yield} டன்/ஹெக்டேர். உடனடியாக பரிந்துரைகளை பாருங்கள்.'
+    },
+    'weather_alert': {
+        'en': '🌦️ WEATHER ALERT: {weather_desc} in {region}. Temperature: {temp}°C, Rainfall: {rainfall}mm. Adjust farming practices accordingly.',
+        'hi': '🌦️ मौसम चेतावनी: {region} में {weather_desc}। तापमान: {temp}°C, वर्षा: {rainfall}mm। तदनुसार खेती के तरीकों को समायोजित करें।',
+        'ta': '🌦️ வானிலை எச்சரிக்கை: {region} இல் {weather_desc}। வெப்பநிலை: {temp}°C, மழைப்பொழிவு: {rainfall}mm. அதற்கேற்ப விவசாய நடைமுறைகளை சரிசெய்யவும்.'
+    },
+    'yield_update': {
+        'en': '📊 YIELD UPDATE: Your {crop} crop prediction updated. New yield: {predicted_yield} tons/ha. Risk level: {risk_level}.',
+        'hi': '📊 उपज अपडेट: आपकी {crop} फसल की भविष्यवाणी अपडेट की गई। नई उपज: {predicted_yield} टन/हेक्टेयर। जोखिम स्तर: {risk_level}।',
+        'ta': '📊 விளைச்சல் புதுப்பிப்பு: உங்கள் {crop} பயிர் கணிப்பு புதுப்பிக்கப்பட்டது. புதிய விளைச்சல்: {predicted_yield} டன்/ஹெக்டேர். ஆபத்து நிலை: {risk_level}.'
+    }
+}
+
+
 class NotificationService:
     """Service for sending notifications via SMS, WhatsApp, and push notifications"""
     
-    def __init__(self):
+    def __init__(self, twilio_account_sid: Optional[str] = None, twilio_auth_token: Optional[str] = None,
+                 twilio_phone_number: Optional[str] = None, firebase_server_key: Optional[str] = None,
+                 firebase_project_id: Optional[str] = None, http: Optional[HttpClient] = None):
         # Twilio configuration for SMS/WhatsApp
-        self.twilio_account_sid = os.getenv('TWILIO_ACCOUNT_SID', 'your-twilio-account-sid')
-        self.twilio_auth_token = os.getenv('TWILIO_AUTH_TOKEN', 'your-twilio-auth-token')
-        self.twilio_phone_number = os.getenv('TWILIO_PHONE_NUMBER', '+1234567890')
+        self.twilio_account_sid = twilio_account_sid or os.getenv('TWILIO_ACCOUNT_SID', 'your-twilio-account-sid')
+        self.twilio_auth_token = twilio_auth_token or os.getenv('TWILIO_AUTH_TOKEN', 'your-twilio-auth-token')
+        self.twilio_phone_number = twilio_phone_number or os.getenv('TWILIO_PHONE_NUMBER', '+1234567890')
         
         # Firebase configuration for push notifications
-        self.firebase_server_key = os.getenv('FIREBASE_SERVER_KEY', 'your-firebase-server-key')
-        self.firebase_project_id = os.getenv('FIREBASE_PROJECT_ID', 'your-firebase-project-id')
+        self.firebase_server_key = firebase_server_key or os.getenv('FIREBASE_SERVER_KEY', 'your-firebase-server-key')
+        self.firebase_project_id = firebase_project_id or os.getenv('FIREBASE_PROJECT_ID', 'your-firebase-project-id')
         
         # Notification templates
-        self.templates = {
-            'high_risk': {
-                'en': '🚨 HIGH RISK ALERT: Your {crop} crop in {region} shows {risk_level} risk. Predicted yield: {predicted_yield} tons/ha. Check recommendations immediately.',
-                'hi': '🚨 उच्च जोखिम चेतावनी: आपकी {crop} फसल {region} में {risk_level} जोखिम दिखा रही है। अनुमानित उपज: {predicted_yield} टन/हेक्टेयर। तुरंत सिफारिशें देखें।',
-                'ta': '🚨 உயர் ஆபத்து எச்சரிக்கை: உங்கள் {crop} பயிர் {region} இல் {risk_level} ஆபத்து காட்டுகிறது. கணிக்கப்பட்ட விளைச்சல்: {predicted_yield} டன்/ஹெக்டேர். உடனடியாக பரிந்துரைகளை பாருங்கள்.'
-            },
-            'weather_alert': {
-                'en': '🌦️ WEATHER ALERT: {weather_desc} in {region}. Temperature: {temp}°C, Rainfall: {rainfall}mm. Adjust farming practices accordingly.',
-                'hi': '🌦️ मौसम चेतावनी: {region} में {weather_desc}। तापमान: {temp}°C, वर्षा: {rainfall}mm। तदनुसार खेती के तरीकों को समायोजित करें।',
-                'ta': '🌦️ வானிலை எச்சரிக்கை: {region} இல் {weather_desc}। வெப்பநிலை: {temp}°C, மழைப்பொழிவு: {rainfall}mm. அதற்கேற்ப விவசாய நடைமுறைகளை சரிசெய்யவும்.'
-            },
-            'yield_update': {
-                'en': '📊 YIELD UPDATE: Your {crop} crop prediction updated. New yield: {predicted_yield} tons/ha. Risk level: {risk_level}.',
-                'hi': '📊 उपज अपडेट: आपकी {crop} फसल की भविष्यवाणी अपडेट की गई। नई उपज: {predicted_yield} टन/हेक्टेयर। जोखिम स्तर: {risk_level}।',
-                'ta': '📊 விளைச்சல் புதுப்பிப்பு: உங்கள் {crop} பயிர் கணிப்பு புதுப்பிக்கப்பட்டது. புதிய விளைச்சல்: {predicted_yield} டன்/ஹெக்டேர். ஆபத்து நிலை: {risk_level}.'
-            }
-        }
+        self.templates = NOTIFICATION_TEMPLATES
+        
+        # Pooled keep-alive connections shared with the other outbound callers
+        self.http = http or http_client
     
     def send_sms(self, phone_number: str, message: str) -> Dict:
         """Send SMS using Twilio"""
@@ -49,11 +60,10 @@ class NotificationService:
                 'Body': message
             }
             
-            response = requests.post(
+            response = self.http.post(
                 url,
                 data=payload,
-                auth=(self.twilio_account_sid, self.twilio_auth_token),
-                timeout=10
+                auth=(self.twilio_account_sid, self.twilio_auth_token)
             )
             
             if response.status_code == 201:
@@ -81,11 +91,10 @@ class NotificationService:
                 'Body': message
             }
             
-            response = requests.post(
+            response = self.http.post(
                 url,
                 data=payload,
-                auth=(self.twilio_account_sid, self.twilio_auth_token),
-                timeout=10
+                auth=(self.twilio_account_sid, self.twilio_auth_token)
             )
             
             if response.status_code == 201:
@@ -119,7 +128,7 @@ class NotificationService:
                 'data': data or {}
             }
             
-            response = requests.post(url, headers=headers, json=payload, timeout=10)
+            response = self.http.post(url, headers=headers, json=payload)
             
             if response.status_code == 200:
                 result = response.json()
@@ -262,5 +271,15 @@ class NotificationService:
         
         return results
 
-# Global notification service instance
-notification_service = NotificationService()
+# Global notification service, created on first use; app.py passes its config through init_app
+notification_service = LazySingleton(
+    NotificationService,
+    name='notification_service',
+    config_keys={
+        'TWILIO_ACCOUNT_SID': 'twilio_account_sid',
+        'TWILIO_AUTH_TOKEN': 'twilio_auth_token',
+        'TWILIO_PHONE_NUMBER': 'twilio_phone_number',
+        'FIREBASE_SERVER_KEY': 'firebase_server_key',
+        'FIREBASE_PROJECT_ID': 'firebase_project_id'
+    }
+)
@@ -1,262 +1,1025 @@
 import sqlite3
 import json
 import os
+import random
 from datetime import datetime, timedelta
-from typing import Dict, List, Optional, Any
+from typing import Dict, Iterable, Iterator, List, Optional, Any, Tuple
+import atexit
 import threading
 import time
+import queue
+from contextlib import contextmanager
+
+from lazy_singleton import LazySingleton
+from payload_codec import build_codecs, decode_payload
+
+# Read paths, shared with explain_query_plans so the plans checked are the ones executed
+CACHED_PREDICTIONS_SQL = '''
+    SELECT data, created_at FROM offline_predictions
+    WHERE user_id = ? AND synced = FALSE
+    ORDER BY created_at DESC
+    LIMIT ?
+'''
+
+# Keyset page over a user's unsynced predictions; (created_at, id) follows idx_offline_predictions_unsynced
+UNSYNCED_PREDICTIONS_PAGE_SQL = '''
+    SELECT id, data, created_at FROM offline_predictions
+    WHERE user_id = ? AND synced = FALSE AND (created_at, id) > (?, ?)
+    ORDER BY created_at, id
+    LIMIT ?
+'''
+
+CACHED_WEATHER_SQL = '''
+    SELECT data, created_at, expires_at FROM offline_weather
+    WHERE region_key = ? AND expires_at > ?
+'''
+
+WEATHER_HISTORY_SQL = '''
+    SELECT data, created_at, expires_at FROM offline_weather_history
+    WHERE region_key = ?
+    ORDER BY created_at DESC
+    LIMIT ?
+'''
+
+CACHED_USER_DATA_SQL = '''
+    SELECT data, created_at FROM offline_user_data
+    WHERE user_id = ? AND data_type = ? AND synced = FALSE
+    ORDER BY created_at DESC
+'''
+
+# Entries that are due and not leased by a worker; exhausted entries live in sync_dead_letter.
+# Ready entries have both columns NULL, so idx_sync_queue_ready serves the filter and the order;
+# RELEASE_EXPIRED_LEASES_SQL and PROMOTE_DUE_RETRIES_SQL move entries back into that state.
+SYNC_QUEUE_SQL = '''
+    SELECT id, operation, endpoint, data, priority, retry_count, created_at
+    FROM sync_queue
+    WHERE next_attempt_at IS NULL AND leased_until IS NULL
+    ORDER BY priority DESC, created_at ASC
+    LIMIT ?
+'''
+
+RELEASE_EXPIRED_LEASES_SQL = '''
+    UPDATE sync_queue SET leased_until = NULL, lease_owner = NULL
+    WHERE leased_until IS NOT NULL AND leased_until < ?
+'''
+
+PROMOTE_DUE_RETRIES_SQL = '''
+    UPDATE sync_queue SET next_attempt_at = NULL
+    WHERE next_attempt_at IS NOT NULL AND next_attempt_at <= ?
+'''
+
+DEAD_LETTER_SQL = '''
+    INSERT INTO sync_dead_letter
+        (queue_id, operation, endpoint, data, priority, retry_count, created_at, failed_at, last_error)
+    SELECT id, operation, endpoint, data, priority, retry_count, created_at, ?, ?
+    FROM sync_queue WHERE id = ?
+'''
+
+INSERT_PREDICTION_SQL = '''
+    INSERT INTO offline_predictions (user_id, data, created_at)
+    VALUES (?, ?, ?)
+'''
+
+# One row per region: a newer snapshot replaces the previous one in place
+UPSERT_WEATHER_SQL = '''
+    INSERT INTO offline_weather (region, region_key, data, created_at, expires_at)
+    VALUES (?, ?, ?, ?, ?)
+    ON CONFLICT (region_key) DO UPDATE SET
+        region = excluded.region,
+        data = excluded.data,
+        created_at = excluded.created_at,
+        expires_at = excluded.expires_at,
+        synced = FALSE
+'''
+
+INSERT_WEATHER_HISTORY_SQL = '''
+    INSERT INTO offline_weather_history (region_key, data, created_at, expires_at)
+    VALUES (?, ?, ?, ?)
+'''
+
+INSERT_USER_DATA_SQL = '''
+    INSERT INTO offline_user_data (user_id, data_type, data, created_at)
+    VALUES (?, ?, ?, ?)
+'''
+
+INSERT_SYNC_QUEUE_SQL = '''
+    INSERT INTO sync_queue (operation, endpoint, data, priority, created_at)
+    VALUES (?, ?, ?, ?, ?)
+'''
+
+# Shared weather tier: a generation counter lets every worker notice a cache clear
+WEATHER_GENERATION_SQL = "SELECT value FROM cache_counters WHERE name = 'weather_generation'"
+
+BUMP_WEATHER_GENERATION_SQL = '''
+    INSERT INTO cache_counters (name, value) VALUES ('weather_generation', 1)
+    ON CONFLICT (name) DO UPDATE SET value = value + 1
+'''
+
+CACHE_SETTING_SQL = 'SELECT value FROM cache_settings WHERE name = ?'
+
+UPSERT_CACHE_SETTING_SQL = '''
+    INSERT INTO cache_settings (name, value, updated_at) VALUES (?, ?, ?)
+    ON CONFLICT (name) DO UPDATE SET value = excluded.value, updated_at = excluded.updated_at
+'''
+
+HOT_QUERIES = {
+    'cached_predictions': (CACHED_PREDICTIONS_SQL, (1, 10)),
+    'unsynced_predictions_page': (UNSYNCED_PREDICTIONS_PAGE_SQL, (1, '', 0, 500)),
+    'cached_weather': (CACHED_WEATHER_SQL, ('punjab', '2000-01-01')),
+    'weather_history': (WEATHER_HISTORY_SQL, ('punjab', 24)),
+    'cached_user_data': (CACHED_USER_DATA_SQL, (1, 'profile')),
+    'sync_queue': (SYNC_QUEUE_SQL, (50,)),
+    'sync_release_leases': (RELEASE_EXPIRED_LEASES_SQL, ('2000-01-01',)),
+    'sync_promote_retries': (PROMOTE_DUE_RETRIES_SQL, ('2000-01-01',)),
+}
+
+# Exact statistics in one statement; also used to reconcile the counter table
+EXACT_STATS_SQL = '''
+    SELECT p.total, p.unsynced, w.total, w.valid, q.total, u.total, u.unsynced
+    FROM (SELECT COUNT(*) AS total, COALESCE(SUM(synced = FALSE), 0) AS unsynced FROM offline_predictions) p,
+         (SELECT COUNT(*) AS total, COALESCE(SUM(expires_at > ?), 0) AS valid FROM offline_weather) w,
+         (SELECT COUNT(*) AS total FROM sync_queue) q,
+         (SELECT COUNT(*) AS total, COALESCE(SUM(synced = FALSE), 0) AS unsynced FROM offline_user_data) u
+'''
+
+# Counter rows maintained by triggers; valid_weather depends on the clock so it is
+# counted through idx_offline_weather_expires instead
+STATS_FIELDS = [
+    'total_predictions', 'unsynced_predictions', 'total_weather', 'valid_weather',
+    'pending_sync', 'total_user_data', 'unsynced_user_data'
+]
+COUNTER_NAMES = [name for name in STATS_FIELDS if name != 'valid_weather']
+
+
+def _counter_triggers(table: str, total: str, unsynced: Optional[str] = None) -> List[str]:
+    """AFTER INSERT/DELETE (and UPDATE OF synced) triggers keeping cache_counters exact"""
+    def bump(name, delta):
+        return f"UPDATE cache_counters SET value = value + ({delta}) WHERE name = '{name}';"
+
+    insert = [bump(total, 1)]
+    delete = [bump(total, -1)]
+    statements = []
+    if unsynced:
+        insert.append(bump(unsynced, 'COALESCE(NEW.synced = FALSE, 0)'))
+        delete.append(bump(unsynced, '-COALESCE(OLD.synced = FALSE, 0)'))
+        statements.append(f'''
+        CREATE TRIGGER IF NOT EXISTS trg_{table}_count_update AFTER UPDATE OF synced ON {table}
+        BEGIN
+            {bump(unsynced, 'COALESCE(NEW.synced = FALSE, 0) - COALESCE(OLD.synced = FALSE, 0)')}
+        END
+        ''')
+    statements.append(f'''
+        CREATE TRIGGER IF NOT EXISTS trg_{table}_count_insert AFTER INSERT ON {table}
+        BEGIN
+            {' '.join(insert)}
+        END
+        ''')
+    statements.append(f'''
+        CREATE TRIGGER IF NOT EXISTS trg_{table}_count_delete AFTER DELETE ON {table}
+        BEGIN
+            {' '.join(delete)}
+        END
+        ''')
+    return statements
+
+
+def _seed_counters(conn: sqlite3.Connection):
+    """Initialize cache_counters from the rows already present"""
+    row = conn.execute(EXACT_STATS_SQL, (datetime.now(),)).fetchone()
+    values = dict(zip(STATS_FIELDS, row))
+    conn.executemany(
+        'INSERT OR REPLACE INTO cache_counters (name, value) VALUES (?, ?)',
+        [(name, values[name]) for name in COUNTER_NAMES]
+    )
+
+
+# mark_synced table names
+SYNCED_TABLES = {
+    'predictions': 'offline_predictions',
+    'weather': 'offline_weather',
+    'user_data': 'offline_user_data'
+}
+
+# Default retention in days per table, applied by purge_expired:
+# weather rows past expires_at, synced predictions/user data by age,
+# and sync queue entries that exhausted their retries
+DEFAULT_RETENTION = {
+    'offline_weather': 0,
+    'offline_weather_history': 7,
+    'offline_predictions': 30,
+    'offline_user_data': 30,
+    'sync_dead_letter': 30
+}
+
+# Rows eligible for deletion once older than the cutoff bound to ?
+RETENTION_RULES = {
+    'offline_weather': 'expires_at < ?',
+    'offline_weather_history': 'created_at < ?',
+    'offline_predictions': 'synced = TRUE AND created_at < ?',
+    'offline_user_data': 'synced = TRUE AND created_at < ?',
+    'sync_dead_letter': 'failed_at < ?'
+}
+
+# Sync attempts before an entry is moved to sync_dead_letter
+MAX_SYNC_RETRIES = 3
+
+
+def normalize_region(region: Any) -> str:
+    """Cache key for a region name: case- and whitespace-insensitive"""
+    return ' '.join(str(region).split()).lower()
+
+
+def _key_weather_by_region(conn: sqlite3.Connection):
+    """Fill region_key and keep only the newest snapshot per key"""
+    conn.execute('ALTER TABLE offline_weather ADD COLUMN region_key TEXT')
+    rows = conn.execute('SELECT id, region FROM offline_weather').fetchall()
+    conn.executemany('UPDATE offline_weather SET region_key = ? WHERE id = ?',
+                     [(normalize_region(region), row_id) for row_id, region in rows])
+    conn.execute('''
+        DELETE FROM offline_weather
+        WHERE id NOT IN (
+            SELECT id FROM (
+                SELECT id, ROW_NUMBER() OVER (
+                    PARTITION BY region_key ORDER BY created_at DESC, id DESC
+                ) AS newest
+                FROM offline_weather
+            ) WHERE newest = 1
+        )
+    ''')
+
+
+def _move_exhausted_sync_entries(conn: sqlite3.Connection):
+    """Entries the old code filtered out with retry_count < 3 become dead letters"""
+    now = datetime.now()
+    ids = [row[0] for row in conn.execute('SELECT id FROM sync_queue WHERE retry_count >= ?', (MAX_SYNC_RETRIES,))]
+    for queue_id in ids:
+        conn.execute(DEAD_LETTER_SQL, (now, 'Retry limit reached', queue_id))
+        conn.execute('DELETE FROM sync_queue WHERE id = ?', (queue_id,))
+
+
+# Ordered schema migrations; migration N (1-based) is recorded in PRAGMA user_version.
+# Each step is an SQL statement or a callable taking the connection.
+SCHEMA_MIGRATIONS = [
+    # v1: base tables
+    [
+        '''
+        CREATE TABLE IF NOT EXISTS offline_predictions (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER,
+            data TEXT NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            synced BOOLEAN DEFAULT FALSE,
+            sync_attempts INTEGER DEFAULT 0
+        )
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS offline_weather (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            region TEXT NOT NULL,
+            data TEXT NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            expires_at TIMESTAMP,
+            synced BOOLEAN DEFAULT FALSE
+        )
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS offline_user_data (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER,
+            data_type TEXT NOT NULL,
+            data TEXT NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            synced BOOLEAN DEFAULT FALSE
+        )
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS sync_queue (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            operation TEXT NOT NULL,
+            endpoint TEXT NOT NULL,
+            data TEXT NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            priority INTEGER DEFAULT 1,
+            retry_count INTEGER DEFAULT 0
+        )
+        ''',
+    ],
+    # v2: indexes matching the read paths above
+    [
+        # Partial index: only unsynced rows are ever listed per user
+        '''
+        CREATE INDEX IF NOT EXISTS idx_offline_predictions_unsynced
+        ON offline_predictions (user_id, created_at)
+        WHERE synced = FALSE
+        ''',
+        # Walk a region newest-first and test expires_at from the index before touching the row
+        '''
+        CREATE INDEX IF NOT EXISTS idx_offline_weather_region_created
+        ON offline_weather (region, created_at, expires_at)
+        ''',
+        '''
+        CREATE INDEX IF NOT EXISTS idx_offline_user_data_unsynced
+        ON offline_user_data (user_id, data_type, created_at)
+        WHERE synced = FALSE
+        ''',
+        # Matches ORDER BY priority DESC, created_at ASC so the queue is read without a sort
+        '''
+        CREATE INDEX IF NOT EXISTS idx_sync_queue_pending
+        ON sync_queue (priority DESC, created_at)
+        WHERE retry_count < 3
+        ''',
+    ],
+    # v3: trigger-maintained row counters for get_cache_stats
+    [
+        '''
+        CREATE TABLE IF NOT EXISTS cache_counters (
+            name TEXT PRIMARY KEY,
+            value INTEGER NOT NULL DEFAULT 0
+        ) WITHOUT ROWID
+        ''',
+        'CREATE INDEX IF NOT EXISTS idx_offline_weather_expires ON offline_weather (expires_at)',
+        _seed_counters,
+    ]
+    + _counter_triggers('offline_predictions', 'total_predictions', 'unsynced_predictions')
+    + _counter_triggers('offline_weather', 'total_weather')
+    + _counter_triggers('sync_queue', 'pending_sync')
+    + _counter_triggers('offline_user_data', 'total_user_data', 'unsynced_user_data'),
+    # v4: let the retention purge find synced rows by age without scanning
+    [
+        '''
+        CREATE INDEX IF NOT EXISTS idx_offline_predictions_synced
+        ON offline_predictions (created_at)
+        WHERE synced = TRUE
+        ''',
+        '''
+        CREATE INDEX IF NOT EXISTS idx_offline_user_data_synced
+        ON offline_user_data (created_at)
+        WHERE synced = TRUE
+        ''',
+    ],
+    # v5: weather is upserted per normalized region instead of appended
+    [
+        _key_weather_by_region,
+        'CREATE UNIQUE INDEX IF NOT EXISTS idx_offline_weather_region_key ON offline_weather (region_key)',
+        'DROP INDEX IF EXISTS idx_offline_weather_region_created',
+        '''
+        CREATE TABLE IF NOT EXISTS offline_weather_history (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            region_key TEXT NOT NULL,
+            data TEXT NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            expires_at TIMESTAMP
+        )
+        ''',
+        '''
+        CREATE INDEX IF NOT EXISTS idx_offline_weather_history_region
+        ON offline_weather_history (region_key, created_at)
+        ''',
+        'CREATE INDEX IF NOT EXISTS idx_offline_weather_history_created ON offline_weather_history (created_at)',
+    ],
+    # v6: leasing, backoff and dead-lettering for the sync worker
+    [
+        'ALTER TABLE sync_queue ADD COLUMN next_attempt_at TIMESTAMP',
+        'ALTER TABLE sync_queue ADD COLUMN leased_until TIMESTAMP',
+        'ALTER TABLE sync_queue ADD COLUMN lease_owner TEXT',
+        'ALTER TABLE sync_queue ADD COLUMN last_error TEXT',
+        '''
+        CREATE TABLE IF NOT EXISTS sync_dead_letter (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            queue_id INTEGER,
+            operation TEXT NOT NULL,
+            endpoint TEXT NOT NULL,
+            data TEXT NOT NULL,
+            priority INTEGER,
+            retry_count INTEGER,
+            created_at TIMESTAMP,
+            failed_at TIMESTAMP,
+            last_error TEXT
+        )
+        ''',
+        'CREATE INDEX IF NOT EXISTS idx_sync_dead_letter_failed ON sync_dead_letter (failed_at)',
+        _move_exhausted_sync_entries,
+        'DROP INDEX IF EXISTS idx_sync_queue_pending',
+        '''
+        CREATE INDEX IF NOT EXISTS idx_sync_queue_order
+        ON sync_queue (priority DESC, created_at)
+        ''',
+    ],
+    # v7: small key/value settings shared by every process using the cache file
+    [
+        '''
+        CREATE TABLE IF NOT EXISTS cache_settings (
+            name TEXT PRIMARY KEY,
+            value TEXT,
+            updated_at TIMESTAMP
+        ) WITHOUT ROWID
+        ''',
+    ],
+    # v8: partial indexes for the lease query and the two statements that make entries ready again
+    [
+        '''
+        CREATE INDEX IF NOT EXISTS idx_sync_queue_ready
+        ON sync_queue (next_attempt_at, leased_until, priority DESC, created_at)
+        WHERE next_attempt_at IS NULL AND leased_until IS NULL
+        ''',
+        '''
+        CREATE INDEX IF NOT EXISTS idx_sync_queue_leased
+        ON sync_queue (leased_until) WHERE leased_until IS NOT NULL
+        ''',
+        '''
+        CREATE INDEX IF NOT EXISTS idx_sync_queue_backoff
+        ON sync_queue (next_attempt_at) WHERE next_attempt_at IS NOT NULL
+        ''',
+        'DROP INDEX IF EXISTS idx_sync_queue_order',
+    ],
+]
+
+class ConnectionPool:
+    """Small bounded pool of persistent SQLite connections shared across threads"""
+
+    def __init__(self, db_path: str, max_connections: int = 8, busy_timeout: float = 5.0,
+                 cached_statements: int = 128):
+        self.db_path = db_path
+        self.max_connections = max_connections
+        self.busy_timeout = busy_timeout
+        self.cached_statements = cached_statements
+        self._idle = queue.LifoQueue()
+        self._created = 0
+        self._lock = threading.Lock()
+        # Connection and nesting depth of the transaction open on each thread
+        self._local = threading.local()
+
+    def _connect(self) -> sqlite3.Connection:
+        # Statements are compiled once per connection and reused from its statement cache
+        conn = sqlite3.connect(
+            self.db_path,
+            timeout=self.busy_timeout,
+            check_same_thread=False,
+            cached_statements=self.cached_statements
+        )
+        # Must precede the first write to a new file; existing files switch on their next full VACUUM
+        conn.execute('PRAGMA auto_vacuum=INCREMENTAL')
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=NORMAL')
+        conn.execute(f'PRAGMA busy_timeout={int(self.busy_timeout * 1000)}')
+        return conn
+
+    def acquire(self) -> sqlite3.Connection:
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+        with self._lock:
+            if self._created < self.max_connections:
+                self._created += 1
+                try:
+                    return self._connect()
+                except Exception:
+                    self._created -= 1
+                    raise
+        try:
+            return self._idle.get(timeout=self.busy_timeout)
+        except queue.Empty:
+            # Same error type as a busy database, so the callers' database error handling applies
+            raise sqlite3.OperationalError(
+                f'connection pool exhausted: all {self.max_connections} connections busy for {self.busy_timeout}s'
+            ) from None
+
+    def release(self, conn: sqlite3.Connection):
+        self._idle.put(conn)
+
+    @contextmanager
+    def connection(self, immediate: bool = False):
+        """Borrow a connection for one transaction: commit on success, roll back on error.
+
+        immediate takes the write lock up front (BEGIN IMMEDIATE). Nested use on
+        the same thread joins the open transaction through a SAVEPOINT, so a
+        failing inner block is undone without discarding the outer one.
+        """
+        local = self._local
+        depth = getattr(local, 'depth', 0)
+        if depth:
+            conn = local.conn
+            if not conn.in_transaction:
+                # Releasing a savepoint that opened the transaction would commit it
+                conn.execute('BEGIN')
+            savepoint = f'sp_{depth}'
+            conn.execute(f'SAVEPOINT {savepoint}')
+            local.depth = depth + 1
+            try:
+                yield conn
+                conn.execute(f'RELEASE {savepoint}')
+            except Exception:
+                conn.execute(f'ROLLBACK TO {savepoint}')
+                conn.execute(f'RELEASE {savepoint}')
+                raise
+            finally:
+                local.depth = depth
+            return
+
+        conn = self.acquire()
+        local.conn, local.depth = conn, 1
+        try:
+            if immediate:
+                conn.execute('BEGIN IMMEDIATE')
+            yield conn
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            local.conn, local.depth = None, 0
+            self.release(conn)
+
+    def close_all(self):
+        while True:
+            try:
+                conn = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            conn.close()
+            with self._lock:
+                self._created -= 1
 
 class OfflineCache:
     """Offline caching system for storing data locally and syncing when online"""
-    
-    def __init__(self, db_path: str = 'offline_cache.db'):
+
+    def __init__(self, db_path: str = 'offline_cache.db', max_connections: int = 8, busy_timeout: float = 5.0,
+                 weather_history_regions: Iterable[str] = (), codecs: Optional[Dict[str, str]] = None):
         self.db_path = db_path
+        # Payload encoding per table, e.g. {'offline_predictions': 'msgpack+zlib'}; reads decode any encoding
+        self.codecs = build_codecs(codecs)
+        # Regions whose every weather snapshot is also kept in offline_weather_history
+        self.weather_history_regions = {normalize_region(region) for region in weather_history_regions}
         self.sync_lock = threading.Lock()
+        self.pool = ConnectionPool(db_path, max_connections=max_connections, busy_timeout=busy_timeout)
         self.init_database()
-    
+
     def init_database(self):
-        """Initialize the offline cache database"""
-        try:
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
-            
-            # Create tables for different data types
-            cursor.execute('''
-                CREATE TABLE IF NOT EXISTS offline_predictions (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    user_id INTEGER,
-                    data TEXT NOT NULL,
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    synced BOOLEAN DEFAULT FALSE,
-                    sync_attempts INTEGER DEFAULT 0
-                )
-            ''')
-            
-            cursor.execute('''
-                CREATE TABLE IF NOT EXISTS offline_weather (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    region TEXT NOT NULL,
-                    data TEXT NOT NULL,
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    expires_at TIMESTAMP,
-                    synced BOOLEAN DEFAULT FALSE
-                )
-            ''')
-            
-            cursor.execute('''
-                CREATE TABLE IF NOT EXISTS offline_user_data (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    user_id INTEGER,
-                    data_type TEXT NOT NULL,
-                    data TEXT NOT NULL,
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    synced BOOLEAN DEFAULT FALSE
-                )
-            ''')
-            
-            cursor.execute('''
-                CREATE TABLE IF NOT EXISTS sync_queue (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    operation TEXT NOT NULL,
-                    endpoint TEXT NOT NULL,
-                    data TEXT NOT NULL,
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    priority INTEGER DEFAULT 1,
-                    retry_count INTEGER DEFAULT 0
-                )
-            ''')
-            
-            conn.commit()
-            conn.close()
-            
+        """Initialize the offline cache database and apply pending schema migrations"""
+        try:
+            # Serialize concurrent initializers; DDL runs inside this transaction
+            with self.pool.connection(immediate=True) as conn:
+                current = conn.execute('PRAGMA user_version').fetchone()[0]
+
+                for version, steps in enumerate(SCHEMA_MIGRATIONS[current:], start=current + 1):
+                    for step in steps:
+                        if callable(step):
+                            step(conn)
+                        else:
+                            conn.execute(step)
+                    conn.execute(f'PRAGMA user_version = {version}')
+
+                if current < len(SCHEMA_MIGRATIONS):
+                    print(f"Offline cache schema migrated from v{current} to v{len(SCHEMA_MIGRATIONS)}")
+
         except Exception as e:
             print(f"Error initializing offline cache: {e}")
-    
+
+    def schema_version(self) -> int:
+        """Return the applied schema migration level"""
+        with self.pool.connection() as conn:
+            return conn.execute('PRAGMA user_version').fetchone()[0]
+
+    def explain_query_plans(self) -> Dict[str, List[str]]:
+        """EXPLAIN QUERY PLAN details for every hot read path, keyed by query name"""
+        plans = {}
+        with self.pool.connection() as conn:
+            for name, (sql, params) in HOT_QUERIES.items():
+                rows = conn.execute(f'EXPLAIN QUERY PLAN {sql}', params).fetchall()
+                plans[name] = [row[-1] for row in rows]
+        return plans
+
     def store_prediction(self, user_id: int, prediction_data: Dict) -> bool:
         """Store prediction data offline"""
         try:
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
-            
-            cursor.execute('''
-                INSERT INTO offline_predictions (user_id, data, created_at)
-                VALUES (?, ?, ?)
-            ''', (user_id, json.dumps(prediction_data), datetime.now()))
-            
-            conn.commit()
-            conn.close()
-            return True
-            
+            with self.pool.connection() as conn:
+                cursor = conn.cursor()
+
+                cursor.execute(INSERT_PREDICTION_SQL, (user_id, self.codecs['offline_predictions'].encode(prediction_data), datetime.now()))
+
+                return True
+
         except Exception as e:
             print(f"Error storing prediction offline: {e}")
             return False
-    
+
     def store_weather_data(self, region: str, weather_data: Dict, expiry_hours: int = 6) -> bool:
-        """Store weather data offline with expiry"""
-        try:
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
-            
-            expires_at = datetime.now() + timedelta(hours=expiry_hours)
-            
-            cursor.execute('''
-                INSERT INTO offline_weather (region, data, created_at, expires_at)
-                VALUES (?, ?, ?, ?)
-            ''', (region, json.dumps(weather_data), datetime.now(), expires_at))
-            
-            conn.commit()
-            conn.close()
-            return True
-            
+        """Store (or replace) the weather snapshot for a region with expiry"""
+        try:
+            with self.pool.connection() as conn:
+                cursor = conn.cursor()
+
+                now = datetime.now()
+                expires_at = now + timedelta(hours=expiry_hours)
+                region_key = normalize_region(region)
+                data = self.codecs['offline_weather'].encode(weather_data)
+
+                cursor.execute(UPSERT_WEATHER_SQL, (region, region_key, data, now, expires_at))
+                if region_key in self.weather_history_regions:
+                    cursor.execute(INSERT_WEATHER_HISTORY_SQL, (region_key, data, now, expires_at))
+
+                return True
+
         except Exception as e:
             print(f"Error storing weather data offline: {e}")
             return False
-    
+
     def store_user_data(self, user_id: int, data_type: str, data: Dict) -> bool:
         """Store user-related data offline"""
         try:
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
-            
-            cursor.execute('''
-                INSERT INTO offline_user_data (user_id, data_type, data, created_at)
-                VALUES (?, ?, ?, ?)
-            ''', (user_id, data_type, json.dumps(data), datetime.now()))
-            
-            conn.commit()
-            conn.close()
-            return True
-            
+            with self.pool.connection() as conn:
+                cursor = conn.cursor()
+
+                cursor.execute(INSERT_USER_DATA_SQL, (user_id, data_type, self.codecs['offline_user_data'].encode(data), datetime.now()))
+
+                return True
+
         except Exception as e:
             print(f"Error storing user data offline: {e}")
             return False
-    
+
     def get_cached_predictions(self, user_id: int, limit: int = 10) -> List[Dict]:
         """Get cached predictions for a user"""
         try:
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
-            
-            cursor.execute('''
-                SELECT data, created_at FROM offline_predictions
-                WHERE user_id = ? AND synced = FALSE
-                ORDER BY created_at DESC
-                LIMIT ?
-            ''', (user_id, limit))
-            
-            results = []
-            for row in cursor.fetchall():
-                try:
-                    data = json.loads(row[0])
-                    data['cached_at'] = row[1]
-                    results.append(data)
-                except json.JSONDecodeError:
-                    continue
-            
-            conn.close()
-            return results
-            
+            with self.pool.connection() as conn:
+                cursor = conn.cursor()
+
+                cursor.execute(CACHED_PREDICTIONS_SQL, (user_id, limit))
+
+                results = []
+                for row in cursor.fetchall():
+                    try:
+                        data = decode_payload(row[0])
+                        data['cached_at'] = row[1]
+                        results.append(data)
+                    except ValueError:
+                        continue
+
+                return results
+
         except Exception as e:
             print(f"Error retrieving cached predictions: {e}")
             return []
-    
+
+    def iter_unsynced_predictions(self, user_id: int, page_size: int = 500) -> Iterator[List[Dict]]:
+        """Yield every unsynced prediction of a user in pages of {'id', 'data', 'created_at'}"""
+        cursor_created, cursor_id = '', 0
+        while True:
+            with self.pool.connection() as conn:
+                rows = conn.execute(
+                    UNSYNCED_PREDICTIONS_PAGE_SQL, (user_id, cursor_created, cursor_id, page_size)
+                ).fetchall()
+            if not rows:
+                return
+
+            page = []
+            for row_id, data, created_at in rows:
+                try:
+                    page.append({'id': row_id, 'data': decode_payload(data), 'created_at': created_at})
+                except ValueError:
+                    continue
+            yield page
+
+            cursor_id, cursor_created = rows[-1][0], rows[-1][2]
+            if len(rows) < page_size:
+                return
+
     def get_cached_weather(self, region: str) -> Optional[Dict]:
         """Get cached weather data for a region if not expired"""
         try:
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
-            
-            cursor.execute('''
-                SELECT data, created_at, expires_at FROM offline_weather
-                WHERE region = ? AND expires_at > ?
-                ORDER BY created_at DESC
-                LIMIT 1
-            ''', (region, datetime.now()))
-            
-            row = cursor.fetchone()
-            conn.close()
-            
-            if row:
-                try:
-                    data = json.loads(row[0])
-                    data['cached_at'] = row[1]
-                    data['expires_at'] = row[2]
-                    return data
-                except json.JSONDecodeError:
-                    return None
-            
-            return None
-            
+            with self.pool.connection() as conn:
+                cursor = conn.cursor()
+
+                cursor.execute(CACHED_WEATHER_SQL, (normalize_region(region), datetime.now()))
+
+                row = cursor.fetchone()
+
+                if row:
+                    try:
+                        data = decode_payload(row[0])
+                        data['cached_at'] = row[1]
+                        data['expires_at'] = row[2]
+                        return data
+                    except ValueError:
+                        return None
+
+                return None
+
         except Exception as e:
             print(f"Error retrieving cached weather: {e}")
             return None
-    
-    def get_cached_user_data(self, user_id: int, data_type: str) -> List[Dict]:
-        """Get cached user data of specific type"""
+
+    def get_weather_history(self, region: str, limit: int = 24) -> List[Dict]:
+        """Past weather snapshots for a region listed in weather_history_regions, newest first"""
         try:
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
-            
-            cursor.execute('''
-                SELECT data, created_at FROM offline_user_data
-                WHERE user_id = ? AND data_type = ? AND synced = FALSE
-                ORDER BY created_at DESC
-            ''', (user_id, data_type))
-            
+            with self.pool.connection() as conn:
+                rows = conn.execute(WEATHER_HISTORY_SQL, (normalize_region(region), limit)).fetchall()
+
             results = []
-            for row in cursor.fetchall():
+            for data, created_at, expires_at in rows:
                 try:
-                    data = json.loads(row[0])
-                    data['cached_at'] = row[1]
-                    results.append(data)
-                except json.JSONDecodeError:
+                    snapshot = decode_payload(data)
+                except ValueError:
                     continue
-            
-            conn.close()
+                snapshot['cached_at'] = created_at
+                snapshot['expires_at'] = expires_at
+                results.append(snapshot)
             return results
-            
+
+        except Exception as e:
+            print(f"Error retrieving weather history: {e}")
+            return []
+
+    def get_weather_entry(self, region: str) -> Optional[Tuple[Dict, float]]:
+        """Unexpired weather for a region as (data, seconds until it expires), without cache metadata"""
+        try:
+            with self.pool.connection() as conn:
+                now = datetime.now()
+                row = conn.execute(CACHED_WEATHER_SQL, (normalize_region(region), now)).fetchone()
+
+            if not row:
+                return None
+            try:
+                expires_at = row[2] if isinstance(row[2], datetime) else datetime.fromisoformat(row[2])
+                return decode_payload(row[0]), (expires_at - now).total_seconds()
+            except ValueError:
+                return None
+
+        except Exception as e:
+            print(f"Error retrieving weather entry: {e}")
+            return None
+
+    def store_weather_entry(self, region: str, weather_data: Dict, ttl_seconds: float,
+                            generation: Optional[int] = None) -> bool:
+        """Upsert weather expiring in ttl_seconds; skipped if the weather generation is no longer generation"""
+        try:
+            with self.pool.connection(immediate=True) as conn:
+                if generation is not None:
+                    row = conn.execute(WEATHER_GENERATION_SQL).fetchone()
+                    if (row[0] if row else 0) != generation:
+                        return False
+
+                now = datetime.now()
+                expires_at = now + timedelta(seconds=ttl_seconds)
+                region_key = normalize_region(region)
+                data = self.codecs['offline_weather'].encode(weather_data)
+                conn.execute(UPSERT_WEATHER_SQL, (region, region_key, data, now, expires_at))
+                if region_key in self.weather_history_regions:
+                    conn.execute(INSERT_WEATHER_HISTORY_SQL, (region_key, data, now, expires_at))
+                return True
+
+        except Exception as e:
+            print(f"Error storing weather entry: {e}")
+            return False
+
+    def weather_generation(self) -> Optional[int]:
+        """Counter bumped by invalidate_weather; 0 until the first invalidation"""
+        try:
+            with self.pool.connection() as conn:
+                row = conn.execute(WEATHER_GENERATION_SQL).fetchone()
+                return row[0] if row else 0
+
+        except Exception as e:
+            print(f"Error reading weather generation: {e}")
+            return None
+
+    def invalidate_weather(self) -> Optional[int]:
+        """Delete every cached weather snapshot and bump the weather generation; returns the new generation"""
+        try:
+            with self.pool.connection(immediate=True) as conn:
+                conn.execute(BUMP_WEATHER_GENERATION_SQL)
+                conn.execute('DELETE FROM offline_weather')
+                return conn.execute(WEATHER_GENERATION_SQL).fetchone()[0]
+
+        except Exception as e:
+            print(f"Error invalidating cached weather: {e}")
+            return None
+
+    def get_setting(self, name: str) -> Optional[str]:
+        try:
+            with self.pool.connection() as conn:
+                row = conn.execute(CACHE_SETTING_SQL, (name,)).fetchone()
+                return row[0] if row else None
+
+        except Exception as e:
+            print(f"Error reading cache setting {name}: {e}")
+            return None
+
+    def set_setting(self, name: str, value: Optional[str]) -> bool:
+        try:
+            with self.pool.connection() as conn:
+                conn.execute(UPSERT_CACHE_SETTING_SQL, (name, value, datetime.now()))
+                return True
+
+        except Exception as e:
+            print(f"Error storing cache setting {name}: {e}")
+            return False
+
+    def get_cached_user_data(self, user_id: int, data_type: str) -> List[Dict]:
+        """Get cached user data of specific type"""
+        try:
+            with self.pool.connection() as conn:
+                cursor = conn.cursor()
+
+                cursor.execute(CACHED_USER_DATA_SQL, (user_id, data_type))
+
+                results = []
+                for row in cursor.fetchall():
+                    try:
+                        data = decode_payload(row[0])
+                        data['cached_at'] = row[1]
+                        results.append(data)
+                    except ValueError:
+                        continue
+
+                return results
+
         except Exception as e:
             print(f"Error retrieving cached user data: {e}")
             return []
-    
+
     def add_to_sync_queue(self, operation: str, endpoint: str, data: Dict, priority: int = 1) -> bool:
         """Add operation to sync queue for later processing"""
         try:
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
-            
-            cursor.execute('''
-                INSERT INTO sync_queue (operation, endpoint, data, priority, created_at)
-                VALUES (?, ?, ?, ?, ?)
-            ''', (operation, endpoint, json.dumps(data), priority, datetime.now()))
-            
-            conn.commit()
-            conn.close()
-            return True
-            
+            with self.pool.connection() as conn:
+                cursor = conn.cursor()
+
+                cursor.execute(INSERT_SYNC_QUEUE_SQL, (operation, endpoint, self.codecs['sync_queue'].encode(data), priority, datetime.now()))
+
+                return True
+
         except Exception as e:
             print(f"Error adding to sync queue: {e}")
             return False
-    
+
+    def _insert_many(self, sql: str, rows: Iterable[tuple], label: str) -> int:
+        """executemany in one transaction; returns rows written (0 on failure, nothing committed)"""
+        try:
+            rows = list(rows)
+            if not rows:
+                return 0
+            with self.pool.connection() as conn:
+                conn.executemany(sql, rows)
+                return len(rows)
+
+        except Exception as e:
+            print(f"Error bulk storing {label} offline: {e}")
+            return 0
+
+    def store_predictions_many(self, records: Iterable[Tuple[int, Dict]]) -> int:
+        """Store (user_id, prediction_data) pairs in a single transaction"""
+        now = datetime.now()
+        encode = self.codecs['offline_predictions'].encode
+        return self._insert_many(
+            INSERT_PREDICTION_SQL,
+            ((user_id, encode(data), now) for user_id, data in records),
+            'predictions'
+        )
+
+    def store_weather_data_many(self, records: Iterable[Tuple[str, Dict]], expiry_hours: int = 6) -> int:
+        """Upsert (region, weather_data) pairs in a single transaction; the last pair per region wins"""
+        now = datetime.now()
+        expires_at = now + timedelta(hours=expiry_hours)
+        encode = self.codecs['offline_weather'].encode
+        rows = [(region, normalize_region(region), encode(data), now, expires_at) for region, data in records]
+        history = [(key, data, now, expires_at) for _, key, data, _, _ in rows if key in self.weather_history_regions]
+        try:
+            if not rows:
+                return 0
+            with self.pool.connection() as conn:
+                conn.executemany(UPSERT_WEATHER_SQL, rows)
+                if history:
+                    conn.executemany(INSERT_WEATHER_HISTORY_SQL, history)
+                return len(rows)
+
+        except Exception as e:
+            print(f"Error bulk storing weather data offline: {e}")
+            return 0
+
+    def store_user_data_many(self, records: Iterable[Tuple[int, str, Dict]]) -> int:
+        """Store (user_id, data_type, data) triples in a single transaction"""
+        now = datetime.now()
+        encode = self.codecs['offline_user_data'].encode
+        return self._insert_many(
+            INSERT_USER_DATA_SQL,
+            ((user_id, data_type, encode(data), now) for user_id, data_type, data in records),
+            'user data'
+        )
+
+    def add_to_sync_queue_many(self, records: Iterable[Tuple[str, str, Dict, int]]) -> int:
+        """Queue (operation, endpoint, data, priority) entries in a single transaction"""
+        now = datetime.now()
+        encode = self.codecs['sync_queue'].encode
+        return self._insert_many(
+            INSERT_SYNC_QUEUE_SQL,
+            ((operation, endpoint, encode(data), priority, now)
+             for operation, endpoint, data, priority in records),
+            'sync queue entries'
+        )
+
     def get_sync_queue(self, limit: int = 50) -> List[Dict]:
-        """Get pending sync operations"""
-        try:
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
-            
-            cursor.execute('''
-                SELECT id, operation, endpoint, data, priority, retry_count, created_at
-                FROM sync_queue
-                WHERE retry_count < 3
-                ORDER BY priority DESC, created_at ASC
-                LIMIT ?
-            ''', (limit,))
-            
-            results = []
-            for row in cursor.fetchall():
-                try:
-                    data = json.loads(row[3])
-                    results.append({
+        """Get pending sync operations that are due and not leased"""
+        try:
+            with self.pool.connection(immediate=True) as conn:
+                self._ready_due_sync(conn, datetime.now())
+                cursor = conn.cursor()
+                cursor.execute(SYNC_QUEUE_SQL, (limit,))
+
+                results = []
+                for row in cursor.fetchall():
+                    try:
+                        data = decode_payload(row[3])
+                        results.append({
+                            'id': row[0],
+                            'operation': row[1],
+                            'endpoint': row[2],
+                            'data': data,
+                            'priority': row[4],
+                            'retry_count': row[5],
+                            'created_at': row[6]
+                        })
+                    except ValueError:
+                        continue
+
+                return results
+
+        except Exception as e:
+            print(f"Error retrieving sync queue: {e}")
+            return []
+
+    def mark_synced(self, table: str, record_id: int) -> bool:
+        """Mark a record as successfully synced"""
+        try:
+            with self.pool.connection() as conn:
+                cursor = conn.cursor()
+
+                if table == 'predictions':
+                    cursor.execute('''
+                        UPDATE offline_predictions SET synced = TRUE WHERE id = ?
+                    ''', (record_id,))
+                elif table == 'weather':
+                    cursor.execute('''
+                        UPDATE offline_weather SET synced = TRUE WHERE id = ?
+                    ''', (record_id,))
+                elif table == 'user_data':
+                    cursor.execute('''
+                        UPDATE offline_user_data SET synced = TRUE WHERE id = ?
+                    ''', (record_id,))
+                elif table == 'sync_queue':
+                    cursor.execute('DELETE FROM sync_queue WHERE id = ?', (record_id,))
+
+                return True
+
+        except Exception as e:
+            print(f"Error marking record as synced: {e}")
+            return False
+
+    def mark_synced_many(self, table: str, record_ids: Iterable[int]) -> int:
+        """Mark many records of 'predictions', 'weather' or 'user_data' as synced in one transaction"""
+        try:
+            with self.pool.connection() as conn:
+                cursor = conn.executemany(
+                    f'UPDATE {SYNCED_TABLES[table]} SET synced = TRUE WHERE id = ?',
+                    [(record_id,) for record_id in record_ids]
+                )
+                return cursor.rowcount
+
+        except Exception as e:
+            print(f"Error marking records as synced: {e}")
+            return 0
+
+    def mark_sync_failed(self, queue_id: int) -> bool:
+        """Mark a sync operation as failed and schedule its retry"""
+        return self.fail_sync(queue_id) is not None
+
+    def _ready_due_sync(self, conn, now: datetime):
+        """Release expired leases and end elapsed backoffs so SYNC_QUEUE_SQL sees those entries"""
+        conn.execute(RELEASE_EXPIRED_LEASES_SQL, (now,))
+        conn.execute(PROMOTE_DUE_RETRIES_SQL, (now,))
+
+    def lease_sync_batch(self, owner: str, limit: int = 50, lease_seconds: float = 60) -> List[Dict]:
+        """Atomically claim up to limit due entries for owner until the lease expires.
+
+        The select and the lease update share one IMMEDIATE transaction, so
+        concurrent workers never receive the same entry. Entries whose payload
+        is not valid JSON are dead-lettered instead of returned.
+        """
+        try:
+            with self.pool.connection(immediate=True) as conn:
+                now = datetime.now()
+                self._ready_due_sync(conn, now)
+                rows = conn.execute(SYNC_QUEUE_SQL, (limit,)).fetchall()
+
+                leased = []
+                for row in rows:
+                    try:
+                        data = decode_payload(row[3])
+                    except ValueError as e:
+                        conn.execute(DEAD_LETTER_SQL, (now, f'Invalid payload: {e}', row[0]))
+                        conn.execute('DELETE FROM sync_queue WHERE id = ?', (row[0],))
+                        continue
+                    leased.append({
                         'id': row[0],
                         'operation': row[1],
                         'endpoint': row[2],
@@ -265,152 +1028,398 @@ class OfflineCache:
                         'retry_count': row[5],
                         'created_at': row[6]
                     })
-                except json.JSONDecodeError:
-                    continue
-            
-            conn.close()
-            return results
-            
+
+                conn.executemany(
+                    'UPDATE sync_queue SET leased_until = ?, lease_owner = ? WHERE id = ?',
+                    [(now + timedelta(seconds=lease_seconds), owner, entry['id']) for entry in leased]
+                )
+                return leased
+
         except Exception as e:
-            print(f"Error retrieving sync queue: {e}")
+            print(f"Error leasing sync batch: {e}")
             return []
-    
-    def mark_synced(self, table: str, record_id: int) -> bool:
-        """Mark a record as successfully synced"""
+
+    def complete_sync(self, queue_ids: Iterable[int], owner: Optional[str] = None) -> int:
+        """Remove successfully replayed entries; returns how many were removed.
+
+        With owner, only entries still leased by owner are removed, so a worker
+        whose lease expired cannot delete an entry another worker now holds.
+        """
         try:
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
-            
-            if table == 'predictions':
-                cursor.execute('''
-                    UPDATE offline_predictions SET synced = TRUE WHERE id = ?
-                ''', (record_id,))
-            elif table == 'weather':
-                cursor.execute('''
-                    UPDATE offline_weather SET synced = TRUE WHERE id = ?
-                ''', (record_id,))
-            elif table == 'user_data':
-                cursor.execute('''
-                    UPDATE offline_user_data SET synced = TRUE WHERE id = ?
-                ''', (record_id,))
-            elif table == 'sync_queue':
-                cursor.execute('DELETE FROM sync_queue WHERE id = ?', (record_id,))
-            
-            conn.commit()
-            conn.close()
-            return True
-            
+            with self.pool.connection() as conn:
+                if owner is None:
+                    cursor = conn.executemany('DELETE FROM sync_queue WHERE id = ?',
+                                              [(queue_id,) for queue_id in queue_ids])
+                else:
+                    cursor = conn.executemany('DELETE FROM sync_queue WHERE id = ? AND lease_owner = ?',
+                                              [(queue_id, owner) for queue_id in queue_ids])
+                return cursor.rowcount
+
         except Exception as e:
-            print(f"Error marking record as synced: {e}")
-            return False
-    
-    def mark_sync_failed(self, queue_id: int) -> bool:
-        """Mark a sync operation as failed and increment retry count"""
-        try:
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
-            
-            cursor.execute('''
-                UPDATE sync_queue 
-                SET retry_count = retry_count + 1
-                WHERE id = ?
-            ''', (queue_id,))
-            
-            conn.commit()
-            conn.close()
-            return True
-            
+            print(f"Error completing sync entries: {e}")
+            return 0
+
+    def fail_sync(self, queue_id: int, error: Optional[str] = None, permanent: bool = False,
+                  max_retries: int = MAX_SYNC_RETRIES, base_delay: float = 30,
+                  max_delay: float = 3600, owner: Optional[str] = None) -> Optional[str]:
+        """Record a failed attempt.
+
+        Returns 'retry' after scheduling next_attempt_at with exponential backoff
+        and full jitter, 'dead_letter' once retries are exhausted (immediately
+        when permanent), or None if the entry no longer exists or, with owner,
+        is no longer leased by owner.
+        """
+        try:
+            with self.pool.connection(immediate=True) as conn:
+                row = conn.execute('SELECT retry_count, lease_owner FROM sync_queue WHERE id = ?',
+                                   (queue_id,)).fetchone()
+                if row is None or (owner is not None and row[1] != owner):
+                    return None
+
+                now = datetime.now()
+                attempts = row[0] + 1
+                if permanent or attempts >= max_retries:
+                    conn.execute('UPDATE sync_queue SET retry_count = ? WHERE id = ?', (attempts, queue_id))
+                    conn.execute(DEAD_LETTER_SQL, (now, error, queue_id))
+                    conn.execute('DELETE FROM sync_queue WHERE id = ?', (queue_id,))
+                    return 'dead_letter'
+
+                delay = random.uniform(0, min(max_delay, base_delay * 2 ** (attempts - 1)))
+                conn.execute('''
+                    UPDATE sync_queue
+                    SET retry_count = ?, next_attempt_at = ?, last_error = ?,
+                        leased_until = NULL, lease_owner = NULL
+                    WHERE id = ?
+                ''', (attempts, now + timedelta(seconds=delay), error, queue_id))
+                return 'retry'
+
         except Exception as e:
             print(f"Error marking sync as failed: {e}")
-            return False
-    
+            return None
+
+    def get_dead_letters(self, limit: int = 50) -> List[Dict]:
+        """Most recently dead-lettered sync entries"""
+        try:
+            with self.pool.connection() as conn:
+                rows = conn.execute('''
+                    SELECT id, queue_id, operation, endpoint, data, retry_count, created_at, failed_at, last_error
+                    FROM sync_dead_letter
+                    ORDER BY failed_at DESC
+                    LIMIT ?
+                ''', (limit,)).fetchall()
+
+            keys = ['id', 'queue_id', 'operation', 'endpoint', 'data', 'retry_count',
+                    'created_at', 'failed_at', 'last_error']
+            results = []
+            for row in rows:
+                entry = dict(zip(keys, row))
+                try:
+                    entry['data'] = decode_payload(entry['data'])
+                except ValueError:
+                    entry['data'] = None
+                results.append(entry)
+            return results
+
+        except Exception as e:
+            print(f"Error retrieving dead letters: {e}")
+            return []
+
+    def sync_queue_metrics(self) -> Dict[str, Any]:
+        """Queue depth, leased/due counts, dead letters and the age of the oldest due entry"""
+        try:
+            with self.pool.connection() as conn:
+                now = datetime.now()
+                pending, due, leased, oldest_due = conn.execute('''
+                    SELECT COUNT(*),
+                           COALESCE(SUM(next_attempt_at IS NULL OR next_attempt_at <= ?), 0),
+                           COALESCE(SUM(leased_until >= ?), 0),
+                           MIN(CASE WHEN next_attempt_at IS NULL OR next_attempt_at <= ? THEN created_at END)
+                    FROM sync_queue
+                ''', (now, now, now)).fetchone()
+                dead = conn.execute('SELECT COUNT(*) FROM sync_dead_letter').fetchone()[0]
+
+            lag = 0.0
+            if oldest_due:
+                lag = max(0.0, (now - datetime.fromisoformat(str(oldest_due))).total_seconds())
+            return {
+                'pending': pending,
+                'due': due,
+                'leased': leased,
+                'dead_letter': dead,
+                'queue_lag_seconds': round(lag, 1)
+            }
+
+        except Exception as e:
+            print(f"Error getting sync queue metrics: {e}")
+            return {}
+
     def cleanup_expired_data(self) -> int:
         """Clean up expired weather data and old synced records"""
+        return sum(self.purge_expired().values())
+
+    def purge_expired(self, retention: Optional[Dict[str, float]] = None, batch_size: int = 500,
+                      pause: float = 0.0) -> Dict[str, int]:
+        """Delete rows past their retention window, batch_size rows per transaction.
+
+        Short transactions keep the write lock free for request threads; pause
+        sleeps between batches to yield further. Returns rows deleted per table.
+        """
+        retention = dict(DEFAULT_RETENTION, **(retention or {}))
+        deleted = {}
+        for table, condition in RETENTION_RULES.items():
+            deleted[table] = 0
+            days = retention.get(table)
+            if days is None:
+                continue
+            cutoff = datetime.now() - timedelta(days=days)
+            sql = f'DELETE FROM {table} WHERE id IN (SELECT id FROM {table} WHERE {condition} LIMIT ?)'
+            try:
+                while True:
+                    with self.pool.connection() as conn:
+                        count = conn.execute(sql, (cutoff, batch_size)).rowcount
+                    deleted[table] += count
+                    if count < batch_size:
+                        break
+                    if pause:
+                        time.sleep(pause)
+            except Exception as e:
+                print(f"Error purging {table}: {e}")
+        return deleted
+
+    def storage_info(self) -> Dict[str, int]:
+        """Database size in pages and bytes, including free pages awaiting vacuum"""
+        with self.pool.connection() as conn:
+            page_size = conn.execute('PRAGMA page_size').fetchone()[0]
+            page_count = conn.execute('PRAGMA page_count').fetchone()[0]
+            freelist = conn.execute('PRAGMA freelist_count').fetchone()[0]
+            auto_vacuum = conn.execute('PRAGMA auto_vacuum').fetchone()[0]
+        return {
+            'page_size': page_size,
+            'page_count': page_count,
+            'freelist_pages': freelist,
+            'size_bytes': page_size * page_count,
+            'auto_vacuum': auto_vacuum
+        }
+
+    def vacuum(self, max_pages: int = 1000, full: bool = False) -> int:
+        """Return free pages to the filesystem and refresh planner statistics.
+
+        Uses incremental vacuum (at most max_pages) when the file supports it;
+        full=True rewrites the whole file once, which also converts older
+        files to incremental mode. Returns bytes reclaimed.
+        """
         try:
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
-            
-            # Remove expired weather data
-            cursor.execute('DELETE FROM offline_weather WHERE expires_at < ?', (datetime.now(),))
-            expired_weather = cursor.rowcount
-            
-            # Remove old synced predictions (older than 30 days)
-            thirty_days_ago = datetime.now() - timedelta(days=30)
-            cursor.execute('DELETE FROM offline_predictions WHERE synced = TRUE AND created_at < ?', (thirty_days_ago,))
-            old_predictions = cursor.rowcount
-            
-            # Remove old synced user data (older than 30 days)
-            cursor.execute('DELETE FROM offline_user_data WHERE synced = TRUE AND created_at < ?', (thirty_days_ago,))
-            old_user_data = cursor.rowcount
-            
-            conn.commit()
-            conn.close()
-            
-            total_cleaned = expired_weather + old_predictions + old_user_data
-            return total_cleaned
-            
+            before = self.storage_info()
+            with self.pool.connection() as conn:
+                if full:
+                    conn.execute('VACUUM')
+                elif before['auto_vacuum'] == 2:
+                    # executescript steps the pragma to completion; execute() frees a single page
+                    conn.executescript(f'PRAGMA incremental_vacuum({int(max_pages)});')
+                conn.execute('PRAGMA optimize')
+            after = self.storage_info()
+            return max(0, before['size_bytes'] - after['size_bytes'])
+
         except Exception as e:
-            print(f"Error cleaning up expired data: {e}")
+            print(f"Error vacuuming offline cache: {e}")
             return 0
-    
-    def get_cache_stats(self) -> Dict[str, Any]:
-        """Get statistics about the offline cache"""
-        try:
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
-            
-            stats = {}
-            
-            # Count predictions
-            cursor.execute('SELECT COUNT(*) FROM offline_predictions')
-            stats['total_predictions'] = cursor.fetchone()[0]
-            
-            cursor.execute('SELECT COUNT(*) FROM offline_predictions WHERE synced = FALSE')
-            stats['unsynced_predictions'] = cursor.fetchone()[0]
-            
-            # Count weather data
-            cursor.execute('SELECT COUNT(*) FROM offline_weather')
-            stats['total_weather'] = cursor.fetchone()[0]
-            
-            cursor.execute('SELECT COUNT(*) FROM offline_weather WHERE expires_at > ?', (datetime.now(),))
-            stats['valid_weather'] = cursor.fetchone()[0]
-            
-            # Count sync queue
-            cursor.execute('SELECT COUNT(*) FROM sync_queue')
-            stats['pending_sync'] = cursor.fetchone()[0]
-            
-            # Count user data
-            cursor.execute('SELECT COUNT(*) FROM offline_user_data')
-            stats['total_user_data'] = cursor.fetchone()[0]
-            
-            cursor.execute('SELECT COUNT(*) FROM offline_user_data WHERE synced = FALSE')
-            stats['unsynced_user_data'] = cursor.fetchone()[0]
-            
-            conn.close()
-            return stats
-            
+
+    def get_cache_stats(self, exact: bool = False) -> Dict[str, Any]:
+        """Get statistics about the offline cache.
+
+        Reads the trigger-maintained counters by default; exact=True recounts
+        every table in a single aggregate query instead.
+        """
+        try:
+            if exact:
+                return self.recount_cache_stats(repair=False)
+
+            with self.pool.connection() as conn:
+                counters = dict(conn.execute('SELECT name, value FROM cache_counters').fetchall())
+                counters['valid_weather'] = conn.execute(
+                    'SELECT COUNT(*) FROM offline_weather WHERE expires_at > ?', (datetime.now(),)
+                ).fetchone()[0]
+                return {name: counters.get(name, 0) for name in STATS_FIELDS}
+
         except Exception as e:
             print(f"Error getting cache stats: {e}")
             return {}
-    
+
+    def recount_cache_stats(self, repair: bool = True) -> Dict[str, Any]:
+        """Exact statistics from one aggregate query; repair=True also resets the counters to them"""
+        try:
+            # With repair, take the write lock first so no insert lands between count and reset
+            with self.pool.connection(immediate=repair) as conn:
+                row = conn.execute(EXACT_STATS_SQL, (datetime.now(),)).fetchone()
+                stats = dict(zip(STATS_FIELDS, row))
+                if repair:
+                    conn.executemany(
+                        'INSERT OR REPLACE INTO cache_counters (name, value) VALUES (?, ?)',
+                        [(name, stats[name]) for name in COUNTER_NAMES]
+                    )
+                return stats
+
+        except Exception as e:
+            print(f"Error recounting cache stats: {e}")
+            return {}
+
     def clear_all_data(self) -> bool:
         """Clear all cached data (use with caution)"""
         try:
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
-            
-            cursor.execute('DELETE FROM offline_predictions')
-            cursor.execute('DELETE FROM offline_weather')
-            cursor.execute('DELETE FROM offline_user_data')
-            cursor.execute('DELETE FROM sync_queue')
-            
-            conn.commit()
-            conn.close()
-            return True
-            
+            with self.pool.connection() as conn:
+                cursor = conn.cursor()
+
+                cursor.execute('DELETE FROM offline_predictions')
+                cursor.execute('DELETE FROM offline_weather')
+                cursor.execute('DELETE FROM offline_weather_history')
+                cursor.execute('DELETE FROM offline_user_data')
+                cursor.execute('DELETE FROM sync_queue')
+                cursor.execute('DELETE FROM sync_dead_letter')
+
+                return True
+
         except Exception as e:
             print(f"Error clearing all data: {e}")
             return False
 
-# Global offline cache instance
-offline_cache = OfflineCache()
+class WriteBehindBuffer:
+    """Coalesces single-row OfflineCache writes and flushes them with the bulk methods.
+
+    A flush happens once max_items writes are pending or the oldest pending
+    write is max_delay seconds old, and again at interpreter exit. Buffered
+    rows are not visible to reads until flushed. A batch whose bulk write
+    fails is put back at the head of the buffer and retried on the next flush.
+    """
+
+    def __init__(self, cache: 'OfflineCache', max_items: int = 500, max_delay: float = 1.0):
+        self.cache = cache
+        self.max_items = max_items
+        self.max_delay = max_delay
+        self._pending = {kind: [] for kind in self._FLUSHERS}
+        self._count = 0
+        self._oldest = None
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._thread = None
+        self.flushed_rows = 0
+        self.flushes = 0
+        self.failed_flushes = 0
+        atexit.register(self.flush)
+
+    # Buffer kind -> bulk OfflineCache method; weather is keyed by ('weather', expiry_hours)
+    _FLUSHERS = {
+        'predictions': 'store_predictions_many',
+        'weather': 'store_weather_data_many',
+        'user_data': 'store_user_data_many',
+        'sync_queue': 'add_to_sync_queue_many'
+    }
+
+    def store_prediction(self, user_id: int, prediction_data: Dict):
+        self._add('predictions', (user_id, prediction_data))
+
+    def store_weather_data(self, region: str, weather_data: Dict, expiry_hours: int = 6):
+        # Rows with different expiries are flushed in separate batches
+        self._add(('weather', expiry_hours), (region, weather_data))
+
+    def store_user_data(self, user_id: int, data_type: str, data: Dict):
+        self._add('user_data', (user_id, data_type, data))
+
+    def add_to_sync_queue(self, operation: str, endpoint: str, data: Dict, priority: int = 1):
+        self._add('sync_queue', (operation, endpoint, data, priority))
+
+    def _add(self, kind, record: tuple):
+        with self._lock:
+            self._pending.setdefault(kind, []).append(record)
+            self._count += 1
+            if self._oldest is None:
+                self._oldest = time.monotonic()
+            full = self._count >= self.max_items
+            self._ensure_thread()
+        if full:
+            self.flush()
+        else:
+            self._wakeup.set()
+
+    def _ensure_thread(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._run, name='offline-write-behind', daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while True:
+            self._wakeup.wait()
+            self._wakeup.clear()
+            with self._lock:
+                oldest = self._oldest
+            if oldest is None:
+                continue
+            remaining = self.max_delay - (time.monotonic() - oldest)
+            if remaining > 0:
+                time.sleep(remaining)
+            self.flush()
+
+    def flush(self) -> int:
+        """Write every pending row; returns the number of rows written, failed batches stay buffered"""
+        with self._flush_lock:
+            with self._lock:
+                pending, self._pending = self._pending, {kind: [] for kind in self._FLUSHERS}
+                self._count = 0
+                self._oldest = None
+
+            written = 0
+            failed = {}
+            for kind, records in pending.items():
+                if not records:
+                    continue
+                try:
+                    if isinstance(kind, tuple):
+                        count = self.cache.store_weather_data_many(records, expiry_hours=kind[1])
+                    else:
+                        count = getattr(self.cache, self._FLUSHERS[kind])(records)
+                except Exception as e:
+                    print(f"Error flushing buffered {kind} rows: {e}")
+                    count = 0
+                # The bulk methods report a failed transaction as 0 rows
+                if count:
+                    written += count
+                else:
+                    failed[kind] = records
+
+            if failed:
+                with self._lock:
+                    for kind, records in failed.items():
+                        self._pending[kind] = records + self._pending.get(kind, [])
+                        self._count += len(records)
+                    self._oldest = time.monotonic()
+                    self.failed_flushes += 1
+                # The background thread retries once max_delay has passed
+                self._wakeup.set()
+            if written:
+                self.flushed_rows += written
+                self.flushes += 1
+            return written
+
+    def pending(self) -> int:
+        with self._lock:
+            return self._count
+
+# Global offline cache, created on first use; app.py passes its config through init_app
+offline_cache = LazySingleton(
+    OfflineCache,
+    name='offline_cache',
+    config_keys={
+        'OFFLINE_CACHE_PATH': 'db_path',
+        'OFFLINE_CACHE_POOL_SIZE': 'max_connections',
+        'OFFLINE_CACHE_BUSY_TIMEOUT': 'busy_timeout',
+        'OFFLINE_WEATHER_HISTORY_REGIONS': 'weather_history_regions',
+        'OFFLINE_CACHE_CODECS': 'codecs'
+    },
+    db_path=os.environ.get('OFFLINE_CACHE_PATH', 'offline_cache.db'),
+    max_connections=int(os.environ.get('OFFLINE_CACHE_POOL_SIZE', 8)),
+    busy_timeout=float(os.environ.get('OFFLINE_CACHE_BUSY_TIMEOUT', 5.0)),
+    weather_history_regions=[
+        region for region in os.environ.get('OFFLINE_WEATHER_HISTORY_REGIONS', '').split(',') if region.strip()
+    ],
+    codecs=json.loads(os.environ.get('OFFLINE_CACHE_CODECS', '{}'))
+)
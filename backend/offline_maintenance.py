@@ -0,0 +1,102 @@
+import json
+import os
+import threading
+import time
+from datetime import datetime
+from typing import Any, Dict, Optional
+
+from offline_cache import DEFAULT_RETENTION, OfflineCache, offline_cache
+
+
+class CacheMaintenanceWorker:
+    """Periodically purges expired offline cache rows and compacts the database file"""
+
+    def __init__(self, cache: OfflineCache, interval: float = 3600,
+                 retention: Optional[Dict[str, float]] = None,
+                 batch_size: int = 500, vacuum_pages: int = 1000):
+        self.cache = cache
+        self.interval = interval
+        self.retention = dict(DEFAULT_RETENTION, **(retention or {}))
+        self.batch_size = batch_size
+        self.vacuum_pages = vacuum_pages
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self.last_report: Optional[Dict[str, Any]] = None
+        self.runs = 0
+        self.total_rows_reclaimed = 0
+        self.total_bytes_reclaimed = 0
+
+    def start(self) -> bool:
+        """Start the background loop unless it is already running"""
+        if self._thread is not None and self._thread.is_alive():
+            return False
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name='offline-cache-maintenance', daemon=True)
+        self._thread.start()
+        return True
+
+    def stop(self, timeout: float = 5.0):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def _run(self):
+        while not self._stop.is_set():
+            self.run_once()
+            self._stop.wait(self.interval)
+
+    def run_once(self, full_vacuum: bool = False) -> Dict[str, Any]:
+        """One purge + vacuum pass; returns what it reclaimed.
+
+        full_vacuum rewrites the file, converting databases created before
+        incremental auto-vacuum was enabled.
+        """
+        with self._lock:
+            started = time.perf_counter()
+            try:
+                # Pause between batches so request threads get the write lock
+                deleted = self.cache.purge_expired(self.retention, batch_size=self.batch_size, pause=0.01)
+                bytes_reclaimed = self.cache.vacuum(max_pages=self.vacuum_pages, full=full_vacuum)
+                storage = self.cache.storage_info()
+                report = {
+                    'state': 'succeeded',
+                    'deleted': deleted,
+                    'rows_reclaimed': sum(deleted.values()),
+                    'bytes_reclaimed': bytes_reclaimed,
+                    'size_bytes': storage['size_bytes'],
+                    'freelist_pages': storage['freelist_pages']
+                }
+            except Exception as e:
+                print(f"Offline cache maintenance failed: {e}")
+                report = {'state': 'failed', 'error': str(e), 'rows_reclaimed': 0, 'bytes_reclaimed': 0}
+
+            report.update({
+                'finished_at': datetime.now().isoformat(),
+                'duration_seconds': round(time.perf_counter() - started, 3)
+            })
+            self.runs += 1
+            self.total_rows_reclaimed += report['rows_reclaimed']
+            self.total_bytes_reclaimed += report['bytes_reclaimed']
+            self.last_report = report
+            return report
+
+    def info(self) -> Dict[str, Any]:
+        return {
+            'running': self._thread is not None and self._thread.is_alive(),
+            'interval_seconds': self.interval,
+            'retention_days': self.retention,
+            'runs': self.runs,
+            'total_rows_reclaimed': self.total_rows_reclaimed,
+            'total_bytes_reclaimed': self.total_bytes_reclaimed,
+            'last_run': self.last_report
+        }
+
+
+# Global offline cache maintenance worker
+offline_maintenance = CacheMaintenanceWorker(
+    offline_cache,
+    interval=float(os.environ.get('OFFLINE_CACHE_MAINTENANCE_INTERVAL', 3600)),
+    retention=json.loads(os.environ.get('OFFLINE_CACHE_RETENTION_DAYS', '{}')),
+    batch_size=int(os.environ.get('OFFLINE_CACHE_PURGE_BATCH', 500))
+)
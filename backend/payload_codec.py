@@ -0,0 +1,119 @@
+import json
+import zlib
+from typing import Any, Dict, Optional
+
+# Try to import optional dependencies
+try:
+    import msgpack
+    MSGPACK_AVAILABLE = True
+except ImportError:
+    MSGPACK_AVAILABLE = False
+
+try:
+    import zstandard
+    ZSTD_AVAILABLE = True
+except ImportError:
+    ZSTD_AVAILABLE = False
+
+# Encoded payloads are BLOBs whose first byte names the format (low nibble) and
+# compression (high nibble). Legacy rows are JSON TEXT and have no header.
+FORMATS = {'json': 0x01, 'msgpack': 0x02}
+COMPRESSIONS = {'none': 0x00, 'zlib': 0x10, 'zstd': 0x20}
+
+
+class PayloadCodec:
+    """Encodes offline cache payloads; decode() also accepts every other codec's output and legacy JSON"""
+
+    def __init__(self, format: str = 'msgpack', compression: str = 'zlib', min_compress_size: int = 256,
+                 level: int = 6):
+        if format == 'msgpack' and not MSGPACK_AVAILABLE:
+            format = 'json'
+        if compression == 'zstd' and not ZSTD_AVAILABLE:
+            compression = 'zlib'
+        if format not in FORMATS:
+            raise ValueError(f'Unknown payload format: {format}')
+        if compression not in COMPRESSIONS:
+            raise ValueError(f'Unknown payload compression: {compression}')
+        self.format = format
+        self.compression = compression
+        # Small payloads are stored uncompressed; the header records which was used
+        self.min_compress_size = min_compress_size
+        self.level = level
+        self._zstd = zstandard.ZstdCompressor(level=level) if compression == 'zstd' else None
+
+    @classmethod
+    def from_spec(cls, spec: str) -> 'PayloadCodec':
+        """Build from 'format' or 'format+compression', e.g. 'msgpack+zlib' or 'json'"""
+        format, _, compression = spec.partition('+')
+        return cls(format=format, compression=compression or 'none')
+
+    @property
+    def spec(self) -> str:
+        return self.format if self.compression == 'none' else f'{self.format}+{self.compression}'
+
+    def encode(self, obj: Any) -> bytes:
+        if self.format == 'msgpack':
+            body = msgpack.packb(obj, use_bin_type=True)
+        else:
+            body = json.dumps(obj, separators=(',', ':')).encode('utf-8')
+
+        compression = self.compression if len(body) >= self.min_compress_size else 'none'
+        if compression == 'zlib':
+            body = zlib.compress(body, self.level)
+        elif compression == 'zstd':
+            body = self._zstd.compress(body)
+        return bytes([FORMATS[self.format] | COMPRESSIONS[compression]]) + body
+
+    @staticmethod
+    def decode(value: Any) -> Any:
+        return decode_payload(value)
+
+
+def decode_payload(value: Any) -> Any:
+    """Decode a stored payload: legacy JSON text or a header-tagged BLOB"""
+    if isinstance(value, str):
+        return json.loads(value)
+
+    value = bytes(value)
+    if not value:
+        raise ValueError('Empty payload')
+    header, body = value[0], value[1:]
+    if header in (ord('{'), ord('[')):
+        return json.loads(value)
+
+    compression = header & 0xF0
+    if compression == COMPRESSIONS['zlib']:
+        try:
+            body = zlib.decompress(body)
+        except zlib.error as e:
+            raise ValueError(f'Corrupt zlib payload: {e}')
+    elif compression == COMPRESSIONS['zstd']:
+        if not ZSTD_AVAILABLE:
+            raise ValueError('Payload is zstd-compressed but zstandard is not installed')
+        body = zstandard.ZstdDecompressor().decompress(body)
+    elif compression != COMPRESSIONS['none']:
+        raise ValueError(f'Unknown payload header: {header:#04x}')
+
+    format = header & 0x0F
+    if format == FORMATS['msgpack']:
+        if not MSGPACK_AVAILABLE:
+            raise ValueError('Payload is msgpack-encoded but msgpack is not installed')
+        return msgpack.unpackb(body, raw=False)
+    if format == FORMATS['json']:
+        return json.loads(body)
+    raise ValueError(f'Unknown payload header: {header:#04x}')
+
+
+# Codec used for each table unless OfflineCache is given others
+DEFAULT_CODECS = {
+    'offline_predictions': 'msgpack+zlib',
+    'offline_weather': 'msgpack+zlib',
+    'offline_user_data': 'msgpack+zlib',
+    'sync_queue': 'msgpack+zlib'
+}
+
+
+def build_codecs(specs: Optional[Dict[str, str]] = None) -> Dict[str, PayloadCodec]:
+    """Per-table codecs from DEFAULT_CODECS overridden by specs"""
+    merged = dict(DEFAULT_CODECS, **(specs or {}))
+    return {table: PayloadCodec.from_spec(spec) for table, spec in merged.items()}
@@ -0,0 +1,120 @@
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Sequence, Tuple
+
+from inference import FEATURE_FIELDS
+
+# Decimal places each feature is rounded to before it becomes part of the key.
+# Inputs closer than this share one cached model prediction.
+DEFAULT_QUANTIZATION = {
+    'rainfall': 0,
+    'temperature': 1,
+    'soil_ph': 2,
+    'nitrogen': 1,
+    'phosphorus': 1,
+    'potassium': 1,
+    'sowing_date_offset': 0
+}
+
+
+class PredictionCache:
+    """LRU + TTL memoization of model predictions per quantized input.
+
+    Only the model output is cached: recommendations and risk level are
+    threshold rules and must be evaluated on the exact request, not on
+    whichever input first filled the quantized key.
+    """
+
+    def __init__(self, max_size: int = 4096, ttl: float = 3600,
+                 quantization: Optional[Dict[str, int]] = None):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.quantization = dict(DEFAULT_QUANTIZATION, **(quantization or {}))
+        self._digits = [self.quantization[field] for field in FEATURE_FIELDS]
+        self._entries: 'OrderedDict[tuple, Tuple[float, Any]]' = OrderedDict()
+        self._model_versions: Dict[str, str] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+
+    def make_key(self, features: Sequence[float], model_version: str) -> tuple:
+        return (model_version,) + tuple(round(float(value), digits) for value, digits in zip(features, self._digits))
+
+    def get(self, features: Sequence[float], model_version: str, slot: str = 'global') -> Optional[Any]:
+        """Return the cached result for these features, or None on a miss.
+
+        slot names the model (global or shard) that produced model_version.
+        """
+        key = self.make_key(features, model_version)
+        with self._lock:
+            self._check_model_version(slot, model_version)
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            stored_at, value = entry
+            if time.monotonic() - stored_at > self.ttl:
+                del self._entries[key]
+                self.expirations += 1
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, features: Sequence[float], model_version: str, value: Any, slot: str = 'global'):
+        key = self.make_key(features, model_version)
+        with self._lock:
+            self._check_model_version(slot, model_version)
+            self._entries[key] = (time.monotonic(), value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def _check_model_version(self, slot: str, model_version: str):
+        # Results from a replaced model file must never be served
+        previous = self._model_versions.get(slot)
+        if previous == model_version:
+            return
+        self._model_versions[slot] = model_version
+        if previous is not None and previous not in self._model_versions.values():
+            stale = [key for key in self._entries if key[0] == previous]
+            for key in stale:
+                del self._entries[key]
+            self.invalidations += 1
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'size': len(self._entries),
+                'max_size': self.max_size,
+                'ttl_seconds': self.ttl,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': round(self.hits / lookups, 4) if lookups else 0.0,
+                'evictions': self.evictions,
+                'expirations': self.expirations,
+                'invalidations': self.invalidations,
+                'model_versions': dict(self._model_versions),
+                'quantization': self.quantization
+            }
+
+
+# Global prediction cache instance
+prediction_cache = PredictionCache(
+    max_size=int(os.environ.get('PREDICTION_CACHE_SIZE', 4096)),
+    ttl=float(os.environ.get('PREDICTION_CACHE_TTL', 3600)),
+    quantization=json.loads(os.environ.get('PREDICTION_CACHE_QUANTIZATION', '{}'))
+)
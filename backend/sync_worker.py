@@ -0,0 +1,212 @@
+import os
+import socket
+import threading
+import time
+import uuid
+from collections import deque
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+import requests
+
+from http_client import HttpClient, http_client
+from offline_cache import MAX_SYNC_RETRIES, OfflineCache, offline_cache
+
+# Queue operations may be stored as HTTP methods or as CRUD verbs
+OPERATION_METHODS = {'create': 'POST', 'update': 'PUT', 'delete': 'DELETE'}
+
+# Entries for these endpoints are replayed together through the matching batch endpoint
+BATCH_ENDPOINTS = {'/api/predict': '/api/predict/batch'}
+
+# Window over which the drain rate is reported
+RATE_WINDOW_SECONDS = 300
+
+
+class SyncWorker:
+    """Drains the offline sync queue: leases batches, replays them and schedules retries"""
+
+    def __init__(self, cache: OfflineCache, base_url: str, batch_size: int = 50, interval: float = 10,
+                 lease_seconds: float = 120, max_retries: int = MAX_SYNC_RETRIES,
+                 base_delay: float = 30, max_delay: float = 3600, timeout: float = 10,
+                 http: Optional[HttpClient] = None):
+        self.cache = cache
+        self.base_url = base_url.rstrip('/')
+        self.batch_size = batch_size
+        self.interval = interval
+        self.lease_seconds = lease_seconds
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        # Read timeout; the connect timeout comes from the shared HTTP client
+        self.timeout = timeout
+        # Lease owner; unique per worker so leases from other processes are respected
+        self.owner = f'{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}'
+        self.http = http or http_client
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._completions = deque()
+        self.totals = {'succeeded': 0, 'retried': 0, 'dead_lettered': 0}
+        self.last_batch: Optional[Dict[str, Any]] = None
+
+    def start(self) -> bool:
+        if self._thread is not None and self._thread.is_alive():
+            return False
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name='offline-sync-worker', daemon=True)
+        self._thread.start()
+        return True
+
+    def stop(self, timeout: float = 5.0):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                leased = self.drain_once()['leased']
+            except Exception as e:
+                print(f"Sync worker error: {e}")
+                leased = 0
+            # Keep draining while batches come back full
+            if leased < self.batch_size:
+                self._stop.wait(self.interval)
+
+    def drain_once(self) -> Dict[str, Any]:
+        """Lease one batch, replay it and record the outcome of every entry"""
+        started = time.perf_counter()
+        entries = self.cache.lease_sync_batch(self.owner, limit=self.batch_size, lease_seconds=self.lease_seconds)
+
+        outcomes: Dict[int, Tuple[bool, Optional[str], bool]] = {}
+        groups: Dict[Tuple[str, str], List[Dict]] = {}
+        for entry in entries:
+            method = OPERATION_METHODS.get(entry['operation'].lower(), entry['operation'].upper())
+            groups.setdefault((method, entry['endpoint']), []).append(entry)
+
+        for (method, endpoint), group in groups.items():
+            if method == 'POST' and endpoint in BATCH_ENDPOINTS:
+                outcomes.update(self._replay_batch(BATCH_ENDPOINTS[endpoint], group))
+            else:
+                for entry in group:
+                    outcomes[entry['id']] = self._replay_one(method, endpoint, entry)
+
+        succeeded = [queue_id for queue_id, (ok, _, _) in outcomes.items() if ok]
+        self.cache.complete_sync(succeeded, owner=self.owner)
+        retried = dead_lettered = 0
+        for queue_id, (ok, error, permanent) in outcomes.items():
+            if ok:
+                continue
+            result = self.cache.fail_sync(
+                queue_id, error=error, permanent=permanent, max_retries=self.max_retries,
+                base_delay=self.base_delay, max_delay=self.max_delay, owner=self.owner
+            )
+            if result == 'dead_letter':
+                dead_lettered += 1
+            elif result == 'retry':
+                retried += 1
+
+        now = time.monotonic()
+        self._completions.append((now, len(succeeded)))
+        while self._completions and now - self._completions[0][0] > RATE_WINDOW_SECONDS:
+            self._completions.popleft()
+        self.totals['succeeded'] += len(succeeded)
+        self.totals['retried'] += retried
+        self.totals['dead_lettered'] += dead_lettered
+        self.last_batch = {
+            'leased': len(entries),
+            'succeeded': len(succeeded),
+            'retried': retried,
+            'dead_lettered': dead_lettered,
+            'duration_seconds': round(time.perf_counter() - started, 3),
+            'finished_at': datetime.now().isoformat()
+        }
+        return self.last_batch
+
+    def _url(self, endpoint: str) -> str:
+        if endpoint.startswith(('http://', 'https://')):
+            return endpoint
+        return f"{self.base_url}/{endpoint.lstrip('/')}"
+
+    @staticmethod
+    def _classify(response: requests.Response) -> Tuple[bool, Optional[str], bool]:
+        """(succeeded, error, permanent); 4xx other than 429 will not succeed on retry"""
+        if response.status_code < 400:
+            return True, None, False
+        permanent = response.status_code < 500 and response.status_code != 429
+        return False, f'HTTP {response.status_code}: {response.text[:200]}', permanent
+
+    def _replay_one(self, method: str, endpoint: str, entry: Dict) -> Tuple[bool, Optional[str], bool]:
+        try:
+            response = self.http.request(method, self._url(endpoint), json=entry['data'], timeout=self.timeout)
+            return self._classify(response)
+        except requests.RequestException as e:
+            return False, str(e), False
+
+    def _replay_batch(self, batch_endpoint: str, entries: List[Dict]) -> Dict[int, Tuple[bool, Optional[str], bool]]:
+        """POST all entries in one request; per-row errors from the batch endpoint are permanent.
+
+        A body that is not JSON or lacks a result per entry retries the whole batch.
+        Valid rows only complete once the response says they were persisted;
+        otherwise they are retried and dead-lettered when retries run out.
+        """
+        try:
+            response = self.http.post(
+                self._url(batch_endpoint), json={'rows': [entry['data'] for entry in entries]}, timeout=self.timeout
+            )
+        except requests.RequestException as e:
+            return {entry['id']: (False, str(e), False) for entry in entries}
+
+        outcome = self._classify(response)
+        if not outcome[0]:
+            return {entry['id']: outcome for entry in entries}
+
+        try:
+            body = response.json()
+            results = body.get('results')
+        except (ValueError, AttributeError) as e:
+            return {entry['id']: (False, f'Invalid batch response: {e}', False) for entry in entries}
+        if not isinstance(results, list) or len(results) < len(entries):
+            error = f"Batch response has {len(results) if isinstance(results, list) else 'no'} results for {len(entries)} rows"
+            return {entry['id']: (False, error, False) for entry in entries}
+
+        outcomes = {}
+        for entry, result in zip(entries, results):
+            if not isinstance(result, dict):
+                outcomes[entry['id']] = (False, f'Invalid batch result: {result!r}'[:200], False)
+            elif result.get('error'):
+                outcomes[entry['id']] = (False, result['error'], True)
+            elif not body.get('persisted'):
+                outcomes[entry['id']] = (False, f"Not persisted: {body.get('persist_error') or 'no confirmation'}", False)
+            else:
+                outcomes[entry['id']] = (True, None, False)
+        return outcomes
+
+    def drain_rate(self) -> float:
+        """Entries completed per second over the last RATE_WINDOW_SECONDS"""
+        now = time.monotonic()
+        recent = [count for stamp, count in self._completions if now - stamp <= RATE_WINDOW_SECONDS]
+        if not recent:
+            return 0.0
+        window = min(RATE_WINDOW_SECONDS, max(now - self._completions[0][0], self.interval))
+        return round(sum(recent) / window, 3)
+
+    def info(self) -> Dict[str, Any]:
+        return {
+            'running': self._thread is not None and self._thread.is_alive(),
+            'owner': self.owner,
+            'target': self.base_url,
+            'batch_size': self.batch_size,
+            'drain_rate_per_sec': self.drain_rate(),
+            'totals': dict(self.totals),
+            'last_batch': self.last_batch,
+            'queue': self.cache.sync_queue_metrics()
+        }
+
+
+# Global offline sync queue worker
+sync_worker = SyncWorker(
+    offline_cache,
+    base_url=os.environ.get('SYNC_TARGET_URL', 'http://localhost:5000'),
+    batch_size=int(os.environ.get('SYNC_BATCH_SIZE', 50)),
+    interval=float(os.environ.get('SYNC_INTERVAL', 10))
+)
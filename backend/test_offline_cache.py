@@ -0,0 +1,32 @@
+import os
+
+from offline_cache import OfflineCache, WriteBehindBuffer
+
+PREDICTION = {'predicted_yield': 2.88, 'risk_level': 'Green', 'recommendations': []}
+
+
+def test_failed_flush_keeps_buffered_rows(tmp_path):
+    cache = OfflineCache(os.path.join(str(tmp_path), 'offline.db'))
+    buffer = WriteBehindBuffer(cache, max_items=100, max_delay=60)
+    for user_id in range(3):
+        buffer.store_prediction(user_id, PREDICTION)
+
+    store_many = cache.store_predictions_many
+    cache.store_predictions_many = lambda records: 0
+    assert buffer.flush() == 0
+    assert buffer.pending() == 3
+    assert buffer.failed_flushes == 1
+
+    def failing_insert(records):
+        raise RuntimeError('disk full')
+    cache.store_predictions_many = failing_insert
+    buffer.store_prediction(3, PREDICTION)
+    assert buffer.flush() == 0
+    assert buffer.pending() == 4
+
+    cache.store_predictions_many = store_many
+    assert buffer.flush() == 4
+    assert buffer.pending() == 0
+    assert [row['predicted_yield'] for row in cache.get_cached_predictions(0)] == [2.88]
+    assert cache.get_cache_stats()['total_predictions'] == 4
+    cache.pool.close_all()
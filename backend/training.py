@@ -0,0 +1,566 @@
+#!/usr/bin/env python3
+"""
+Model training job for the crop yield platform.
+
+Training runs outside the serving path: from this CLI, or in a background
+thread started by the admin endpoint. Every run writes a versioned temp file
+and atomically swaps it over the served model, so API workers keep serving
+the last good model (or simple_model.json) and pick up the new one through
+the model registry's file watch.
+
+    python training.py                           # seed dataset
+    python training.py --source history          # full retrain on FarmData
+    python training.py --source history --incremental
+    python training.py --source shards           # per-crop/per-region models
+"""
+
+import argparse
+import json
+import os
+import sqlite3
+import sys
+import threading
+import time
+from datetime import datetime
+from typing import Any, Dict, Iterator, Optional, Tuple
+
+import importlib.util
+
+try:
+    import numpy as np
+    NUMPY_AVAILABLE = True
+except ImportError:
+    NUMPY_AVAILABLE = False
+    np = None
+
+# pandas, joblib and scikit-learn take seconds to import and are only needed
+# while training, so they are checked for here and imported by the training
+# functions. Importing this module (and app.py) stays cheap.
+PANDAS_AVAILABLE = importlib.util.find_spec('pandas') is not None
+JOBLIB_AVAILABLE = importlib.util.find_spec('joblib') is not None
+SKLEARN_AVAILABLE = importlib.util.find_spec('sklearn') is not None
+
+from inference import FEATURE_FIELDS
+from model_registry import (
+    ANY_CLUSTER, FEATURE_NAMES, FOREST_PATH, MODEL_PATH, MODEL_SHARD_DIR, SIMPLE_MODEL_PATH,
+    shard_file_stem, shard_key
+)
+
+MODEL_META_PATH = 'model_meta.json'
+TRAINING_LOCK_PATH = 'training.lock'
+
+# SQLite file behind app.config['SQLALCHEMY_DATABASE_URI'] (Flask-SQLAlchemy puts it in instance/)
+FARM_DB_PATH = os.environ.get('FARM_DB_PATH', os.path.join('instance', 'crop_platform.db'))
+
+# Observed harvest yield in farm_data. History training refuses to run until that column exists,
+# rather than fitting the model to its own past predictions
+TARGET_COLUMN = os.environ.get('TRAINING_TARGET_COLUMN', 'observed_yield')
+
+# Columns written from the model's output; never usable as the training target
+MODEL_OUTPUT_COLUMNS = ('predicted_yield', 'risk_level', 'recommendations')
+
+# Below this many FarmData rows a history retrain is not meaningful
+MIN_HISTORY_ROWS = 50
+
+# The lock holder touches the lock file this often while training runs
+LOCK_HEARTBEAT_SECONDS = 30
+
+# A lock not touched for this long belongs to a crashed trainer and may be taken over
+STALE_LOCK_SECONDS = 300
+
+
+class TrainingInProgress(Exception):
+    """Raised when another process or thread already holds the training lock"""
+
+
+def _atomic_write(path: str, write, version: str):
+    """Write through a versioned temp file and rename it over the target"""
+    tmp_path = f'{path}.{version}.tmp'
+    try:
+        write(tmp_path)
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+def _write_json(data: Dict, version: str, path: str):
+    def write(tmp_path):
+        with open(tmp_path, 'w') as f:
+            json.dump(data, f, indent=4)
+    _atomic_write(path, write, version)
+
+
+def _pid_alive(pid: int) -> bool:
+    """Whether a local process exists; assumed alive where signal 0 cannot be sent (Windows)"""
+    if os.name != 'posix':
+        return True
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except OSError:
+        return True
+    return True
+
+
+class _TrainingLock:
+    """Cross-process lock file so only one trainer writes the model at a time.
+
+    The holder's PID is written to the file and a heartbeat thread touches it
+    every LOCK_HEARTBEAT_SECONDS, so a long but healthy run keeps its lock. It
+    is taken over only once the owning process is gone or the heartbeat has
+    stopped for STALE_LOCK_SECONDS.
+    """
+
+    def __init__(self, path: str = TRAINING_LOCK_PATH):
+        self.path = path
+        self._stop = threading.Event()
+        self._heartbeat: Optional[threading.Thread] = None
+
+    def _is_stale(self) -> bool:
+        try:
+            if time.time() - os.path.getmtime(self.path) > STALE_LOCK_SECONDS:
+                return True
+            with open(self.path) as f:
+                pid = int(f.read().strip())
+        except (OSError, ValueError):
+            return False
+        return not _pid_alive(pid)
+
+    def _beat(self):
+        while not self._stop.wait(LOCK_HEARTBEAT_SECONDS):
+            try:
+                os.utime(self.path)
+            except OSError:
+                pass
+
+    def __enter__(self):
+        if self._is_stale():
+            try:
+                os.remove(self.path)
+            except OSError:
+                pass
+        try:
+            fd = os.open(self.path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+        except FileExistsError:
+            raise TrainingInProgress(f'Training already running (lock file {self.path})')
+        with os.fdopen(fd, 'w') as f:
+            f.write(str(os.getpid()))
+        self._stop.clear()
+        self._heartbeat = threading.Thread(target=self._beat, name='training-lock-heartbeat', daemon=True)
+        self._heartbeat.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        if self._heartbeat is not None:
+            self._heartbeat.join()
+        try:
+            os.remove(self.path)
+        except OSError:
+            pass
+
+
+def check_target_column(conn: sqlite3.Connection):
+    """Refuse a target that is the model's own output or not a farm_data column.
+
+    TARGET_COLUMN is interpolated into SQL, so only an existing column name gets through.
+    """
+    if TARGET_COLUMN in MODEL_OUTPUT_COLUMNS:
+        raise RuntimeError(f'Refusing to train on {TARGET_COLUMN}: it holds the model\'s own predictions')
+    columns = {row[1] for row in conn.execute('PRAGMA table_info(farm_data)')}
+    if TARGET_COLUMN not in columns:
+        raise RuntimeError(f'farm_data has no observed yield column {TARGET_COLUMN!r}; '
+                           f'set TRAINING_TARGET_COLUMN once harvests are recorded')
+
+
+# Train Random Forest Model
+def train_model():
+    print("Training model...")
+
+    if not (SKLEARN_AVAILABLE and PANDAS_AVAILABLE and NUMPY_AVAILABLE and JOBLIB_AVAILABLE):
+        print("ML stack not fully available, using simple linear model")
+        return create_simple_model()
+
+    import pandas as pd
+    from sklearn.ensemble import RandomForestRegressor
+    from sklearn.model_selection import train_test_split
+
+    with _TrainingLock():
+        version = datetime.now().strftime('%Y%m%dT%H%M%S')
+
+        # Enhanced dataset with more features
+        data = {
+            'rainfall': [200, 250, 180, 300, 150, 400, 220, 270, 190, 280, 160, 350],
+            'temperature': [28, 30, 32, 29, 35, 26, 31, 33, 27, 29, 34, 28],
+            'soil_ph': [6.5, 7.0, 6.8, 7.2, 6.0, 7.5, 6.7, 7.1, 6.3, 6.9, 6.1, 7.3],
+            'nitrogen': [80, 90, 70, 100, 60, 110, 85, 95, 75, 88, 65, 105],
+            'phosphorus': [40, 45, 35, 50, 30, 55, 42, 48, 38, 44, 32, 52],
+            'potassium': [60, 70, 55, 80, 50, 85, 65, 75, 58, 68, 52, 82],
+            'sowing_offset': [0, 5, -3, 2, 10, -5, 3, 1, -2, 4, 8, -1],
+            'yield': [2.5, 3.0, 2.2, 3.5, 1.8, 4.0, 2.8, 3.2, 2.4, 3.1, 1.9, 3.7]
+        }
+
+        df = pd.DataFrame(data)
+        X = df[FEATURE_NAMES]
+        y = df['yield']
+
+        X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=0.2, random_state=42)
+
+        model = RandomForestRegressor(n_estimators=100, random_state=42)
+        model.fit(X_train, y_train)
+
+        model_meta = {
+            'version': version,
+            'source': 'seed',
+            'features': FEATURE_NAMES,
+            'model_type': 'RandomForestRegressor',
+            'trained_at': datetime.now().isoformat(),
+            'accuracy': model.score(X_test, y_test)
+        }
+
+        publish_model(model, model_meta, version)
+
+    print(f"Model {version} trained successfully! Accuracy: {model_meta['accuracy']:.3f}")
+    return model
+
+
+def iter_farm_data(db_path: str = FARM_DB_PATH, since_id: int = 0, until_id: Optional[int] = None,
+                   chunk_size: int = 50000, where: str = '', params: tuple = ()) -> Iterator[Tuple[Any, Any]]:
+    """Stream FarmData rows with since_id < id <= until_id as (X, y) NumPy chunks"""
+    columns = ', '.join(FEATURE_FIELDS)
+    not_null = ' AND '.join(f'{column} IS NOT NULL' for column in FEATURE_FIELDS + [TARGET_COLUMN])
+    conn = sqlite3.connect(f'file:{db_path}?mode=ro', uri=True)
+    try:
+        check_target_column(conn)
+        cursor = conn.cursor()
+        cursor.execute(f'''
+            SELECT {columns}, {TARGET_COLUMN} FROM farm_data
+            WHERE id > ? AND id <= ? AND {not_null} {where}
+            ORDER BY id
+        ''', (since_id, until_id if until_id is not None else sys.maxsize) + tuple(params))
+        while True:
+            rows = cursor.fetchmany(chunk_size)
+            if not rows:
+                break
+            block = np.asarray(rows, dtype=np.float64)
+            yield block[:, :-1].astype(np.float32), block[:, -1]
+    finally:
+        conn.close()
+
+
+def load_farm_history(db_path: str = FARM_DB_PATH, since_id: int = 0, chunk_size: int = 50000,
+                      where: str = '', params: tuple = ()) -> Tuple[Any, Any, int]:
+    """Assemble the training matrix chunk by chunk into preallocated arrays"""
+    conn = sqlite3.connect(f'file:{db_path}?mode=ro', uri=True)
+    try:
+        check_target_column(conn)
+        # Snapshot the id range so rows inserted meanwhile wait for the next incremental run
+        upper_bound, last_id = conn.execute(
+            f'SELECT COUNT(*), MAX(id) FROM farm_data WHERE id > ? {where}', (since_id,) + tuple(params)
+        ).fetchone()
+    finally:
+        conn.close()
+
+    X = np.empty((upper_bound, len(FEATURE_FIELDS)), dtype=np.float32)
+    y = np.empty(upper_bound, dtype=np.float64)
+    filled = 0
+    for X_chunk, y_chunk in iter_farm_data(db_path, since_id, last_id, chunk_size, where, params):
+        X[filled:filled + len(X_chunk)] = X_chunk
+        y[filled:filled + len(y_chunk)] = y_chunk
+        filled += len(y_chunk)
+    return X[:filled], y[:filled], int(last_id if last_id is not None else since_id)
+
+
+def _holdout_metrics(model, X_test, y_test) -> Dict[str, Any]:
+    if not len(y_test):
+        return {'holdout_rows': 0}
+    predicted = model.predict(X_test)
+    residual = y_test - predicted
+    variance = float(np.sum((y_test - y_test.mean()) ** 2))
+    return {
+        'holdout_rows': int(len(y_test)),
+        'r2': 1.0 - float(np.sum(residual ** 2)) / variance if variance else None,
+        'mae': float(np.mean(np.abs(residual))),
+        'rmse': float(np.sqrt(np.mean(residual ** 2)))
+    }
+
+
+def _read_model_meta() -> Dict[str, Any]:
+    try:
+        with open(MODEL_META_PATH) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def train_from_history(db_path: str = FARM_DB_PATH, incremental: bool = False, chunk_size: int = 50000,
+                       n_estimators: int = 100, new_trees: int = 20, max_trees: int = 500,
+                       test_size: float = 0.2):
+    """Train on FarmData, either from scratch or by warm-starting new trees on rows since the last version"""
+    print("Training model from FarmData history...")
+
+    if not (SKLEARN_AVAILABLE and NUMPY_AVAILABLE and JOBLIB_AVAILABLE):
+        raise RuntimeError('History training requires numpy, scikit-learn and joblib')
+
+    import joblib
+    from sklearn.ensemble import RandomForestRegressor
+    from sklearn.model_selection import train_test_split
+
+    with _TrainingLock():
+        version = datetime.now().strftime('%Y%m%dT%H%M%S')
+        started = time.perf_counter()
+        previous_meta = _read_model_meta()
+
+        base_model = None
+        since_id = 0
+        if incremental and previous_meta.get('source') == 'history' and os.path.exists(MODEL_PATH):
+            base_model = joblib.load(MODEL_PATH)
+            since_id = int(previous_meta.get('last_farm_data_id', 0))
+
+        X, y, last_id = load_farm_history(db_path, since_id, chunk_size)
+        if len(y) < (1 if base_model is not None else MIN_HISTORY_ROWS):
+            print(f"Only {len(y)} new FarmData rows since id {since_id}, keeping current model")
+            return None
+
+        if len(y) >= 10:
+            X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=test_size, random_state=42)
+        else:
+            X_train, X_test, y_train, y_test = X, X[:0], y, y[:0]
+
+        if base_model is not None and base_model.n_estimators + new_trees <= max_trees:
+            # Keep the fitted trees and grow new ones on the new rows only
+            model = base_model
+            model.set_params(warm_start=True, n_estimators=model.n_estimators + new_trees)
+            mode = 'warm_start'
+            total_rows = int(previous_meta.get('total_rows', 0)) + len(y)
+        else:
+            if base_model is not None:
+                # Tree budget exhausted: rebuild from the whole table
+                X, y, last_id = load_farm_history(db_path, 0, chunk_size)
+                X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=test_size, random_state=42)
+            model = RandomForestRegressor(n_estimators=n_estimators, random_state=42, n_jobs=-1)
+            mode = 'full'
+            total_rows = len(y)
+
+        model.fit(X_train, y_train)
+        model.set_params(warm_start=False)
+        metrics = _holdout_metrics(model, X_test, y_test)
+
+        model_meta = {
+            'version': version,
+            'source': 'history',
+            'mode': mode,
+            'features': FEATURE_NAMES,
+            'model_type': 'RandomForestRegressor',
+            'target': TARGET_COLUMN,
+            'n_estimators': model.n_estimators,
+            'trained_at': datetime.now().isoformat(),
+            'training_seconds': round(time.perf_counter() - started, 3),
+            'rows': int(len(y)),
+            'total_rows': total_rows,
+            'last_farm_data_id': last_id,
+            'metrics': metrics,
+            'accuracy': metrics.get('r2')
+        }
+
+        publish_model(model, model_meta, version)
+
+    print(f"Model {version} trained ({mode}) on {len(y)} rows in {model_meta['training_seconds']}s, "
+          f"holdout metrics: {metrics}")
+    return model
+
+
+def publish_model(model, model_meta: Dict, version: str, model_path: str = MODEL_PATH,
+                  forest_path: str = FOREST_PATH, meta_path: str = MODEL_META_PATH):
+    """Atomically swap a trained forest (and its compiled copy) in for serving"""
+    import joblib
+    _atomic_write(model_path, lambda tmp_path: joblib.dump(model, tmp_path), version)
+
+    # Flat array copy of the forest so workers can serve without sklearn
+    from forest_compiler import compile_forest
+    compiled = compile_forest(model)
+    _atomic_write(forest_path, lambda tmp_path: compiled.save(tmp_path), version)
+
+    _write_json(model_meta, version, meta_path)
+
+
+def train_shards(db_path: str = FARM_DB_PATH, shard_dir: str = MODEL_SHARD_DIR, min_rows: int = 200,
+                 chunk_size: int = 50000, n_estimators: int = 50, test_size: float = 0.2) -> Dict[str, Any]:
+    """Train one model per (crop_type, region cluster) plus a per-crop model over all regions"""
+    print("Training per-crop/per-region model shards...")
+
+    if not (SKLEARN_AVAILABLE and NUMPY_AVAILABLE and JOBLIB_AVAILABLE):
+        raise RuntimeError('Shard training requires numpy, scikit-learn and joblib')
+
+    from sklearn.ensemble import RandomForestRegressor
+    from sklearn.model_selection import train_test_split
+
+    conn = sqlite3.connect(f'file:{db_path}?mode=ro', uri=True)
+    try:
+        check_target_column(conn)
+        pairs = conn.execute('SELECT crop_type, region, COUNT(*) FROM farm_data GROUP BY crop_type, region').fetchall()
+    finally:
+        conn.close()
+
+    # shard key -> {crop_type values: set, region values: set, rows: int}
+    shards: Dict[tuple, Dict[str, Any]] = {}
+    for crop_type, region, count in pairs:
+        crop, cluster = shard_key(crop_type, region)
+        if not crop:
+            continue
+        for key in {(crop, cluster), (crop, ANY_CLUSTER)}:
+            shard = shards.setdefault(key, {'crops': set(), 'regions': set(), 'rows': 0})
+            shard['crops'].add(crop_type)
+            shard['regions'].add(region)
+            shard['rows'] += count
+
+    os.makedirs(shard_dir, exist_ok=True)
+    trained = {}
+    with _TrainingLock():
+        version = datetime.now().strftime('%Y%m%dT%H%M%S')
+        for key, shard in sorted(shards.items()):
+            if shard['rows'] < min_rows:
+                continue
+            crops, regions = sorted(shard['crops']), sorted(shard['regions'])
+            where = (f"AND crop_type IN ({', '.join('?' * len(crops))}) "
+                     f"AND region IN ({', '.join('?' * len(regions))})")
+            started = time.perf_counter()
+            X, y, last_id = load_farm_history(db_path, 0, chunk_size, where, tuple(crops) + tuple(regions))
+            if len(y) < min_rows:
+                continue
+
+            X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=test_size, random_state=42)
+            model = RandomForestRegressor(n_estimators=n_estimators, random_state=42, n_jobs=-1)
+            model.fit(X_train, y_train)
+            metrics = _holdout_metrics(model, X_test, y_test)
+
+            stem = os.path.join(shard_dir, shard_file_stem(key))
+            publish_model(model, {
+                'version': version,
+                'source': 'history',
+                'shard': shard_file_stem(key),
+                'features': FEATURE_NAMES,
+                'model_type': 'RandomForestRegressor',
+                'target': TARGET_COLUMN,
+                'n_estimators': n_estimators,
+                'trained_at': datetime.now().isoformat(),
+                'training_seconds': round(time.perf_counter() - started, 3),
+                'rows': int(len(y)),
+                'last_farm_data_id': last_id,
+                'metrics': metrics
+            }, version, model_path=f'{stem}.pkl', forest_path=f'{stem}.npz', meta_path=f'{stem}.json')
+            trained[shard_file_stem(key)] = metrics
+            print(f"  shard {shard_file_stem(key)}: {len(y)} rows, holdout metrics {metrics}")
+
+    print(f"Trained {len(trained)} shard models into {shard_dir}")
+    return trained
+
+
+def create_simple_model():
+    """Create a simple prediction model when sklearn is not available"""
+    print("Creating simple prediction model...")
+
+    # Simple coefficients for linear prediction
+    model_data = {
+        'type': 'simple_linear',
+        'coefficients': {
+            'rainfall': 0.01,
+            'temperature': 0.05,
+            'soil_ph': 0.3,
+            'nitrogen': 0.02,
+            'phosphorus': 0.03,
+            'potassium': 0.015,
+            'sowing_offset': -0.05
+        },
+        'intercept': 1.0
+    }
+
+    _write_json(model_data, datetime.now().strftime('%Y%m%dT%H%M%S'), SIMPLE_MODEL_PATH)
+
+    print("Simple model created successfully!")
+    return model_data
+
+
+class TrainingJob:
+    """Runs training in a background thread and remembers the outcome of the last run"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self.status: Dict[str, Any] = {'state': 'idle'}
+
+    def start(self, **kwargs) -> bool:
+        """Start a training run unless one is already active in this process"""
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return False
+            self.status = {'state': 'running', 'started_at': datetime.now().isoformat()}
+            self._thread = threading.Thread(target=self._run, kwargs=kwargs, name='model-training', daemon=True)
+            self._thread.start()
+            return True
+
+    def _run(self, source: str = 'seed', **kwargs):
+        started = time.perf_counter()
+        try:
+            if source == 'history':
+                train_from_history(**kwargs)
+            elif source == 'shards':
+                train_shards(**kwargs)
+            else:
+                train_model()
+            state = {'state': 'succeeded'}
+        except TrainingInProgress as e:
+            state = {'state': 'skipped', 'error': str(e)}
+        except Exception as e:
+            state = {'state': 'failed', 'error': str(e)}
+        state.update({
+            'started_at': self.status.get('started_at'),
+            'finished_at': datetime.now().isoformat(),
+            'duration_seconds': round(time.perf_counter() - started, 3)
+        })
+        self.status = state
+
+    def info(self) -> Dict[str, Any]:
+        info = dict(self.status)
+        try:
+            with open(MODEL_META_PATH) as f:
+                info['model_meta'] = json.load(f)
+        except (OSError, ValueError):
+            info['model_meta'] = None
+        return info
+
+
+# Global background training job
+training_job = TrainingJob()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Train the crop yield model')
+    parser.add_argument('--source', choices=['seed', 'history', 'shards'], default='seed',
+                        help='Built-in seed dataset, the FarmData table, or per-crop/region shards from it')
+    parser.add_argument('--db', default=FARM_DB_PATH, help='SQLite database holding farm_data')
+    parser.add_argument('--incremental', action='store_true',
+                        help='Warm-start new trees on rows added since the last history model')
+    parser.add_argument('--chunk-size', type=int, default=50000, help='Rows fetched per chunk')
+    parser.add_argument('--new-trees', type=int, default=20, help='Trees added per incremental run')
+    parser.add_argument('--min-shard-rows', type=int, default=200, help='Smallest shard worth its own model')
+    args = parser.parse_args(argv)
+
+    try:
+        if args.source == 'shards':
+            train_shards(args.db, min_rows=args.min_shard_rows, chunk_size=args.chunk_size)
+        elif args.source == 'history':
+            train_from_history(args.db, incremental=args.incremental, chunk_size=args.chunk_size,
+                               new_trees=args.new_trees)
+        else:
+            train_model()
+    except TrainingInProgress as e:
+        print(e)
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
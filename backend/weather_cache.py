@@ -0,0 +1,472 @@
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Callable, Dict, Optional, Tuple
+
+from offline_cache import normalize_region, offline_cache
+
+# Try to import optional dependencies
+try:
+    import redis
+    REDIS_AVAILABLE = True
+except ImportError:
+    REDIS_AVAILABLE = False
+
+
+class OfflineWeatherStore:
+    """Shared tier in the offline cache's offline_weather table, seen by every worker using the same file"""
+
+    name = 'sqlite'
+
+    def __init__(self, cache):
+        self.cache = cache
+
+    def get(self, key: str) -> Optional[Tuple[Any, float]]:
+        return self.cache.get_weather_entry(key)
+
+    def put(self, key: str, value: Any, ttl: float, generation: Optional[int]) -> bool:
+        return self.cache.store_weather_entry(key, value, ttl, generation)
+
+    def generation(self) -> Optional[int]:
+        return self.cache.weather_generation()
+
+    def invalidate(self) -> Optional[int]:
+        return self.cache.invalidate_weather()
+
+    def get_setting(self, name: str) -> Optional[str]:
+        return self.cache.get_setting(name)
+
+    def set_setting(self, name: str, value: Optional[str]) -> bool:
+        return self.cache.set_setting(name, value)
+
+
+class RedisWeatherStore:
+    """Shared tier in Redis; keys include the generation, so invalidate() orphans them until they expire"""
+
+    name = 'redis'
+
+    def __init__(self, url: str, prefix: str = 'crop:weather'):
+        self.client = redis.Redis.from_url(url)
+        self.prefix = prefix
+
+    def _key(self, generation: int, key: str) -> str:
+        return f'{self.prefix}:{generation}:{key}'
+
+    def get(self, key: str) -> Optional[Tuple[Any, float]]:
+        try:
+            generation = self.generation()
+            if generation is None:
+                return None
+            pipe = self.client.pipeline()
+            pipe.get(self._key(generation, key))
+            pipe.pttl(self._key(generation, key))
+            raw, pttl = pipe.execute()
+            if raw is None or pttl <= 0:
+                return None
+            return json.loads(raw), pttl / 1000
+        except Exception as e:
+            print(f"Error reading weather from Redis: {e}")
+            return None
+
+    def put(self, key: str, value: Any, ttl: float, generation: Optional[int]) -> bool:
+        try:
+            if generation is None:
+                generation = self.generation()
+            self.client.set(self._key(generation, key), json.dumps(value), px=max(1, int(ttl * 1000)))
+            return True
+        except Exception as e:
+            print(f"Error storing weather in Redis: {e}")
+            return False
+
+    def generation(self) -> Optional[int]:
+        try:
+            return int(self.client.get(f'{self.prefix}:generation') or 0)
+        except Exception as e:
+            print(f"Error reading weather generation from Redis: {e}")
+            return None
+
+    def invalidate(self) -> Optional[int]:
+        try:
+            return int(self.client.incr(f'{self.prefix}:generation'))
+        except Exception as e:
+            print(f"Error invalidating weather in Redis: {e}")
+            return None
+
+    def get_setting(self, name: str) -> Optional[str]:
+        try:
+            raw = self.client.get(f'{self.prefix}:setting:{name}')
+            return raw.decode('utf-8') if raw is not None else None
+        except Exception as e:
+            print(f"Error reading setting {name} from Redis: {e}")
+            return None
+
+    def set_setting(self, name: str, value: Optional[str]) -> bool:
+        try:
+            if value is None:
+                self.client.delete(f'{self.prefix}:setting:{name}')
+            else:
+                self.client.set(f'{self.prefix}:setting:{name}', value)
+            return True
+        except Exception as e:
+            print(f"Error storing setting {name} in Redis: {e}")
+            return False
+
+
+class WeatherCache:
+    """Bounded LRU of weather per region with per-entry TTL, single-flight fetches and stale-while-revalidate.
+
+    API data is kept for ttl seconds and fallback estimates for fallback_ttl.
+    For stale_ttl seconds after an entry expires it is still returned while
+    one background refresh replaces it. Concurrent misses for a region wait
+    on a single fetch instead of each calling OpenWeather:
+
+        weather = weather_cache.get_or_fetch(region, lambda: fetch_weather_data(region))
+
+    With a shared store this in-process LRU is the first tier: a miss is
+    looked up in the store before fetching, fetched values are written to it
+    for the other workers, and clear() bumps the store's generation, which
+    every worker checks at most every generation_check_interval seconds.
+    """
+
+    def __init__(self, max_size: int = 1024, ttl: float = 3600, fallback_ttl: float = 300,
+                 stale_ttl: float = 600, refresh_workers: int = 4, wait_timeout: float = 30,
+                 shared=None, generation_check_interval: float = 2.0):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.fallback_ttl = fallback_ttl
+        self.stale_ttl = stale_ttl
+        self.refresh_workers = refresh_workers
+        self.wait_timeout = wait_timeout
+        self.shared = shared
+        self.generation_check_interval = generation_check_interval
+        # region key -> (value, expires_at on the monotonic clock)
+        self._entries: 'OrderedDict[str, Tuple[Any, float]]' = OrderedDict()
+        # region key -> (future of the fetch in progress, local and shared generation it started in)
+        self._flights: Dict[str, Tuple[Future, int, Optional[int]]] = {}
+        self._generation = 0
+        self._shared_generation: Optional[int] = None
+        self._next_generation_check = 0.0
+        self._refresher: Optional[ThreadPoolExecutor] = None
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+        self.shared_hits = 0
+        self.coalesced = 0
+        self.fetches = 0
+        self.fetch_errors = 0
+        self.refreshes = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+
+    def ttl_for(self, value: Any) -> float:
+        """API responses live for ttl, fallback estimates for fallback_ttl"""
+        if isinstance(value, dict) and value.get('source') == 'api':
+            return self.ttl
+        return self.fallback_ttl
+
+    def get(self, region: str) -> Optional[Any]:
+        """Return the unexpired value for a region, or None; never fetches"""
+        key = normalize_region(region)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or time.monotonic() >= entry[1]:
+                return None
+            return entry[0]
+
+    def expires_in(self, region: str) -> Optional[float]:
+        """Seconds until the entry for a region expires (negative once stale), or None if absent"""
+        key = normalize_region(region)
+        with self._lock:
+            entry = self._entries.get(key)
+            return entry[1] - time.monotonic() if entry is not None else None
+
+    def peek(self, region: str) -> Optional[Tuple[Any, float]]:
+        """(value, seconds until it expires) for a region, even if stale, or None; never fetches or counts"""
+        key = normalize_region(region)
+        with self._lock:
+            entry = self._entries.get(key)
+            return (entry[0], entry[1] - time.monotonic()) if entry is not None else None
+
+    def refresh(self, region: str, fetch: Callable[[], Any], min_ttl: float = 0) -> Any:
+        """Replace the entry for a region now, even if still fresh, joining any fetch already in flight.
+
+        A value in the shared store is taken instead of fetching only if it
+        has more than min_ttl seconds left.
+        """
+        self._sync_generation()
+        key = normalize_region(region)
+        with self._lock:
+            flight = self._flights.get(key)
+            if flight is None:
+                leader = self._start_flight(key)
+                self.refreshes += 1
+            else:
+                self.coalesced += 1
+                leader = None
+
+        if leader is not None:
+            return self._fetch(key, fetch, leader, min_ttl)
+        return flight[0].result(timeout=self.wait_timeout)
+
+    def get_or_fetch(self, region: str, fetch: Callable[[], Any]) -> Any:
+        """Return the cached value for a region, calling fetch() at most once per region at a time"""
+        self._sync_generation()
+        key = normalize_region(region)
+        with self._lock:
+            local = self._local(key)
+            if local is None:
+                self.misses += 1
+                flight = self._flights.get(key)
+                if flight is None:
+                    leader = self._start_flight(key)
+                else:
+                    self.coalesced += 1
+                    leader = None
+
+        if local is not None:
+            return self._serve(key, fetch, *local)
+        if leader is not None:
+            return self._fetch(key, fetch, leader)
+        return flight[0].result(timeout=self.wait_timeout)
+
+    def lookup(self, region: str, fetch: Callable[[], Any]) -> Optional[Any]:
+        """Like get_or_fetch, but returns None instead of fetching when neither tier has the region.
+
+        Hits, stale hits and misses are counted the same way, and a stale
+        entry is still refreshed with fetch() in the background. Callers that
+        batch their misses fetch each one through fetch_miss().
+        """
+        self._sync_generation()
+        key = normalize_region(region)
+        with self._lock:
+            local = self._local(key)
+            if local is None:
+                self.misses += 1
+                generation = self._generation
+
+        if local is not None:
+            return self._serve(key, fetch, *local)
+        shared = self.shared.get(key) if self.shared is not None else None
+        if shared is None:
+            return None
+        with self._lock:
+            self.shared_hits += 1
+            if generation == self._generation:
+                self._store(key, *shared)
+        return shared[0]
+
+    def fetch_miss(self, region: str, fetch: Callable[[], Any]) -> Any:
+        """Fetch a region lookup() missed, joining a fetch already in flight; stored in both tiers"""
+        key = normalize_region(region)
+        with self._lock:
+            flight = self._flights.get(key)
+            if flight is None:
+                leader = self._start_flight(key)
+            else:
+                self.coalesced += 1
+                leader = None
+
+        if leader is not None:
+            return self._fetch(key, fetch, leader, check_shared=False)
+        return flight[0].result(timeout=self.wait_timeout)
+
+    def put(self, region: str, value: Any, ttl: Optional[float] = None):
+        with self._lock:
+            self._store(normalize_region(region), value, ttl)
+
+    def invalidate(self, region: str) -> bool:
+        """Drop one region from this process only"""
+        with self._lock:
+            return self._entries.pop(normalize_region(region), None) is not None
+
+    def clear(self):
+        """Drop every entry here and, through the shared store, in every other worker.
+
+        Fetches already in flight finish for their waiters but are not cached.
+        """
+        with self._lock:
+            self._drop_all()
+        if self.shared is not None:
+            generation = self.shared.invalidate()
+            if generation is not None:
+                with self._lock:
+                    self._shared_generation = generation
+
+    def get_setting(self, name: str) -> Optional[str]:
+        """Setting shared by every worker through the shared store; None without one"""
+        return self.shared.get_setting(name) if self.shared is not None else None
+
+    def set_setting(self, name: str, value: Optional[str]) -> bool:
+        return self.shared.set_setting(name, value) if self.shared is not None else False
+
+    def _drop_all(self):
+        self._entries.clear()
+        self._flights.clear()
+        self._generation += 1
+        self.invalidations += 1
+
+    def _sync_generation(self):
+        # Another worker cleared the cache if the shared generation moved
+        if self.shared is None or time.monotonic() < self._next_generation_check:
+            return
+        self._next_generation_check = time.monotonic() + self.generation_check_interval
+        generation = self.shared.generation()
+        if generation is None:
+            return
+        with self._lock:
+            if self._shared_generation is not None and generation != self._shared_generation:
+                self._drop_all()
+            self._shared_generation = generation
+
+    def _local(self, key: str) -> Optional[Tuple[Any, Optional[Tuple[Future, int, Optional[int]]]]]:
+        # Caller holds the lock; (value, refresh flight to start) for a fresh or stale entry, else None
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        value, expires_at = entry
+        now = time.monotonic()
+        if now < expires_at:
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value, None
+        if now < expires_at + self.stale_ttl:
+            self._entries.move_to_end(key)
+            self.stale_hits += 1
+            refresh = None
+            if key not in self._flights:
+                refresh = self._start_flight(key)
+                self.refreshes += 1
+            return value, refresh
+        del self._entries[key]
+        self.expirations += 1
+        return None
+
+    def _serve(self, key: str, fetch: Callable[[], Any], value: Any,
+               refresh: Optional[Tuple[Future, int, Optional[int]]]) -> Any:
+        # Serve the cached value; at most one refresh per region runs in the background
+        if refresh is not None:
+            self._refresh_pool().submit(self._refresh, key, fetch, refresh)
+        return value
+
+    def _start_flight(self, key: str) -> Tuple[Future, int, Optional[int]]:
+        flight = (Future(), self._generation, self._shared_generation)
+        self._flights[key] = flight
+        return flight
+
+    def _end_flight(self, key: str, flight: Tuple[Future, int, Optional[int]]):
+        # clear() may have let a newer fetch for the key start meanwhile
+        if self._flights.get(key) is flight:
+            del self._flights[key]
+
+    def _store(self, key: str, value: Any, ttl: Optional[float] = None):
+        expires_at = time.monotonic() + (self.ttl_for(value) if ttl is None else ttl)
+        self._entries[key] = (value, expires_at)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def _fetch(self, key: str, fetch: Callable[[], Any], flight: Tuple[Future, int, Optional[int]],
+               min_ttl: float = 0, check_shared: bool = True) -> Any:
+        future, generation, shared_generation = flight
+        try:
+            # Another worker may already have fetched this region
+            shared = self.shared.get(key) if self.shared is not None and check_shared else None
+            if shared is not None and shared[1] <= min_ttl:
+                shared = None
+            if shared is not None:
+                value, ttl = shared
+            else:
+                value, ttl = fetch(), None
+        except Exception as e:
+            with self._lock:
+                self._end_flight(key, flight)
+                self.fetch_errors += 1
+            future.set_exception(e)
+            raise
+
+        with self._lock:
+            if shared is not None:
+                self.shared_hits += 1
+            else:
+                self.fetches += 1
+            current = generation == self._generation
+            if current:
+                self._store(key, value, ttl)
+            self._end_flight(key, flight)
+        future.set_result(value)
+
+        if shared is None and current and self.shared is not None:
+            # The store also refuses the write if its generation moved since the flight started
+            self.shared.put(key, value, self.ttl_for(value), shared_generation)
+        return value
+
+    def _refresh(self, key: str, fetch: Callable[[], Any], flight: Tuple[Future, int, Optional[int]]):
+        try:
+            self._fetch(key, fetch, flight)
+        except Exception as e:
+            # The stale entry stays; the next read past expiry tries again
+            print(f"Weather refresh error for {key}: {e}")
+
+    def _refresh_pool(self) -> ThreadPoolExecutor:
+        with self._lock:
+            if self._refresher is None:
+                self._refresher = ThreadPoolExecutor(max_workers=self.refresh_workers,
+                                                     thread_name_prefix='weather-refresh')
+            return self._refresher
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.stale_hits + self.misses
+            return {
+                'size': len(self._entries),
+                'max_size': self.max_size,
+                'ttl_seconds': self.ttl,
+                'fallback_ttl_seconds': self.fallback_ttl,
+                'stale_ttl_seconds': self.stale_ttl,
+                'hits': self.hits,
+                'stale_hits': self.stale_hits,
+                'misses': self.misses,
+                'hit_rate': round((self.hits + self.stale_hits) / lookups, 4) if lookups else 0.0,
+                'shared_store': self.shared.name if self.shared is not None else None,
+                'shared_hits': self.shared_hits,
+                'shared_generation': self._shared_generation,
+                'coalesced': self.coalesced,
+                'fetches': self.fetches,
+                'fetch_errors': self.fetch_errors,
+                'refreshes': self.refreshes,
+                'in_flight': len(self._flights),
+                'evictions': self.evictions,
+                'expirations': self.expirations,
+                'invalidations': self.invalidations
+            }
+
+
+def build_shared_store(backend: str, redis_url: Optional[str] = None):
+    """Shared weather tier: 'sqlite' (the offline cache file), 'redis' or 'none'"""
+    if backend == 'redis':
+        if REDIS_AVAILABLE and redis_url:
+            return RedisWeatherStore(redis_url)
+        print("Redis not available for the weather cache, sharing through the offline cache instead")
+        backend = 'sqlite'
+    if backend == 'sqlite':
+        return OfflineWeatherStore(offline_cache)
+    return None
+
+
+# Global weather cache instance
+weather_cache = WeatherCache(
+    max_size=int(os.environ.get('WEATHER_CACHE_SIZE', 1024)),
+    ttl=float(os.environ.get('WEATHER_CACHE_TTL', 3600)),
+    fallback_ttl=float(os.environ.get('WEATHER_FALLBACK_TTL', 300)),
+    stale_ttl=float(os.environ.get('WEATHER_STALE_TTL', 600)),
+    shared=build_shared_store(
+        os.environ.get('WEATHER_SHARED_CACHE', 'redis' if os.environ.get('REDIS_URL') else 'sqlite'),
+        os.environ.get('REDIS_URL')
+    )
+)
@@ -0,0 +1,148 @@
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Any, Callable, Dict, Iterable, List, Optional
+
+from lazy_singleton import LazySingleton
+from offline_cache import normalize_region
+from weather_cache import WeatherCache, weather_cache
+
+
+class WeatherPrefetcher:
+    """Refreshes weather for every active region before its cache entry expires.
+
+    Each pass asks regions() for the regions in use, and refreshes those
+    with no entry or less than lead_time seconds left, at most max_workers
+    at a time so OpenWeather sees a bounded burst. With interval below
+    lead_time, request-path lookups for these regions are cache hits.
+    Fallback estimates are retried only once they expire, so a region
+    OpenWeather cannot serve costs one call per fallback_ttl, not one per pass.
+    """
+
+    def __init__(self, cache: WeatherCache, fetch: Optional[Callable[[str], Any]] = None,
+                 regions: Optional[Callable[[], Iterable[str]]] = None, interval: float = 120,
+                 lead_time: float = 240, max_workers: int = 4):
+        if not 0 <= lead_time < min(cache.ttl, cache.fallback_ttl):
+            raise ValueError(f'Weather prefetch lead_time {lead_time}s must be below the cache ttl '
+                             f'({cache.ttl}s) and fallback_ttl ({cache.fallback_ttl}s)')
+        self.cache = cache
+        self.fetch = fetch
+        self.regions = regions
+        self.interval = interval
+        self.lead_time = lead_time
+        self.max_workers = max_workers
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self.last_report: Optional[Dict[str, Any]] = None
+        self.runs = 0
+        self.total_refreshed = 0
+        self.total_errors = 0
+
+    def start(self) -> bool:
+        """Start the background loop unless it is already running"""
+        if self._thread is not None and self._thread.is_alive():
+            return False
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name='weather-prefetch', daemon=True)
+        self._thread.start()
+        return True
+
+    def stop(self, timeout: float = 5.0):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def _run(self):
+        while not self._stop.is_set():
+            self.run_once()
+            self._stop.wait(self.interval)
+
+    def due_regions(self, regions: Iterable[str]) -> List[str]:
+        """One region name per cache key: missing, API data expiring within lead_time, or expired fallbacks"""
+        due = {}
+        for region in regions:
+            if not region or not str(region).strip():
+                continue
+            key = normalize_region(region)
+            if key in due:
+                continue
+            entry = self.cache.peek(region)
+            if entry is None:
+                due[key] = region
+                continue
+            value, expires_in = entry
+            lead_time = self.lead_time if self.cache.ttl_for(value) == self.cache.ttl else 0
+            if expires_in < lead_time:
+                due[key] = region
+        return list(due.values())
+
+    def _refresh(self, region: str) -> bool:
+        try:
+            self.cache.refresh(region, lambda: self.fetch(region), min_ttl=self.lead_time)
+            return True
+        except Exception as e:
+            print(f"Weather prefetch failed for {region}: {e}")
+            return False
+
+    def run_once(self) -> Dict[str, Any]:
+        """One pass over the active regions; returns what was refreshed"""
+        with self._lock:
+            started = time.perf_counter()
+            try:
+                if self.fetch is None or self.regions is None:
+                    raise RuntimeError('Weather prefetcher has no fetch or regions source configured')
+                regions = list(self.regions())
+                due = self.due_regions(regions)
+                with ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='weather-prefetch') as pool:
+                    results = list(pool.map(self._refresh, due))
+                report = {
+                    'state': 'succeeded',
+                    'regions': len({normalize_region(region) for region in regions if region}),
+                    'due': len(due),
+                    'refreshed': sum(results),
+                    'errors': len(results) - sum(results)
+                }
+            except Exception as e:
+                print(f"Weather prefetch pass failed: {e}")
+                report = {'state': 'failed', 'error': str(e), 'regions': 0, 'due': 0, 'refreshed': 0, 'errors': 0}
+
+            report.update({
+                'finished_at': datetime.now().isoformat(),
+                'duration_seconds': round(time.perf_counter() - started, 3)
+            })
+            self.runs += 1
+            self.total_refreshed += report['refreshed']
+            self.total_errors += report['errors']
+            self.last_report = report
+            return report
+
+    def info(self) -> Dict[str, Any]:
+        return {
+            'running': self._thread is not None and self._thread.is_alive(),
+            'interval_seconds': self.interval,
+            'lead_time_seconds': self.lead_time,
+            'max_workers': self.max_workers,
+            'runs': self.runs,
+            'total_refreshed': self.total_refreshed,
+            'total_errors': self.total_errors,
+            'last_run': self.last_report
+        }
+
+
+# Global weather prefetcher; app.py supplies the fetch function and the active regions
+weather_prefetcher = LazySingleton(
+    WeatherPrefetcher,
+    name='weather_prefetcher',
+    config_keys={
+        'WEATHER_PREFETCH_INTERVAL': 'interval',
+        'WEATHER_PREFETCH_LEAD_TIME': 'lead_time',
+        'WEATHER_PREFETCH_WORKERS': 'max_workers'
+    },
+    cache=weather_cache,
+    interval=float(os.environ.get('WEATHER_PREFETCH_INTERVAL', 120)),
+    lead_time=float(os.environ.get('WEATHER_PREFETCH_LEAD_TIME', 240)),
+    max_workers=int(os.environ.get('WEATHER_PREFETCH_WORKERS', 4))
+)